@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Synthetic stand-in for the restic executable used by the benchmark suite.
+
+It understands just enough of the restic command line to find the command and
+emits realistic ``--json`` output for it. Sizes and rates are configured with
+environment variables:
+
+    FAKE_RESTIC_LS_NODES          number of nodes printed by ``ls`` (default 10000)
+    FAKE_RESTIC_STATUS_LINES      number of ``status`` lines printed by ``backup`` and ``restore`` (default 1000)
+    FAKE_RESTIC_STATUS_RATE       ``status`` lines per second, 0 = as fast as possible (default 0)
+    FAKE_RESTIC_VERBOSE_FILES     files per backup path reported by ``backup --verbose=2`` (default 10)
+    FAKE_RESTIC_SNAPSHOTS         number of snapshots printed by ``snapshots`` (default 1000)
+    FAKE_RESTIC_FORGET_SNAPSHOTS  number of kept and removed snapshots printed by ``forget`` (default 1000)
+    FAKE_RESTIC_PRUNE_UNUSED      percentage of the 100 GiB repository ``prune`` finds unused (default 10)
+    FAKE_RESTIC_DIFF_ENTRIES      number of changes printed by ``diff``, taken from the ``ls`` tree (default 10000)
+    FAKE_RESTIC_DUMP_BYTES        size of a file written by ``dump``, instead of its size in the ``ls`` tree
+    FAKE_RESTIC_EXIT_CODE         exit code of every command (default 0)
+    FAKE_RESTIC_SLEEP             seconds every command runs before exiting, e.g. a long prune (default 0)
+    FAKE_RESTIC_IGNORE_SIGINT     if set, ignore SIGINT like a hanging restic; otherwise exit with 130
+"""
+
+import io
+import json
+import os
+import signal
+import sys
+import tarfile
+import time
+
+COMMANDS = {
+    "backup", "forget", "prune", "check", "ls", "snapshots", "restore",
+    "unlock", "diff", "dump", "stats", "cat", "init",
+}
+
+WRITE_CHUNK = 1000
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def _snapshot(i: int) -> dict:
+    snapshot_id = f"{i:064x}"
+    return {
+        "time": f"2024-01-01T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}.000000000+00:00",
+        "tree": f"{i + 1:064x}",
+        "paths": ["/home/user/documents"],
+        "hostname": "benchmark-host",
+        "username": "user",
+        "tags": ["created-by:ResticTray"],
+        "id": snapshot_id,
+        "short_id": snapshot_id[:8],
+    }
+
+
+def _write_lines(lines):
+    """Write JSON lines in chunks to keep the stand-in itself cheap"""
+    out = sys.stdout
+    buffer = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= WRITE_CHUNK:
+            out.write("\n".join(buffer) + "\n")
+            buffer.clear()
+    if buffer:
+        out.write("\n".join(buffer) + "\n")
+    out.flush()
+
+
+def _backup_paths() -> list:
+    """Absolute paths on the command line that are not option values"""
+    args = sys.argv[1:]
+    return [arg for i, arg in enumerate(args)
+            if arg.startswith("/") and (i == 0 or not args[i - 1].startswith("-") or "=" in args[i - 1])]
+
+
+def _verbose_lines():
+    """``verbose_status`` messages of restic's -vv output, one new file and unchanged ones per path"""
+    count = _env_int("FAKE_RESTIC_VERBOSE_FILES", 10)
+    for path in _backup_paths():
+        for i in range(count):
+            if i == 0:
+                yield json.dumps({"message_type": "verbose_status", "action": "new", "item": f"{path}/file{i}.dat",
+                                  "duration": 0.001, "data_size": 4096, "data_size_in_repo": 2048, "metadata_size": 0})
+            else:
+                yield json.dumps({"message_type": "verbose_status", "action": "unchanged", "item": f"{path}/file{i}.dat"})
+        yield json.dumps({"message_type": "verbose_status", "action": "modified", "item": f"{path}/",
+                          "duration": 0.001, "data_size": 0, "data_size_in_repo": 300, "metadata_size": 300})
+
+
+def cmd_backup_stdin():
+    """``backup --stdin``: read stdin to EOF and save it as one file"""
+    size = 0
+    while chunk := sys.stdin.buffer.read(1024 * 1024):
+        size += len(chunk)
+    sys.stdout.write(json.dumps({
+        "message_type": "summary",
+        "files_new": 1,
+        "files_changed": 0,
+        "files_unmodified": 0,
+        "data_added": size,
+        "total_files_processed": 1,
+        "total_bytes_processed": size,
+        "total_duration": 0.1,
+        "snapshot_id": f"{size:064x}",
+    }) + "\n")
+    sys.stdout.flush()
+
+
+def cmd_backup():
+    if "--stdin" in sys.argv:
+        cmd_backup_stdin()
+        return
+    if "--verbose=2" in sys.argv or "-vv" in sys.argv:
+        _write_lines(_verbose_lines())
+    count = _env_int("FAKE_RESTIC_STATUS_LINES", 1000)
+    rate = float(os.environ.get("FAKE_RESTIC_STATUS_RATE", 0))
+    total_files = 100000
+    total_bytes = 50 * 1024 ** 3
+    delay = 1.0 / rate if rate > 0 else 0.0
+    for i in range(count):
+        fraction = (i + 1) / count
+        line = json.dumps({
+            "message_type": "status",
+            "seconds_elapsed": int(i * delay),
+            "percent_done": fraction,
+            "total_files": total_files,
+            "files_done": int(total_files * fraction),
+            "total_bytes": total_bytes,
+            "bytes_done": int(total_bytes * fraction),
+            "current_files": [f"/home/user/documents/file{i}.txt"],
+        })
+        sys.stdout.write(line + "\n")
+        if delay:
+            sys.stdout.flush()
+            time.sleep(delay)
+    sys.stdout.write(json.dumps({
+        "message_type": "summary",
+        "files_new": 10,
+        "files_changed": 5,
+        "files_unmodified": total_files - 15,
+        "dirs_new": 0,
+        "dirs_changed": 2,
+        "dirs_unmodified": 500,
+        "data_blobs": 20,
+        "tree_blobs": 3,
+        "data_added": 12 * 1024 ** 2,
+        "total_files_processed": total_files,
+        "total_bytes_processed": total_bytes,
+        "total_duration": 1.5,
+        "snapshot_id": f"{count:064x}",
+    }) + "\n")
+    sys.stdout.flush()
+
+
+def cmd_forget():
+    count = _env_int("FAKE_RESTIC_FORGET_SNAPSHOTS", 1000)
+    group = {
+        "tags": ["created-by:ResticTray"],
+        "host": "benchmark-host",
+        "paths": ["/home/user/documents"],
+        "keep": [_snapshot(i) for i in range(count)],
+        "remove": [_snapshot(count + i) for i in range(count)],
+        "reasons": [{"snapshot": _snapshot(i), "matches": ["daily snapshot"]} for i in range(count)],
+    }
+    sys.stdout.write(json.dumps([group]) + "\n")
+    sys.stdout.flush()
+
+
+def _option(name: str) -> str|None:
+    """Value of ``--name=value`` or ``--name value``"""
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        if arg.startswith(name + "="):
+            return arg.split("=", 1)[1]
+        if arg == name and i + 1 < len(args):
+            return args[i + 1]
+    return None
+
+
+def cmd_prune():
+    """Text statistics like restic prune, honouring --max-repack-size (in bytes)"""
+    gib = 1024 ** 3
+    total = 100 * gib
+    unused = total * float(os.environ.get("FAKE_RESTIC_PRUNE_UNUSED", 10)) / 100
+    max_repack = _option("--max-repack-size")
+    # Half of the unused space is in packs without used blobs, the rest needs repacking
+    repack = min(unused, float(max_repack) if max_repack is not None else unused)
+    removed = unused / 2 + repack / 2
+    remaining = total - removed
+
+    def size(value):
+        return f"{value / gib:.3f} GiB"
+
+    print(f"\nto repack:    {int(repack / 4096):10d} blobs / {size(repack)}")
+    print(f"this removes: {int(repack / 8192):10d} blobs / {size(repack / 2)}")
+    print(f"to delete:    {int(unused / 8192):10d} blobs / {size(unused / 2)}")
+    print(f"total prune:  {int(removed / 4096):10d} blobs / {size(removed)}")
+    print(f"remaining:    {int(remaining / 4096):10d} blobs / {size(remaining)}")
+    print(f"unused size after prune: {size(unused - removed)} ({(unused - removed) * 100 / remaining:.2f}% of remaining size)")
+    if "--dry-run" not in sys.argv:
+        print("\nrepacking packs\nrebuilding index\ndeleting obsolete index files\nremoving packs\ndone")
+    sys.stdout.flush()
+
+
+def cmd_stats():
+    count = _env_int("FAKE_RESTIC_SNAPSHOTS", 1000)
+    if _option("--mode") == "raw-data":
+        stats = {"total_size": 60 * 1024 ** 3, "total_uncompressed_size": 90 * 1024 ** 3,
+                 "compression_ratio": 1.5, "total_blob_count": 2000000, "snapshots_count": count}
+    else:
+        stats = {"total_size": 40 * 1024 ** 4, "total_file_count": 500000 * count, "snapshots_count": count}
+    sys.stdout.write(json.dumps(stats) + "\n")
+    sys.stdout.flush()
+
+
+def cmd_snapshots():
+    count = _env_int("FAKE_RESTIC_SNAPSHOTS", 1000)
+    sys.stdout.write(json.dumps([_snapshot(i) for i in range(count)]) + "\n")
+    sys.stdout.flush()
+
+
+def _tree(count: int):
+    """Generate (path, type, index in its directory) of a directory tree with a realistic fan-out"""
+    files_per_dir = 50
+    dirs_per_dir = 10
+    emitted = 0
+    stack = ["/home/user/documents"]
+    while stack and emitted < count:
+        directory = stack.pop(0)
+        yield directory, "dir", 0
+        emitted += 1
+        for i in range(files_per_dir):
+            if emitted >= count:
+                return
+            yield f"{directory}/file{i}.dat", "file", i
+            emitted += 1
+        for i in range(dirs_per_dir):
+            stack.append(f"{directory}/dir{i}")
+
+
+def _ls_nodes(count: int):
+    for path, node_type, i in _tree(count):
+        if node_type == "dir":
+            yield json.dumps({
+                "name": path.rsplit("/", 1)[-1], "type": "dir", "path": path,
+                "uid": 1000, "gid": 1000, "mode": 2147484141,
+                "mtime": "2024-01-01T00:00:00+00:00", "struct_type": "node",
+            })
+        else:
+            yield json.dumps({
+                "name": f"file{i}.dat", "type": "file", "path": path,
+                "uid": 1000, "gid": 1000, "size": 4096 * (i + 1), "mode": 420,
+                "mtime": "2024-01-01T00:00:00+00:00", "struct_type": "node",
+            })
+
+
+def cmd_restore():
+    """``status`` lines like ``backup``, then a summary; 100 files of 1 MiB per ``--include``"""
+    includes = max(sys.argv.count("--include"), 1)
+    count = _env_int("FAKE_RESTIC_STATUS_LINES", 1000)
+    rate = float(os.environ.get("FAKE_RESTIC_STATUS_RATE", 0))
+    total_files = 100 * includes
+    total_bytes = total_files * 1024 ** 2
+    delay = 1.0 / rate if rate > 0 else 0.0
+    for i in range(count):
+        fraction = (i + 1) / count
+        sys.stdout.write(json.dumps({
+            "message_type": "status",
+            "seconds_elapsed": int(i * delay),
+            "percent_done": fraction,
+            "total_files": total_files,
+            "files_restored": int(total_files * fraction),
+            "total_bytes": total_bytes,
+            "bytes_restored": int(total_bytes * fraction),
+        }) + "\n")
+        if delay:
+            sys.stdout.flush()
+            time.sleep(delay)
+    sys.stdout.write(json.dumps({
+        "message_type": "summary",
+        "seconds_elapsed": int(count * delay),
+        "total_files": total_files,
+        "files_restored": total_files,
+        "total_bytes": total_bytes,
+        "bytes_restored": total_bytes,
+    }) + "\n")
+    sys.stdout.flush()
+
+
+def cmd_diff():
+    """Every node of the ``ls`` tree as a change: added, removed, modified or with new metadata"""
+    count = _env_int("FAKE_RESTIC_DIFF_ENTRIES", 10000)
+    modifiers = "+-MU"
+
+    def changes():
+        for i, (path, node_type, _) in enumerate(_tree(count)):
+            path += "/" if node_type == "dir" else ""
+            yield json.dumps({"message_type": "change", "path": path, "modifier": modifiers[i % len(modifiers)]})
+
+    _write_lines(changes())
+    added = {"files": count // 4, "dirs": 0, "others": 0, "data_blobs": count // 4, "tree_blobs": 0, "bytes": 4096 * count}
+    _write_lines([json.dumps({"message_type": "statistics", "changed_files": count // 4,
+                              "added": added, "removed": added})])
+
+
+def cmd_dump():
+    """Zeros of the node's size for a file of the ``ls`` tree, a tar archive of the files below a directory"""
+    path = sys.argv[-1]
+    out = sys.stdout.buffer
+    nodes = [(node_path, node_type, i) for node_path, node_type, i in _tree(_env_int("FAKE_RESTIC_LS_NODES", 10000))
+             if node_path == path or node_path.startswith(path.rstrip("/") + "/")]
+    if not nodes:
+        sys.stderr.write(f"path {path} not found in snapshot\n")
+        sys.exit(1)
+    if nodes[0][1] == "file":
+        size = _env_int("FAKE_RESTIC_DUMP_BYTES", 4096 * (nodes[0][2] + 1))
+        while size > 0:
+            chunk = min(size, 1024 * 1024)
+            out.write(bytes(chunk))
+            size -= chunk
+    else:
+        with tarfile.open(fileobj=out, mode="w|") as archive:
+            for node_path, node_type, i in nodes:
+                if node_type == "file":
+                    info = tarfile.TarInfo(node_path.lstrip("/"))
+                    info.size = 4096 * (i + 1)
+                    archive.addfile(info, io.BytesIO(bytes(info.size)))
+    out.flush()
+
+
+def cmd_ls():
+    count = _env_int("FAKE_RESTIC_LS_NODES", 10000)
+    header = json.dumps({**_snapshot(0), "struct_type": "snapshot"})
+    _write_lines([header])
+    _write_lines(_ls_nodes(count))
+
+
+def main():
+    if os.environ.get("FAKE_RESTIC_IGNORE_SIGINT"):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    else:
+        signal.signal(signal.SIGINT, lambda signum, frame: sys.exit(130))
+    command = next((arg for arg in sys.argv[1:] if arg in COMMANDS), None)
+    handlers = {
+        "backup": cmd_backup,
+        "forget": cmd_forget,
+        "prune": cmd_prune,
+        "stats": cmd_stats,
+        "diff": cmd_diff,
+        "restore": cmd_restore,
+        "dump": cmd_dump,
+        "snapshots": cmd_snapshots,
+        "ls": cmd_ls,
+    }
+    handler = handlers.get(command)
+    if handler:
+        handler()
+    time.sleep(float(os.environ.get("FAKE_RESTIC_SLEEP", 0)))
+    sys.exit(_env_int("FAKE_RESTIC_EXIT_CODE", 0))
+
+
+if __name__ == "__main__":
+    main()
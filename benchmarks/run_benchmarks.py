@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite measuring ResticTray's own overhead.
+
+A fake ``restic`` executable (fake_restic.py) is put first on PATH and the
+real code paths are driven against it on the offscreen Qt platform, so the
+suite runs headless and without network access.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--quick] [--ls-nodes N] ...
+    python benchmarks/run_benchmarks.py --json results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --tolerance 0.25
+
+With --baseline the script exits with status 1 if any benchmark got slower
+or used more memory than the baseline allows.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+
+
+def setup_environment(workdir: Path):
+    """Isolate HOME, select the offscreen platform and install the fake restic"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    home = workdir / "home"
+    home.mkdir()
+    os.environ["HOME"] = str(home)
+
+    bin_dir = workdir / "bin"
+    bin_dir.mkdir()
+    wrapper = bin_dir / "restic"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{BENCH_DIR / "fake_restic.py"}" "$@"\n')
+    wrapper.chmod(0o755)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+
+    sys.path.insert(0, str(REPO_ROOT))
+
+
+class Bench:
+    """Runs benchmarks and collects their results"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, trace_memory: bool):
+        self.loop = loop
+        self.trace_memory = trace_memory
+        self.results: dict[str, dict] = {}
+
+    def measure(self, name: str, items: int, func, env: dict|None = None):
+        """Measure a sync function or coroutine function processing ``items`` items"""
+        for key, value in (env or {}).items():
+            os.environ[key] = str(value)
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            self.loop.run_until_complete(result)
+        seconds = time.perf_counter() - start
+        peak = 0
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results[name] = {
+            "items": items,
+            "seconds": seconds,
+            "items_per_second": items / seconds if seconds > 0 else 0.0,
+            "peak_py_mb": peak / (1024 * 1024),
+            "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        print(f"{name:<28} {items:>10} items {seconds:>9.3f} s "
+              f"{self.results[name]['items_per_second']:>12.0f} items/s "
+              f"{self.results[name]['peak_py_mb']:>9.1f} MB peak", flush=True)
+
+
+def make_files(count: int) -> list:
+    """Build parsed ``ls`` output in memory, like _load_snapshot_files_async does"""
+    files = []
+    directory_count = max(1, count // 51)
+    for d in range(directory_count):
+        directory = f"/home/user/documents/dir{d}"
+        files.append({"name": f"dir{d}", "type": "dir", "path": directory, "struct_type": "node"})
+        for i in range(50):
+            if len(files) >= count:
+                return files
+            files.append({"name": f"file{i}.dat", "type": "file", "path": f"{directory}/file{i}.dat",
+                          "size": 4096 * (i + 1), "struct_type": "node"})
+    return files
+
+
+def make_snapshots(count: int) -> list:
+    return [{
+        "time": "2024-01-01T00:00:00.000000000+00:00",
+        "paths": ["/home/user/documents"],
+        "hostname": "benchmark-host",
+        "tags": ["created-by:ResticTray"],
+        "id": f"{i:064x}",
+        "short_id": f"{i:064x}"[:8],
+    } for i in range(count)]
+
+
+def run(args) -> dict:
+    from PySide6.QtGui import QIcon
+    from PySide6.QtWidgets import QApplication
+    from qasync import QEventLoop
+    from restictray import globals
+    from restictray import main as restictray_main
+    from restictray.restic import BackupExecutor
+    from restictray.storage import Storage, Repository, Job, History
+
+    app = QApplication([])
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+
+    storage = Storage()
+    repository = Repository(name="bench", url="/tmp/bench-repo", password="secret")
+    storage.add_repository(repository)
+
+    window = restictray_main.MainWindow()
+    globals.main_window = window
+    globals.tray_icon = restictray_main.TrayIcon(QIcon(), QIcon(), window)
+    # The window is never shown, build all tabs up front
+    window.ensure_ui()
+    for index in range(window.tabs.count()):
+        window.ensure_tab(index)
+
+    bench = Bench(loop, trace_memory=not args.no_tracemalloc)
+
+    backup_job = Job(name="bench-backup", target_repo="bench", type="backup",
+                     schedule="interval:1h", additional_args="", directory="/home/user/documents")
+    bench.measure("backup_status_stream", args.status_lines,
+                  lambda: BackupExecutor(repository, backup_job)._run(),
+                  env={"FAKE_RESTIC_STATUS_LINES": args.status_lines,
+                       "FAKE_RESTIC_STATUS_RATE": args.status_rate})
+
+    forget_job = Job(name="bench-forget", target_repo="bench", type="forget",
+                     schedule="interval:1h", additional_args="--keep-daily 7", directory="")
+    bench.measure("forget_output", args.forget_snapshots * 2,
+                  lambda: BackupExecutor(repository, forget_job)._run(),
+                  env={"FAKE_RESTIC_FORGET_SNAPSHOTS": args.forget_snapshots})
+
+    bench.measure("load_snapshots", args.snapshots,
+                  lambda: window._load_snapshots_async(repository),
+                  env={"FAKE_RESTIC_SNAPSHOTS": args.snapshots})
+
+    snapshots = make_snapshots(args.snapshots)
+    bench.measure("display_snapshots", args.snapshots,
+                  lambda: window._display_snapshots(snapshots))
+    del snapshots
+
+    bench.measure("load_snapshot_files", args.ls_nodes,
+                  lambda: window._load_snapshot_files_async(repository, "0" * 8),
+                  env={"FAKE_RESTIC_LS_NODES": args.ls_nodes})
+    window.files_tree.clear()
+
+    files = make_files(args.ls_nodes)
+    bench.measure("display_files", args.ls_nodes,
+                  lambda: window._display_files(files))
+    window.files_tree.clear()
+    del files
+
+    storage.save_history([
+        History(job_name=f"job{i % 100}", repo_name="bench", timestamp=f"2024-01-01T00:00:{i % 60:02d}.{i:06d}",
+                success=i % 10 != 0, files=1000, bytes=1024 ** 3, duration=60, snapshot_id=f"{i:08x}",
+                exit_code=0, bytes_added=1024 ** 2, summary_text="benchmark")
+        for i in range(args.history)
+    ])
+    bench.measure("refresh_history", args.history, window.refresh_history)
+
+    return bench.results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return a list of regressions against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or base.get("items") != result["items"]:
+            continue
+        for key in ("seconds", "peak_py_mb"):
+            if base.get(key) and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {result[key]:.3f} > baseline {base[key]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ResticTray benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Use 1/10 of the default sizes")
+    parser.add_argument("--ls-nodes", type=int, default=200000)
+    parser.add_argument("--status-lines", type=int, default=20000)
+    parser.add_argument("--status-rate", type=float, default=0, help="status lines per second, 0 = unlimited")
+    parser.add_argument("--snapshots", type=int, default=5000)
+    parser.add_argument("--forget-snapshots", type=int, default=5000)
+    parser.add_argument("--history", type=int, default=20000)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="Do not measure Python peak memory")
+    parser.add_argument("--json", metavar="FILE", help="Write results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against results in FILE")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    if args.quick:
+        for key in ("ls_nodes", "status_lines", "snapshots", "forget_snapshots", "history"):
+            setattr(args, key, max(1, getattr(args, key) // 10))
+
+    with tempfile.TemporaryDirectory(prefix="restictray-bench-") as workdir:
+        setup_environment(Path(workdir))
+        results = run(args)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
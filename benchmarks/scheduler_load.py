@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Load test for JobScheduler with thousands of scheduled jobs.
+
+Creates a configuration with many jobs spread over several repositories,
+measures how long loading and scheduling them takes and how much memory it
+uses, then makes the jobs fire at the same moment and measures the trigger
+latency (time from the scheduled run time until run_backup_job starts).
+Jobs run against the synthetic restic from fake_restic.py.
+
+Usage:
+    python benchmarks/scheduler_load.py [--jobs 5000] [--repos 50] [--fire N] [--max-latency 5]
+
+--fire limits how many of the scheduled jobs are made due at once (default:
+all of them); every fired job spawns one fake restic process.
+
+Exits with status 1 if a job was missed or the 95th percentile trigger
+latency exceeds --max-latency seconds.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from run_benchmarks import setup_environment
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(args) -> bool:
+    from PySide6.QtGui import QIcon
+    from PySide6.QtWidgets import QApplication
+    from qasync import QEventLoop
+    from restictray import globals
+    from restictray import main as restictray_main
+    from restictray.scheduler import JobScheduler
+    from restictray.storage import Storage, Repository, Job
+
+    os.environ["FAKE_RESTIC_STATUS_LINES"] = "0"
+
+    storage = Storage()
+    storage.save_repositories([
+        Repository(name=f"repo{r}", url=f"/tmp/load-repo{r}", password="secret")
+        for r in range(args.repos)
+    ])
+    storage.save_jobs([
+        Job(name=f"job{i}", target_repo=f"repo{i % args.repos}", type="backup",
+            schedule=f"{i % 60} 2 * * *", additional_args="", directory=f"/srv/data/dir{i}")
+        for i in range(args.jobs)
+    ])
+
+    app = QApplication([])
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    window = restictray_main.MainWindow()
+    globals.main_window = window
+    globals.tray_icon = restictray_main.TrayIcon(QIcon(), QIcon(), window)
+
+    latencies: list[float] = []
+    fire_time: list[datetime] = []
+
+    class LoadTestScheduler(JobScheduler):
+        async def run_backup_job(self, job):
+            latencies.append((datetime.now().astimezone() - fire_time[0]).total_seconds())
+            await super().run_backup_job(job)
+
+    scheduler = LoadTestScheduler(storage, log_callback=lambda message: None)
+    scheduler.scheduler._eventloop = loop
+
+    async def load():
+        tracemalloc.start()
+        start = time.perf_counter()
+        scheduler.load_and_schedule_all_jobs()
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"load_and_schedule_all_jobs: {args.jobs} jobs in {seconds:.3f} s, "
+              f"{current / 1024 / 1024:.1f} MB retained, {peak / 1024 / 1024:.1f} MB peak")
+
+        start = time.perf_counter()
+        for i in range(args.jobs):
+            storage.get_repository(f"repo{i % args.repos}")
+        seconds = time.perf_counter() - start
+        print(f"get_repository: {seconds / args.jobs * 1e6:.1f} us per lookup")
+
+        # Make the jobs fire at the same moment
+        fire_time.append(datetime.now().astimezone() + timedelta(seconds=2))
+        scheduler.scheduler.pause()
+        for job in scheduler.get_scheduled_jobs()[:args.fire]:
+            job.modify(next_run_time=fire_time[0])
+        scheduler.scheduler.resume()
+
+        deadline = time.monotonic() + args.timeout
+        while len(latencies) < args.fire or scheduler.running_executors:
+            if time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.1)
+
+    loop.run_until_complete(load())
+    scheduler.shutdown()
+
+    missed = args.fire - len(latencies)
+    p50 = percentile(latencies, 0.5)
+    p95 = percentile(latencies, 0.95)
+    print(f"trigger latency: p50 {p50:.3f} s, p95 {p95:.3f} s, "
+          f"max {max(latencies, default=0.0):.3f} s, {missed} missed")
+
+    return missed == 0 and p95 <= args.max_latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JobScheduler load test")
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--repos", type=int, default=50)
+    parser.add_argument("--fire", type=int, help="Number of jobs to fire at once (default: all)")
+    parser.add_argument("--max-latency", type=float, default=5.0, help="Allowed p95 trigger latency in seconds")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for all jobs to finish")
+    args = parser.parse_args()
+    if args.fire is None:
+        args.fire = args.jobs
+
+    with tempfile.TemporaryDirectory(prefix="restictray-load-") as workdir:
+        setup_environment(Path(workdir))
+        ok = run(args)
+
+    if not ok:
+        print("FAILED")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
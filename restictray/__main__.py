@@ -1,6 +1,6 @@
 """Main entry point for RestictTray application."""
 
-from restictray import main
+from restictray import cli
 
 if __name__ == "__main__":
-    main.main()
+    cli.main()
@@ -0,0 +1,38 @@
+"""Command line entry point for ResticTray"""
+
+import argparse
+from restictray import timeline
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="restictray",
+        description="A system tray application for Restic backup management",
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="run the scheduled jobs headless, without tray icon and without Qt",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true",
+        help="with --daemon: log progress of running jobs",
+    )
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="print a timeline of startup steps with elapsed time and memory use",
+    )
+    # Unknown arguments are left for Qt (e.g. -platform)
+    args, _ = parser.parse_known_args()
+    if args.profile_startup:
+        timeline.enable()
+
+    if args.daemon:
+        from restictray import daemon
+        daemon.main(verbose=args.verbose)
+    else:
+        from restictray import main as gui
+        gui.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""Local control API: a JSON-lines protocol on a Unix domain socket
+
+Every request is one JSON object per line:
+
+    {"id": 1, "method": "run", "params": {"job": "home", "wait": true}}
+
+and is answered with {"id": 1, "result": ...} or {"id": 1, "error": "..."}.
+Requests on one connection are handled concurrently, so a client can
+subscribe to events and wait for a run at the same time. After "subscribe"
+the server also sends event lines:
+
+    {"event": "started"|"progress"|"finished", "job": "home", ...}
+
+Methods:
+    jobs                                    List jobs with their run state
+    run {job, wait}                         Start a job, optionally wait until it finished
+    cancel {job}                            Cancel a running job
+    subscribe {job}                         Stream events, of one job or all jobs
+    history {job, repo, since, until, limit}  History entries, oldest first
+    snapshots {repo}                        Snapshot list of a repository
+"""
+
+import asyncio
+import json
+import os
+import socket
+import stat
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from restictray.storage import Storage, Job, History
+from restictray.restic import load_snapshots
+from restictray.runner import STREAM_LIMIT
+
+# Events queued for a subscriber that does not read them are dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class ControlError(Exception):
+    """An error reported to the client"""
+
+
+def socket_path(storage: Storage) -> Optional[Path]:
+    """Get the control socket path from the settings, or None if disabled
+
+    The setting "control_socket" overrides the default path
+    ($XDG_RUNTIME_DIR/restictray.sock, else restictray.sock in the config
+    directory); false disables the control socket.
+    """
+    path = storage.get_setting("control_socket")
+    if path is False or path == "":
+        return None
+    if path:
+        return Path(path).expanduser()
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "restictray.sock"
+    return storage.config_dir / "restictray.sock"
+
+
+class ControlServer:
+    """Serves the control API from the event loop of the JobScheduler"""
+
+    def __init__(self, storage: Storage, scheduler, path: Path):
+        """
+        Initialize the control server
+
+        Args:
+            storage: Storage instance for reading jobs, repositories and history
+            scheduler: JobScheduler that runs and cancels jobs
+            path: Path of the Unix domain socket
+        """
+        self.storage = storage
+        self.scheduler = scheduler
+        self.path = path
+        self._server: asyncio.AbstractServer|None = None
+        self._subscribers: list[tuple[asyncio.Queue, Optional[str]]] = []
+        self._started: dict[str, str] = {}  # start time of running jobs, by name
+        self._runs: dict[str, asyncio.Future] = {}  # resolved with the history entry when a job finishes
+
+    @classmethod
+    def from_settings(cls, storage: Storage, scheduler) -> Optional["ControlServer"]:
+        """Create a control server from the application settings, or None if disabled"""
+        path = socket_path(storage)
+        if not path:
+            return None
+        return cls(storage, scheduler, path)
+
+    async def start(self) -> bool:
+        """Start listening, returns False if another instance owns the socket"""
+        if self.path.is_symlink() or self.path.exists():
+            if not stat.S_ISSOCK(self.path.lstat().st_mode):
+                print(f"Control socket path {self.path} exists and is not a socket, not starting the control API")
+                return False
+            try:
+                _, writer = await asyncio.open_unix_connection(str(self.path))
+                writer.close()
+                print(f"Control socket {self.path} is in use by another instance, not starting the control API")
+                return False
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left over from a process that did not shut down cleanly
+                self.path.unlink(missing_ok=True)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.scheduler.add_listener(self._on_job_event)
+        self.scheduler.add_progress_listener(self._on_progress)
+        self._server = await asyncio.start_unix_server(self._handle_client, sock=self._bind())
+        print(f"Serving control API on {self.path}")
+        return True
+
+    def _bind(self) -> socket.socket:
+        """Create the listening socket, accessible by the owner only from the start"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Other users must not connect between bind() and a chmod, so the
+        # socket is created with these permissions
+        umask = os.umask(0o177)
+        try:
+            sock.bind(str(self.path))
+        except OSError:
+            sock.close()
+            raise
+        finally:
+            os.umask(umask)
+        return sock
+
+    async def stop(self):
+        """Stop listening and remove the socket"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            self.path.unlink(missing_ok=True)
+
+    def _publish(self, event: dict):
+        """Queue an event for all subscribers interested in its job"""
+        for queue, job_name in self._subscribers:
+            if job_name is None or job_name == event["job"]:
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    pass
+
+    def _latest_history(self, job_name: str, since: str) -> Optional[History]:
+        """Get the history entry a run of the job that started at ``since`` recorded"""
+        entries = [entry for entry in self.storage.get_history_for_job(job_name) if entry.timestamp >= since]
+        return entries[-1] if entries else None
+
+    def _on_job_event(self, event: str, job: Job):
+        """Publish started/finished events and resolve waiting runs"""
+        if event == "started":
+            self._started[job.name] = datetime.now().isoformat()
+            self._publish({"event": "started", "job": job.name, "repo": job.target_repo})
+            return
+
+        since = self._started.pop(job.name, "")
+        history = self._latest_history(job.name, since)
+        self._publish({
+            "event": "finished",
+            "job": job.name,
+            "repo": job.target_repo,
+            "success": bool(history and history.success),
+            "history": asdict(history) if history else None,
+        })
+        future = self._runs.pop(job.name, None)
+        if future and not future.done():
+            future.set_result(history)
+
+    def _run_done(self, job_name: str, future: asyncio.Future):
+        """Resolve a run that ended without a "finished" event, e.g. missing repository"""
+        if not future.done():
+            if self._runs.get(job_name) is future:
+                del self._runs[job_name]
+            future.set_result(None)
+
+    def _on_progress(self, job: Job, status: dict):
+        """Publish restic's progress updates"""
+        event = {key: value for key, value in status.items() if key != "message_type"}
+        self._publish({**event, "event": "progress", "job": job.name})
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Read requests from a client until it disconnects"""
+        tasks: set[asyncio.Task] = set()
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self._handle_request(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, message: dict):
+        writer.write(json.dumps(message).encode() + b"\n")
+        await writer.drain()
+
+    async def _handle_request(self, line: bytes, writer: asyncio.StreamWriter):
+        """Handle a single request and send its response"""
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                method = request["method"]
+                params = request.get("params") or {}
+            except (json.JSONDecodeError, AttributeError, KeyError, TypeError):
+                raise ControlError("Invalid request")
+            handler = getattr(self, f"_cmd_{method}", None)
+            if not handler:
+                raise ControlError(f"Unknown method: {method}")
+            if method == "subscribe":
+                await self._cmd_subscribe(params, writer, request_id)
+                return
+            result = await handler(params)
+            await self._send(writer, {"id": request_id, "result": result})
+        except ControlError as e:
+            await self._send(writer, {"id": request_id, "error": str(e)})
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            print(f"Error handling control request: {e}")
+            try:
+                await self._send(writer, {"id": request_id, "error": f"Internal error: {e}"})
+            except ConnectionError:
+                pass
+
+    def _get_job(self, params: dict) -> Job:
+        job_name = params.get("job")
+        if not job_name:
+            raise ControlError("Missing parameter: job")
+        job = self.storage.get_job(job_name)
+        if not job:
+            raise ControlError(f"Job not found: {job_name}")
+        return job
+
+    async def _cmd_jobs(self, params: dict) -> list:
+        jobs = []
+        for job in self.storage.load_jobs():
+            executor = self.scheduler.running_executors.get(job.name)
+            state = self.scheduler.job_states.get(job.name)
+            next_run = self.scheduler.get_job_next_run_time(job.name)
+            jobs.append({
+                **asdict(job),
+                "running": executor is not None,
+                "waiting": bool(executor and executor.waiting),
+                "last_run": state.last_run if state else "",
+                "next_run": next_run.isoformat() if next_run else "",
+            })
+        return jobs
+
+    async def _cmd_run(self, params: dict) -> dict:
+        job = self._get_job(params)
+        if job.name in self.scheduler.running_executors or job.name in self._runs:
+            raise ControlError(f"Job is already running: {job.name}")
+        future = asyncio.get_running_loop().create_future()
+        self._runs[job.name] = future
+        task = asyncio.create_task(self.scheduler.run_backup_job(job, force=True))
+        task.add_done_callback(lambda _: self._run_done(job.name, future))
+        if not params.get("wait"):
+            return {"job": job.name, "started": True}
+        history = await asyncio.shield(future)
+        return {
+            "job": job.name,
+            "success": bool(history and history.success),
+            "history": asdict(history) if history else None,
+        }
+
+    async def _cmd_cancel(self, params: dict) -> dict:
+        job = self._get_job(params)
+        return {"job": job.name, "cancelled": self.scheduler.cancel_job(job.name)}
+
+    async def _cmd_subscribe(self, params: dict, writer: asyncio.StreamWriter, request_id):
+        """Stream events to the client until it disconnects"""
+        queue: asyncio.Queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        subscriber = (queue, params.get("job"))
+        self._subscribers.append(subscriber)
+        try:
+            await self._send(writer, {"id": request_id, "result": {"subscribed": True}})
+            while True:
+                await self._send(writer, await queue.get())
+        finally:
+            self._subscribers.remove(subscriber)
+
+    async def _cmd_history(self, params: dict) -> list:
+        if params.get("job"):
+            entries = self.storage.get_history_for_job(params["job"])
+        elif params.get("repo"):
+            entries = self.storage.get_history_for_repo(params["repo"])
+        else:
+            entries = self.storage.load_history()
+        # Timestamps are ISO strings, so a date like "2025-01-31" works as a bound too
+        if params.get("job") and params.get("repo"):
+            entries = [entry for entry in entries if entry.repo_name == params["repo"]]
+        if params.get("since"):
+            entries = [entry for entry in entries if entry.timestamp >= params["since"]]
+        if params.get("until"):
+            entries = [entry for entry in entries if entry.timestamp < params["until"]]
+        entries.sort(key=lambda entry: entry.timestamp)
+        if params.get("limit"):
+            entries = entries[-int(params["limit"]):]
+        return [asdict(entry) for entry in entries]
+
+    async def _cmd_snapshots(self, params: dict) -> list:
+        repo_name = params.get("repo")
+        if not repo_name:
+            raise ControlError("Missing parameter: repo")
+        repository = self.storage.get_repository(repo_name)
+        if not repository:
+            raise ControlError(f"Repository not found: {repo_name}")
+        try:
+            return await load_snapshots(repository)
+        except RuntimeError as e:
+            raise ControlError(f"Failed to load snapshots: {e}")
+
+
+class ControlClient:
+    """Client for the control API"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._reader: asyncio.StreamReader|None = None
+        self._writer: asyncio.StreamWriter|None = None
+        self._next_id = 1
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_unix_connection(str(self.path), limit=STREAM_LIMIT)
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+    async def send(self, method: str, params: Optional[dict] = None) -> int:
+        """Send a request without waiting for the response, returns its id"""
+        request_id = self._next_id
+        self._next_id += 1
+        request = {"id": request_id, "method": method, "params": params or {}}
+        self._writer.write(json.dumps(request).encode() + b"\n")
+        await self._writer.drain()
+        return request_id
+
+    async def receive(self) -> dict:
+        """Receive the next response or event"""
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by ResticTray")
+        return json.loads(line)
+
+    async def call(self, method: str, params: Optional[dict] = None):
+        """Send a request and return its result, ignoring events in between"""
+        request_id = await self.send(method, params)
+        while True:
+            message = await self.receive()
+            if message.get("id") == request_id and "event" not in message:
+                if "error" in message:
+                    raise ControlError(message["error"])
+                return message.get("result")
@@ -0,0 +1,105 @@
+"""Hands repository passwords to restic without spawning a helper process
+
+The password is written to a pipe whose read end restic inherits and reads
+via ``--password-file /dev/fd/N``. Where /dev/fd is not available it is
+passed in the RESTIC_PASSWORD environment variable instead.
+
+Repository.password_source selects where the password comes from:
+
+    ""                  Repository.password from repositories.json
+    "keyring"           the system keyring (service "restictray", user = repository name),
+                        requires the optional ``keyring`` package
+    "file:<path>"       a file restic reads itself (--password-file)
+    "command:<cmd>"     a command restic runs itself (--password-command)
+"""
+
+import os
+from typing import Optional
+from restictray.storage import Repository
+
+KEYRING_SERVICE = "restictray"
+
+# Larger passwords could fill the pipe before restic reads it
+PIPE_PASSWORD_LIMIT = 4096
+
+_keyring_cache: dict[str, str] = {}
+
+
+class CredentialError(Exception):
+    """The password of a repository is not available"""
+
+
+def _keyring_password(repository: Repository) -> str:
+    """Look up the password in the system keyring, once per repository"""
+    if repository.name in _keyring_cache:
+        return _keyring_cache[repository.name]
+    try:
+        import keyring
+    except ImportError:
+        raise CredentialError("The keyring package is not installed (pip install keyring)")
+    try:
+        password = keyring.get_password(KEYRING_SERVICE, repository.name)
+    except Exception as e:
+        raise CredentialError(f"Keyring lookup failed: {e}")
+    if password is None:
+        raise CredentialError(f"No password for '{repository.name}' in the keyring (service '{KEYRING_SERVICE}')")
+    _keyring_cache[repository.name] = password
+    return password
+
+
+def clear_cache():
+    """Forget cached keyring passwords, e.g. after a repository was edited"""
+    _keyring_cache.clear()
+
+
+class ResticCredentials:
+    """restic arguments, environment and inherited fds for one invocation
+
+    close() must be called once the process was spawned (or spawning failed)
+    to close the parent's end of the pipe.
+    """
+
+    def __init__(self, args: list[str], env: Optional[dict] = None, pass_fds: tuple = ()):
+        self.args = args
+        self.env = env
+        self.pass_fds = pass_fds
+
+    def close(self):
+        for fd in self.pass_fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.pass_fds = ()
+
+
+def _from_password(password: str) -> ResticCredentials:
+    if os.path.isdir("/dev/fd") and len(password.encode()) < PIPE_PASSWORD_LIMIT:
+        read_fd, write_fd = os.pipe()
+        try:
+            os.write(write_fd, password.encode())
+        finally:
+            os.close(write_fd)
+        return ResticCredentials(["--password-file", f"/dev/fd/{read_fd}"], pass_fds=(read_fd,))
+    env = dict(os.environ)
+    env.pop("RESTIC_PASSWORD_FILE", None)
+    env.pop("RESTIC_PASSWORD_COMMAND", None)
+    env["RESTIC_PASSWORD"] = password
+    return ResticCredentials([], env=env)
+
+
+def get_credentials(repository: Repository) -> ResticCredentials:
+    """Get the credentials for running restic on ``repository``
+
+    Raises CredentialError if the password source cannot provide it.
+    """
+    source = repository.password_source
+    if not source:
+        return _from_password(repository.password)
+    if source == "keyring":
+        return _from_password(_keyring_password(repository))
+    if source.startswith("file:"):
+        return ResticCredentials(["--password-file", os.path.expanduser(source[len("file:"):])])
+    if source.startswith("command:"):
+        return ResticCredentials(["--password-command", source[len("command:"):]])
+    raise CredentialError(f"Unknown password source: {source}")
@@ -0,0 +1,131 @@
+"""Command line client for the control API of a running ResticTray
+
+Results are printed as JSON. "run --wait" exits with status 1 if the job
+failed; connection and request errors exit with status 2.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+from restictray.storage import Storage
+from restictray.control import ControlClient, ControlError, socket_path
+
+
+def print_json(data):
+    print(json.dumps(data, indent=2))
+
+
+def format_progress(event: dict) -> str:
+    """Format a progress event like the tray tooltip"""
+    bytes_done_mb = event.get("bytes_done", 0) / (1024 * 1024)
+    total_bytes_mb = event.get("total_bytes", 0) / (1024 * 1024)
+    return (f"{event['job']}: {event.get('percent_done', 0):.0%} - "
+            f"{event.get('files_done', 0)}/{event.get('total_files', 0)} files, "
+            f"{bytes_done_mb:.0f}/{total_bytes_mb:.0f} MB")
+
+
+async def run_job(client: ControlClient, args) -> int:
+    if args.progress:
+        await client.call("subscribe", {"job": args.job})
+    request_id = await client.send("run", {"job": args.job, "wait": args.wait})
+    while True:
+        message = await client.receive()
+        if message.get("event") == "progress":
+            print(format_progress(message), file=sys.stderr)
+        elif message.get("event") == "started":
+            print(f"{message['job']}: started", file=sys.stderr)
+        elif message.get("id") == request_id and "event" not in message:
+            if "error" in message:
+                raise ControlError(message["error"])
+            result = message["result"]
+            print_json(result)
+            return 0 if result.get("started") or result.get("success") else 1
+
+
+async def watch(client: ControlClient, args) -> int:
+    await client.call("subscribe", {"job": args.job})
+    while True:
+        print(json.dumps(await client.receive()), flush=True)
+
+
+async def run(args) -> int:
+    client = ControlClient(args.socket)
+    try:
+        await client.connect()
+    except (ConnectionRefusedError, FileNotFoundError):
+        print(f"ResticTray is not running (no control socket at {args.socket})", file=sys.stderr)
+        return 2
+    try:
+        if args.command == "jobs":
+            print_json(await client.call("jobs"))
+        elif args.command == "run":
+            return await run_job(client, args)
+        elif args.command == "cancel":
+            result = await client.call("cancel", {"job": args.job})
+            print_json(result)
+            return 0 if result["cancelled"] else 1
+        elif args.command == "watch":
+            return await watch(client, args)
+        elif args.command == "history":
+            print_json(await client.call("history", {
+                "job": args.job, "repo": args.repo,
+                "since": args.since, "until": args.until, "limit": args.limit,
+            }))
+        elif args.command == "snapshots":
+            print_json(await client.call("snapshots", {"repo": args.repo}))
+        return 0
+    except (ControlError, ConnectionError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="restictray-ctl",
+        description="Control a running ResticTray (tray application or daemon)",
+    )
+    parser.add_argument("--socket", type=Path, help="control socket path (default: from the settings)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("jobs", help="list jobs with their state")
+
+    run_parser = commands.add_parser("run", help="start a job")
+    run_parser.add_argument("job")
+    run_parser.add_argument("--wait", action="store_true", help="wait until the job finished")
+    run_parser.add_argument("--progress", action="store_true", help="print progress to stderr")
+
+    cancel_parser = commands.add_parser("cancel", help="cancel a running job")
+    cancel_parser.add_argument("job")
+
+    watch_parser = commands.add_parser("watch", help="print job events as JSON lines")
+    watch_parser.add_argument("--job", help="only events of this job")
+
+    history_parser = commands.add_parser("history", help="show history entries")
+    history_parser.add_argument("--job")
+    history_parser.add_argument("--repo")
+    history_parser.add_argument("--since", help="ISO date or timestamp, inclusive")
+    history_parser.add_argument("--until", help="ISO date or timestamp, exclusive")
+    history_parser.add_argument("--limit", type=int, help="only the newest LIMIT entries")
+
+    snapshots_parser = commands.add_parser("snapshots", help="list the snapshots of a repository")
+    snapshots_parser.add_argument("repo")
+
+    args = parser.parse_args()
+    if args.socket is None:
+        args.socket = socket_path(Storage())
+        if args.socket is None:
+            print("The control socket is disabled in the settings", file=sys.stderr)
+            sys.exit(2)
+
+    try:
+        sys.exit(asyncio.run(run(args)))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Headless daemon mode: runs the scheduled jobs without Qt"""
+
+import asyncio
+import signal
+from datetime import datetime
+from typing import Optional
+from restictray.storage import Storage
+from restictray.scheduler import JobScheduler
+from restictray.metrics import MetricsExporter
+from restictray.control import ControlServer
+from restictray.stats import StatsRefresher
+from restictray import runner
+from restictray import globals
+from restictray import timeline
+
+# Seconds between checks of jobs.json for external changes
+JOBS_FILE_POLL_INTERVAL = 2.0
+
+
+def log(message: str):
+    """Print a log message with a timestamp"""
+    print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {message}", flush=True)
+
+
+class Daemon:
+    """Runs JobScheduler on a plain asyncio event loop"""
+
+    def __init__(self, storage: Optional[Storage] = None, verbose: bool = False):
+        """
+        Initialize the daemon
+
+        Args:
+            storage: Storage instance, the default config directory if not given
+            verbose: Log progress messages of running jobs
+        """
+        self.storage = storage or Storage()
+        self.scheduler = JobScheduler(self.storage, log_callback=log)
+        self.metrics_exporter: MetricsExporter|None = None
+        self.control_server: ControlServer|None = None
+        self.stats_refresher = StatsRefresher(self.storage)
+        self._stop_event = asyncio.Event()
+        if verbose:
+            globals.add_state_hook(log)
+            runner.add_hook(self._log_restic_run)
+
+    def _log_restic_run(self, event: str, record: runner.RunRecord):
+        """Log the restic processes that finish"""
+        if event == "finished":
+            log(f"restic {record.command} on '{record.repository}' exited with {record.exit_code} "
+                f"after {record.duration:.1f}s (lock wait {record.lock_wait:.1f}s, profile {record.profile})")
+
+    def stop(self):
+        """Ask the daemon to stop"""
+        self._stop_event.set()
+
+    async def _watch_jobs_file(self):
+        """Apply changes to jobs.json made by other programs"""
+        file_key = self.storage._file_key(self.storage.jobs_file)
+        while True:
+            await asyncio.sleep(JOBS_FILE_POLL_INTERVAL)
+            new_key = self.storage._file_key(self.storage.jobs_file)
+            if new_key != file_key and self.scheduler.reconcile():
+                file_key = new_key
+
+    async def run(self):
+        """Run until stop() is called or SIGINT/SIGTERM is received"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        self.scheduler.load_and_schedule_all_jobs()
+        timeline.mark("scheduler started")
+
+        self.metrics_exporter = MetricsExporter.from_settings(self.storage, self.scheduler)
+        if self.metrics_exporter:
+            await self.metrics_exporter.start()
+
+        self.control_server = ControlServer.from_settings(self.storage, self.scheduler)
+        if self.control_server and not await self.control_server.start():
+            self.control_server = None
+
+        self.stats_refresher.start()
+        watch_task = asyncio.create_task(self._watch_jobs_file())
+        log("ResticTray daemon started")
+
+        await self._stop_event.wait()
+
+        log("Cancelling running jobs...")
+        watch_task.cancel()
+        self.stats_refresher.stop()
+        if self.control_server:
+            await self.control_server.stop()
+        # Stop triggering new runs and interrupt running ones, then wait until
+        # restic released the repositories before the scheduler shuts down
+        # (which cancels its running job tasks)
+        self.scheduler.scheduler.pause()
+        self.scheduler.cancel_all()
+        for lock in list(globals.repo_locks.values()):
+            await lock.acquire()
+        self.scheduler.shutdown()
+        if self.metrics_exporter:
+            await self.metrics_exporter.stop()
+        log("ResticTray daemon stopped")
+
+
+def main(verbose: bool = False):
+    asyncio.run(Daemon(verbose=verbose).run())
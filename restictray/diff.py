@@ -0,0 +1,188 @@
+"""Differences between two snapshots, streamed from `restic diff --json`
+
+Entries are appended to a SnapshotDiff while restic prints them, so a view
+can show them before the diff is complete. Snapshots are immutable, so
+complete diffs are cached by snapshot pair, the most recently used ones up
+to the setting "diff_cache_entries" (default two million entries).
+
+restic diff reports only the paths and how they changed. The sizes of the
+entries and the per-directory byte totals are taken from the `restic ls`
+listings of both snapshots (see snapshots.py) by compute_sizes().
+"""
+
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+from restictray.storage import Repository, Storage
+from restictray.credentials import CredentialError
+from restictray.runner import ResticRunner, ResticCancelled
+from restictray import snapshots as snapshot_cache
+
+DEFAULT_CACHE_ENTRIES = 2000000
+
+# restic diff modifiers: "+" added, "-" removed, "M" content modified,
+# "T" type changed, "U" metadata changed, "?" bitrot
+ADDED = "+"
+REMOVED = "-"
+MODIFIED = "MTU?"
+
+
+@dataclass
+class DirectoryTotals:
+    """Changed entries below a directory and their sizes in bytes"""
+    entries: int = 0
+    added: int = 0
+    removed: int = 0
+    modified: int = 0  # size of the new versions
+
+    @property
+    def total(self) -> int:
+        return self.added + self.removed + self.modified
+
+
+@dataclass
+class SnapshotDiff:
+    """Changes from snapshot ``source`` to snapshot ``target``, filled while restic runs"""
+    repo_name: str
+    source: str
+    target: str
+    paths: list[str] = field(default_factory=list)  # directories end with "/"
+    modifiers: list[str] = field(default_factory=list)  # one per path
+    statistics: Optional[dict] = None  # restic's summary
+    complete: bool = False
+    error: str = ""
+    sizes: Optional[list[int]] = None  # one per path, set by compute_sizes()
+    directories: Optional[dict[str, DirectoryTotals]] = None  # set by compute_sizes()
+    task: Optional[asyncio.Task] = field(default=None, repr=False, compare=False)
+    runner: Optional[ResticRunner] = field(default=None, repr=False, compare=False)
+
+    def _on_message(self, data):
+        if not isinstance(data, dict):
+            return
+        if data.get("message_type") == "change":
+            self.paths.append(data.get("path", ""))
+            self.modifiers.append(data.get("modifier", "?"))
+        elif data.get("message_type") == "statistics":
+            self.statistics = data
+
+
+_cache: OrderedDict[tuple[str, str, str], SnapshotDiff] = OrderedDict()
+_running: dict[tuple[str, str, str], SnapshotDiff] = {}
+
+
+def _store(key: tuple[str, str, str], diff: SnapshotDiff):
+    limit = Storage().get_setting("diff_cache_entries", DEFAULT_CACHE_ENTRIES)
+    if len(diff.paths) > limit:
+        return
+    _cache[key] = diff
+    _cache.move_to_end(key)
+    total = sum(len(cached.paths) for cached in _cache.values())
+    while total > limit:
+        _, evicted = _cache.popitem(last=False)
+        total -= len(evicted.paths)
+
+
+async def _run(key: tuple[str, str, str], diff: SnapshotDiff):
+    try:
+        result = await diff.runner.stream("--json", "diff", diff.source, diff.target, on_json=diff._on_message)
+        if result.success:
+            diff.complete = True
+            _store(key, diff)
+        else:
+            diff.error = "Cancelled" if result.status else result.error_message()
+    except (CredentialError, ResticCancelled) as e:
+        diff.error = str(e) or "Cancelled"
+    finally:
+        _running.pop(key, None)
+        diff.runner = None
+
+
+def get(repository: Repository, source: str, target: str) -> SnapshotDiff:
+    """Get the diff of two snapshots (full IDs), starting restic diff unless it is cached or running
+
+    The diff is filled in the background; wait for SnapshotDiff.task or poll
+    ``complete`` and ``error``.
+    """
+    key = (repository.name, source, target)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key]
+    if key in _running:
+        return _running[key]
+    diff = SnapshotDiff(repo_name=repository.name, source=source, target=target)
+    diff.runner = ResticRunner(repository)
+    diff.task = asyncio.ensure_future(_run(key, diff))
+    _running[key] = diff
+    return diff
+
+
+def cancel(diff: SnapshotDiff):
+    """Stop a running diff; it is not cached"""
+    if diff.runner:
+        diff.runner.cancel()
+
+
+def _parent(path: str) -> str:
+    return path.rsplit("/", 1)[0] or "/"
+
+
+def _compute(diff: SnapshotDiff, source_sizes: dict[str, int], target_sizes: dict[str, int]):
+    sizes = []
+    # Totals of the entries directly in each directory first, then added to
+    # the ancestors once per directory rather than once per entry
+    direct: dict[str, DirectoryTotals] = {}
+    for path, modifier in zip(diff.paths, diff.modifiers):
+        if path.endswith("/"):
+            sizes.append(0)
+            continue
+        size = (source_sizes if modifier == REMOVED else target_sizes).get(path, 0)
+        sizes.append(size)
+        directory = _parent(path)
+        totals = direct.get(directory)
+        if totals is None:
+            totals = direct[directory] = DirectoryTotals()
+        totals.entries += 1
+        if modifier == ADDED:
+            totals.added += size
+        elif modifier == REMOVED:
+            totals.removed += size
+        else:
+            totals.modified += size
+    directories: dict[str, DirectoryTotals] = {}
+    for directory, own in direct.items():
+        while True:
+            totals = directories.get(directory)
+            if totals is None:
+                totals = directories[directory] = DirectoryTotals()
+            totals.entries += own.entries
+            totals.added += own.added
+            totals.removed += own.removed
+            totals.modified += own.modified
+            if directory == "/":
+                break
+            directory = _parent(directory)
+    diff.sizes = sizes
+    diff.directories = directories
+
+
+def _file_sizes(nodes: list) -> dict[str, int]:
+    return {node.get("path", ""): node.get("size", 0) for node in nodes
+            if node.get("struct_type") == "node" and node.get("type") == "file"}
+
+
+async def compute_sizes(repository: Repository, diff: SnapshotDiff):
+    """Fill in the sizes and per-directory totals of a complete diff
+
+    The listings of both snapshots are loaded if they are not cached.
+    Raises RuntimeError with restic's error message if restic fails.
+    """
+    if diff.sizes is not None:
+        return
+    source_nodes, target_nodes = await asyncio.gather(
+        snapshot_cache.get_listing(repository, diff.source),
+        snapshot_cache.get_listing(repository, diff.target)
+    )
+    loop = asyncio.get_running_loop()
+    # Millions of entries take seconds, keep the event loop responsive
+    await loop.run_in_executor(None, lambda: _compute(diff, _file_sizes(source_nodes), _file_sizes(target_nodes)))
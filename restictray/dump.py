@@ -0,0 +1,110 @@
+"""Restores single files, and exports directories as archives, with `restic dump`
+
+restic restore walks the snapshot tree to match its --include filters, which
+is most of the time it takes to get back one file. `restic dump` looks the
+path up directly and prints the file's content, or a tar archive of a
+directory. The output is written to a temporary file next to the target and
+renamed over it once complete, so an existing file is never left
+half-written. The size of a file is checked against its node from the
+snapshot listing, and its mode and times are applied like restic restore
+would. Writing, fsync and renaming run in the default executor, so a slow
+disk does not block the event loop.
+"""
+
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+from typing import Callable, Optional
+from restictray.runner import ResticRunner, ResticResult
+
+
+def find_node(nodes: list, path: str) -> Optional[dict]:
+    """Find the node of a path in `restic ls` output"""
+    for node in nodes:
+        if node.get("struct_type") == "node" and node.get("path") == path:
+            return node
+    return None
+
+
+def _timestamp(value: str) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _apply_metadata(path: str, node: dict):
+    """Set the mode and times of a restored file from its node"""
+    if "mode" in node:
+        # A Go FileMode; the permissions are the low bits, special bits are elsewhere
+        os.chmod(path, node["mode"] & 0o777)
+    mtime = _timestamp(node.get("mtime"))
+    if mtime is not None:
+        os.utime(path, (_timestamp(node.get("atime")) or mtime, mtime))
+
+
+def _sync(file):
+    file.flush()
+    os.fsync(file.fileno())
+
+
+def _finish(temp_path: str, target: str, node: Optional[dict]):
+    """Apply a file's metadata, or the default permissions, and move it into place"""
+    if node is not None:
+        _apply_metadata(temp_path, node)
+    else:
+        # mkstemp creates the file readable by the owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+    os.replace(temp_path, target)
+
+
+async def dump(runner: ResticRunner, snapshot_id: str, path: str, target: str, node: Optional[dict] = None,
+               archive: str = "", on_progress: Optional[Callable[[int], None]] = None) -> ResticResult:
+    """
+    Write `restic dump` of a path in a snapshot to a file
+
+    Args:
+        runner: Runner for the repository
+        snapshot_id: ID of the snapshot
+        path: Path in the snapshot
+        target: File to write; replaced only once the dump is complete
+        node: The path's node from `restic ls`; for a file the size is checked
+            and the mode and times are applied
+        archive: "tar" or "zip" to dump a directory as that archive format
+        on_progress: Called with the number of bytes written so far
+
+    Raises RuntimeError if the size of the file does not match its node, and
+    OSError if the target cannot be written.
+    """
+    loop = asyncio.get_running_loop()
+    directory = os.path.dirname(target) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(target)}.", suffix=".part")
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as file:
+            async def on_data(chunk: bytes):
+                nonlocal written
+                # restic waits on the pipe meanwhile, so memory use stays bounded
+                await loop.run_in_executor(None, file.write, chunk)
+                written += len(chunk)
+                if on_progress:
+                    on_progress(written)
+
+            archive_args = ["--archive", archive] if archive else []
+            result = await runner.stream("dump", *archive_args, snapshot_id, path, on_data=on_data)
+            if not result.success:
+                return result
+            is_file = node is not None and node.get("type") == "file"
+            if is_file and written != node.get("size", 0):
+                raise RuntimeError(f"restic dump wrote {written} bytes of '{path}', "
+                                   f"the snapshot lists {node.get('size', 0)}")
+            await loop.run_in_executor(None, _sync, file)
+        await loop.run_in_executor(None, _finish, temp_path, target, node if is_file else None)
+        return result
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
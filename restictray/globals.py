@@ -1,5 +1,5 @@
 import asyncio
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Callable
 
 if TYPE_CHECKING:
     from main import MainWindow, TrayIcon
@@ -9,6 +9,9 @@ tray_icon: "TrayIcon"
 
 repo_locks: dict[str, asyncio.Lock] = {}
 
+# Callbacks receiving state/progress messages, e.g. the tray tooltip
+state_hooks: list[Callable[[str], None]] = []
+
 _last_tooltip: str = ""
 
 def get_repo_lock(repo_url: str) -> asyncio.Lock:
@@ -17,10 +20,14 @@ def get_repo_lock(repo_url: str) -> asyncio.Lock:
         repo_locks[repo_url] = asyncio.Lock()
     return repo_locks[repo_url]
 
+def add_state_hook(callback: Callable[[str], None]):
+    """Register a callback that receives state/progress messages"""
+    state_hooks.append(callback)
+
 def set_tooltip(message: str):
-    """Set the tooltip of the tray icon"""
+    """Publish a state message, e.g. to the tooltip of the tray icon"""
     global _last_tooltip
     if message != _last_tooltip:
         _last_tooltip = message
-        tray_icon.state_update_callback(message)
-        main_window.setWindowTitle(f"ResticTray - {message}")
\ No newline at end of file
+        for callback in state_hooks:
+            callback(message)
@@ -1,23 +1,35 @@
 import sys
 import asyncio
-import json
 import logging
 import locale
+from collections import deque
+from dataclasses import replace
 from pathlib import Path
+from typing import Callable, Optional
 from PySide6.QtWidgets import (
     QApplication, QSystemTrayIcon, QMenu, QMainWindow, QTextEdit, 
     QVBoxLayout, QHBoxLayout, QWidget, QTabWidget, QLabel, QListWidget,
     QPushButton, QDialog, QFormLayout, QLineEdit, QDialogButtonBox, QMessageBox,
     QComboBox, QCheckBox, QFileDialog, QTableWidget, QTableWidgetItem, QHeaderView,
-    QTreeWidget, QTreeWidgetItem, QSplitter
+    QTreeWidget, QTreeWidgetItem, QSplitter, QSpinBox, QListWidgetItem, QTableView, QProgressBar
 )
 from PySide6.QtGui import QIcon, QAction, QColor
-from PySide6.QtCore import QTimer, Qt, QTranslator, QLocale, QCoreApplication
+from PySide6.QtCore import (
+    QTimer, Qt, QTranslator, QLocale, QCoreApplication, QFileSystemWatcher, QAbstractTableModel, QModelIndex
+)
 from qasync import QEventLoop
 from restictray.restic import BackupExecutor
-from restictray.storage import Storage, Repository, Job, History
+from restictray.runner import ResticRunner
+from restictray.storage import Storage, Repository, Job, History, RepositoryStats
 from restictray.scheduler import JobScheduler
+from restictray.stats import StatsRefresher, format_size
+from restictray.prewarm import Prewarmer
 from restictray import globals
+from restictray import timeline
+from restictray import credentials
+from restictray import snapshots as snapshot_cache
+from restictray import diff as snapshot_diff
+from restictray.dump import dump, find_node
 
 # Configure logging
 #logging.basicConfig(
@@ -31,6 +43,9 @@ from restictray import globals
 
 executors: list[BackupExecutor] = []
 
+# Log messages kept until the Dashboard tab is built
+LOG_BUFFER_SIZE = 1000
+
 class LoadingDialog(QDialog):
     """A modal loading dialog that can be used as an async context manager"""
     def __init__(self, parent=None, message="Loading..."):
@@ -59,7 +74,7 @@ class JobDialog(QDialog):
         self.storage = storage
         self.job = job
         self.setWindowTitle(self.tr("Edit Job") if job else self.tr("Add Job"))
-        self.resize(500, 250)
+        self.resize(500, 350)
         
         layout = QFormLayout(self)
         
@@ -67,14 +82,45 @@ class JobDialog(QDialog):
         self.name_input = QLineEdit()
         self.repository_combo = QComboBox()
         self.type_combo = QComboBox()
-        self.type_combo.addItems(["backup", "forget", "prune", "check"])
+        self.type_combo.addItems(["backup", "stdin", "forget", "prune", "check"])
         self.schedule_input = QLineEdit()
-        self.directory_input = QLineEdit()
-        self.directory_browse_btn = QPushButton(self.tr("Browse..."))
-        self.directory_browse_btn.clicked.connect(self.browse_directory)
+        # Backup paths, editable with a double click
+        self.paths_list = QListWidget()
+        self.paths_list.setMaximumHeight(100)
+        self.add_directory_btn = QPushButton(self.tr("Add Directory..."))
+        self.add_directory_btn.clicked.connect(self.browse_directory)
+        self.add_path_btn = QPushButton(self.tr("Add Path"))
+        self.add_path_btn.clicked.connect(self.add_path)
+        self.remove_path_btn = QPushButton(self.tr("Remove"))
+        self.remove_path_btn.clicked.connect(self.remove_path)
+        self.files_from_input = QLineEdit()
+        self.files_from_browse_btn = QPushButton(self.tr("Browse..."))
+        self.files_from_browse_btn.clicked.connect(self.browse_files_from)
+        # stdin jobs: a command whose output is backed up, e.g. a database dump
+        self.stdin_command_input = QLineEdit()
+        self.stdin_filename_input = QLineEdit()
         self.additional_args_input = QLineEdit()
         self.enabled_checkbox = QCheckBox()
         self.enabled_checkbox.setChecked(True)
+        self.skip_unchanged_checkbox = QCheckBox(self.tr("Skip runs if nothing changed (inotify)"))
+        self.timeout_input = QSpinBox()
+        self.timeout_input.setRange(0, 100000)
+        self.timeout_input.setSuffix(self.tr(" min"))
+        self.timeout_input.setSpecialValueText(self.tr("No timeout"))
+        # check jobs: --read-data-subset=n/N, n advances with every run
+        self.read_data_subsets_input = QSpinBox()
+        self.read_data_subsets_input.setRange(0, 10000)
+        self.read_data_subsets_input.setSuffix(self.tr(" runs"))
+        self.read_data_subsets_input.setSpecialValueText(self.tr("Off"))
+        # prune jobs: managed prune, see prune.py
+        self.prune_threshold_input = QSpinBox()
+        self.prune_threshold_input.setRange(0, 100)
+        self.prune_threshold_input.setSuffix(self.tr(" % unused"))
+        self.prune_threshold_input.setSpecialValueText(self.tr("Always"))
+        self.prune_budget_input = QSpinBox()
+        self.prune_budget_input.setRange(0, 100000)
+        self.prune_budget_input.setSuffix(self.tr(" min"))
+        self.prune_budget_input.setSpecialValueText(self.tr("No limit"))
         
         # Load repositories into combo box
         repositories = storage.load_repositories()
@@ -100,14 +146,25 @@ class JobDialog(QDialog):
                 self.type_combo.setCurrentIndex(type_index)
             
             self.schedule_input.setText(job.schedule)
-            self.directory_input.setText(job.directory)
+            for path in job.backup_paths():
+                self._add_path_item(path)
+            self.files_from_input.setText(job.files_from)
+            self.stdin_command_input.setText(job.stdin_command)
+            self.stdin_filename_input.setText(job.stdin_filename)
             self.additional_args_input.setText(job.additional_args)
             self.enabled_checkbox.setChecked(job.enabled)
+            self.skip_unchanged_checkbox.setChecked(job.skip_unchanged)
+            self.timeout_input.setValue(job.timeout // 60)
+            self.read_data_subsets_input.setValue(job.read_data_subsets)
+            self.prune_threshold_input.setValue(job.prune_threshold)
+            self.prune_budget_input.setValue(job.prune_budget // 60)
         else:
             # Default schedule example
             self.schedule_input.setPlaceholderText("e.g., 0 2 * * * or interval:1h")
-            self.directory_input.setPlaceholderText("/home/user/documents")
+            self.files_from_input.setPlaceholderText(self.tr("optional: file with one path or glob per line"))
             self.additional_args_input.setPlaceholderText("e.g., --exclude-file /path/to/exclude.txt")
+        self.stdin_command_input.setPlaceholderText("e.g., pg_dump mydb")
+        self.stdin_filename_input.setPlaceholderText(self.tr("default: job name"))
         
         # Add fields to form
         layout.addRow(self.tr("Name:"), self.name_input)
@@ -116,17 +173,34 @@ class JobDialog(QDialog):
         layout.addRow(self.tr("Schedule:"), self.schedule_input)
         
         # Add help text for schedule
-        help_label = QLabel(self.tr("Cron format: '0 2 * * *' (2 AM daily)\nInterval: 'interval:1h', 'interval:30m', 'interval:1d'"))
+        help_label = QLabel(self.tr("Cron format: '0 2 * * *' (2 AM daily)\nInterval: 'interval:1h', 'interval:30m', 'interval:1d'\nChanged files: 'watch:60s' or 'watch:60s,15m|0 2 * * *' (plus full backups)"))
         help_label.setStyleSheet("color: gray; font-size: 10px;")
         layout.addRow("", help_label)
         
-        # Directory with browse button
-        directory_layout = QHBoxLayout()
-        directory_layout.addWidget(self.directory_input)
-        directory_layout.addWidget(self.directory_browse_btn)
-        layout.addRow(self.tr("Directory to Backup:"), directory_layout)
+        # Paths with add/remove buttons
+        paths_layout = QHBoxLayout()
+        paths_layout.addWidget(self.paths_list)
+        paths_buttons_layout = QVBoxLayout()
+        paths_buttons_layout.addWidget(self.add_directory_btn)
+        paths_buttons_layout.addWidget(self.add_path_btn)
+        paths_buttons_layout.addWidget(self.remove_path_btn)
+        paths_buttons_layout.addStretch()
+        paths_layout.addLayout(paths_buttons_layout)
+        layout.addRow(self.tr("Paths to Backup:"), paths_layout)
+        
+        files_from_layout = QHBoxLayout()
+        files_from_layout.addWidget(self.files_from_input)
+        files_from_layout.addWidget(self.files_from_browse_btn)
+        layout.addRow(self.tr("Paths From File:"), files_from_layout)
+        layout.addRow(self.tr("Producer Command:"), self.stdin_command_input)
+        layout.addRow(self.tr("Stdin Filename:"), self.stdin_filename_input)
         
         layout.addRow(self.tr("Additional Arguments:"), self.additional_args_input)
+        layout.addRow(self.tr("Timeout:"), self.timeout_input)
+        layout.addRow(self.tr("Verify All Data Over:"), self.read_data_subsets_input)
+        layout.addRow(self.tr("Prune Above:"), self.prune_threshold_input)
+        layout.addRow(self.tr("Prune Time Budget:"), self.prune_budget_input)
+        layout.addRow("", self.skip_unchanged_checkbox)
         layout.addRow(self.tr("Enabled"), self.enabled_checkbox)
         
         # Add buttons
@@ -137,28 +211,82 @@ class JobDialog(QDialog):
         buttons.rejected.connect(self.reject)
         layout.addRow(buttons)
     
+    def _add_path_item(self, path: str) -> QListWidgetItem:
+        item = QListWidgetItem(path)
+        item.setFlags(item.flags() | Qt.ItemIsEditable)
+        self.paths_list.addItem(item)
+        return item
+    
+    def _paths(self) -> list[str]:
+        """Get the non-empty paths of the list"""
+        paths = [self.paths_list.item(i).text().strip() for i in range(self.paths_list.count())]
+        return [path for path in paths if path]
+    
     def browse_directory(self):
-        """Open file dialog to select a directory"""
+        """Open file dialog to add a directory"""
+        paths = self._paths()
         directory = QFileDialog.getExistingDirectory(
             self,
             self.tr("Select Directory to Backup"),
-            self.directory_input.text() or str(Path.home()),
+            paths[-1] if paths else str(Path.home()),
             QFileDialog.ShowDirsOnly
         )
-        if directory:
-            self.directory_input.setText(directory)
+        if directory and directory not in paths:
+            self._add_path_item(directory)
+    
+    def add_path(self):
+        """Add an empty path and start editing it"""
+        item = self._add_path_item("")
+        self.paths_list.setCurrentItem(item)
+        self.paths_list.editItem(item)
+    
+    def remove_path(self):
+        """Remove the selected path"""
+        row = self.paths_list.currentRow()
+        if row >= 0:
+            self.paths_list.takeItem(row)
+    
+    def browse_files_from(self):
+        """Open file dialog to select a path list file"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self,
+            self.tr("Select Path List"),
+            self.files_from_input.text() or str(Path.home())
+        )
+        if file_path:
+            self.files_from_input.setText(file_path)
     
     def get_job(self) -> Job:
         """Get the job data from the dialog"""
-        return Job(
+        paths = self._paths()
+        values = dict(
             name=self.name_input.text().strip(),
             target_repo=self.repository_combo.currentText(),
             type=self.type_combo.currentText(),
             schedule=self.schedule_input.text().strip(),
             additional_args=self.additional_args_input.text().strip(),
-            directory=self.directory_input.text().strip(),
-            enabled=self.enabled_checkbox.isChecked()
+            # A single path is stored in `directory` like before, so older versions can read the job
+            directory=paths[0] if paths else "",
+            paths=paths if len(paths) > 1 else [],
+            files_from=self.files_from_input.text().strip(),
+            stdin_command=self.stdin_command_input.text().strip(),
+            stdin_filename=self.stdin_filename_input.text().strip(),
+            enabled=self.enabled_checkbox.isChecked(),
+            skip_unchanged=self.skip_unchanged_checkbox.isChecked(),
+            timeout=self.timeout_input.value() * 60,
+            read_data_subsets=self.read_data_subsets_input.value(),
+            prune_threshold=self.prune_threshold_input.value(),
+            prune_budget=self.prune_budget_input.value() * 60
         )
+        # Keep settings that are not editable in the dialog
+        if self.job:
+            # Keep a timeout set in seconds in jobs.json unless it was changed
+            if self.timeout_input.value() == self.job.timeout // 60:
+                values["timeout"] = self.job.timeout
+            if self.prune_budget_input.value() == self.job.prune_budget // 60:
+                values["prune_budget"] = self.job.prune_budget
+            return replace(self.job, **values)
+        return Job(**values)
 
 class RepositoryDialog(QDialog):
     """Dialog for adding or editing a repository"""
@@ -175,6 +303,8 @@ class RepositoryDialog(QDialog):
         self.url_input = QLineEdit()
         self.password_input = QLineEdit()
         self.password_input.setEchoMode(QLineEdit.Password)
+        self.password_source_input = QLineEdit()
+        self.password_source_input.setPlaceholderText(self.tr("optional: keyring, file:/path or command:..."))
         
         # If editing, populate fields
         if repository:
@@ -182,11 +312,17 @@ class RepositoryDialog(QDialog):
             self.name_input.setReadOnly(True)  # Don't allow changing name
             self.url_input.setText(repository.url)
             self.password_input.setText(repository.password)
+            self.password_source_input.setText(repository.password_source)
         
         # Add fields to form
         layout.addRow(self.tr("Name:"), self.name_input)
         layout.addRow(self.tr("URL/Path:"), self.url_input)
         layout.addRow(self.tr("Password:"), self.password_input)
+        layout.addRow(self.tr("Password Source:"), self.password_source_input)
+        
+        help_label = QLabel(self.tr("Leave empty to use the password above.\nkeyring: system keyring, service 'restictray', user = repository name"))
+        help_label.setStyleSheet("color: gray; font-size: 10px;")
+        layout.addRow("", help_label)
         
         # Add buttons
         buttons = QDialogButtonBox(
@@ -201,8 +337,448 @@ class RepositoryDialog(QDialog):
         return Repository(
             name=self.name_input.text().strip(),
             url=self.url_input.text().strip(),
-            password=self.password_input.text()
+            password=self.password_input.text(),
+            password_source=self.password_source_input.text().strip()
+        )
+
+class DiffModel(QAbstractTableModel):
+    """Virtual table of a SnapshotDiff; only the rows matching the filter are indexed"""
+    def __init__(self, diff: snapshot_diff.SnapshotDiff, parent=None):
+        super().__init__(parent)
+        self.diff = diff
+        self.rows: list[int] = []  # indexes into diff.paths
+        self.scanned = 0  # entries of the diff that were filtered
+        self.modifiers = set(snapshot_diff.ADDED + snapshot_diff.REMOVED + snapshot_diff.MODIFIED)
+        self.prefix = ""
+        self.columns = [self.tr("Change"), self.tr("Path"), self.tr("Size")]
+        self.labels = {
+            "+": self.tr("Added"), "-": self.tr("Removed"), "M": self.tr("Modified"),
+            "T": self.tr("Type changed"), "U": self.tr("Metadata changed"), "?": self.tr("Bitrot?"),
+        }
+    
+    def _matches(self, start: int, end: int) -> list[int]:
+        paths = self.diff.paths
+        modifiers = self.diff.modifiers
+        wanted = self.modifiers
+        prefix = self.prefix
+        return [i for i in range(start, end) if modifiers[i] in wanted and paths[i].startswith(prefix)]
+    
+    def update(self):
+        """Add the rows of entries restic printed since the last call"""
+        end = len(self.diff.paths)
+        if end == self.scanned:
+            return
+        new_rows = self._matches(self.scanned, end)
+        self.scanned = end
+        if new_rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(new_rows) - 1)
+            self.rows.extend(new_rows)
+            self.endInsertRows()
+    
+    def set_filter(self, modifiers: set[str], prefix: str):
+        """Show the entries with one of ``modifiers`` below ``prefix``"""
+        self.beginResetModel()
+        self.modifiers = modifiers
+        self.prefix = prefix
+        self.scanned = len(self.diff.paths)
+        self.rows = self._matches(0, self.scanned)
+        self.endResetModel()
+    
+    def sizes_changed(self):
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 2), self.index(len(self.rows) - 1, 2))
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        entry = self.rows[index.row()]
+        if index.column() == 0:
+            modifier = self.diff.modifiers[entry]
+            return self.labels.get(modifier, modifier)
+        if index.column() == 1:
+            return self.diff.paths[entry]
+        if self.diff.sizes is None or self.diff.paths[entry].endswith("/"):
+            return ""
+        return format_size(self.diff.sizes[entry])
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.columns[section]
+        return None
+
+class DiffDialog(QDialog):
+    """Shows the changes between two snapshots while restic diff streams them"""
+    # Directories listed, the largest changes first
+    DIRECTORY_ROWS = 1000
+    
+    def __init__(self, repository: Repository, source: dict, target: dict, parent=None):
+        super().__init__(parent)
+        self.repository = repository
+        self.setWindowTitle(self.tr("Changes from %1 to %2").replace("%1", source.get("short_id", source["id"][:8]))
+                            .replace("%2", target.get("short_id", target["id"][:8])))
+        self.resize(1000, 600)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.diff = snapshot_diff.get(repository, source["id"], target["id"])
+        self._sizes_task: asyncio.Task|None = None
+        self._closed = False
+        
+        layout = QVBoxLayout(self)
+        
+        # Filters
+        filter_layout = QHBoxLayout()
+        self.added_checkbox = QCheckBox(self.tr("Added"))
+        self.removed_checkbox = QCheckBox(self.tr("Removed"))
+        self.modified_checkbox = QCheckBox(self.tr("Modified"))
+        for checkbox in (self.added_checkbox, self.removed_checkbox, self.modified_checkbox):
+            checkbox.setChecked(True)
+            checkbox.toggled.connect(self.apply_filter)
+            filter_layout.addWidget(checkbox)
+        self.all_directories_btn = QPushButton(self.tr("All Directories"))
+        self.all_directories_btn.clicked.connect(self.show_all_directories)
+        filter_layout.addWidget(self.all_directories_btn)
+        self.status_label = QLabel()
+        filter_layout.addWidget(self.status_label, 1)
+        layout.addLayout(filter_layout)
+        
+        splitter = QSplitter()
+        
+        # Per-directory totals, once the sizes are known
+        self.directory_table = QTableWidget()
+        self.directory_table.setColumnCount(5)
+        self.directory_table.setHorizontalHeaderLabels([
+            self.tr("Directory"), self.tr("Entries"), self.tr("Added"), self.tr("Removed"), self.tr("Modified")
+        ])
+        self.directory_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.directory_table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.directory_table.setSelectionMode(QTableWidget.SingleSelection)
+        self.directory_table.verticalHeader().setVisible(False)
+        self.directory_table.itemSelectionChanged.connect(self.apply_filter)
+        splitter.addWidget(self.directory_table)
+        
+        # Entries; the view only creates the visible rows, so millions are fine
+        self.model = DiffModel(self.diff, self)
+        self.entries_view = QTableView()
+        self.entries_view.setModel(self.model)
+        self.entries_view.verticalHeader().setVisible(False)
+        self.entries_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.entries_view.horizontalHeader().setStretchLastSection(False)
+        self.entries_view.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.entries_view.setSelectionBehavior(QTableView.SelectRows)
+        splitter.addWidget(self.entries_view)
+        splitter.setSizes([350, 650])
+        layout.addWidget(splitter)
+        
+        self.finished.connect(self._on_finished)
+        
+        # New entries are picked up a few times per second rather than per line
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(200)
+        self.poll_timer.timeout.connect(self.poll)
+        self.poll_timer.start()
+        self.poll()
+    
+    def poll(self):
+        """Show new entries and the progress of the diff"""
+        self.model.update()
+        count = len(self.diff.paths)
+        if self.diff.error:
+            self.poll_timer.stop()
+            self.status_label.setText(self.tr("%1 changes, restic diff failed: %2")
+                                      .replace("%1", str(count)).replace("%2", self.diff.error))
+        elif not self.diff.complete:
+            self.status_label.setText(self.tr("%1 changes so far...").replace("%1", str(count)))
+        else:
+            self.poll_timer.stop()
+            if self.diff.directories is not None:
+                self._show_directories()
+            elif self._sizes_task is None:
+                self.status_label.setText(self.tr("%1 changes, loading sizes...").replace("%1", str(count)))
+                self._sizes_task = asyncio.ensure_future(self._compute_sizes())
+    
+    async def _compute_sizes(self):
+        try:
+            await snapshot_diff.compute_sizes(self.repository, self.diff)
+        except RuntimeError as e:
+            if not self._closed:
+                self.status_label.setText(self.tr("%1 changes, sizes unavailable: %2")
+                                          .replace("%1", str(len(self.diff.paths))).replace("%2", str(e)))
+            return
+        if not self._closed:
+            self._show_directories()
+            self.model.sizes_changed()
+    
+    def _show_directories(self):
+        """List the directories with the most changed bytes"""
+        directories = sorted(self.diff.directories.items(), key=lambda item: item[1].total, reverse=True)
+        self.status_label.setText(self.tr("%1 changes in %2 directories")
+                                  .replace("%1", str(len(self.diff.paths))).replace("%2", str(len(directories))))
+        self.directory_table.blockSignals(True)
+        self.directory_table.setRowCount(0)
+        for row, (path, totals) in enumerate(directories[:self.DIRECTORY_ROWS]):
+            self.directory_table.insertRow(row)
+            for column, value in enumerate((path, str(totals.entries), format_size(totals.added),
+                                            format_size(totals.removed), format_size(totals.modified))):
+                self.directory_table.setItem(row, column, QTableWidgetItem(value))
+        self.directory_table.resizeColumnsToContents()
+        self.directory_table.blockSignals(False)
+    
+    def show_all_directories(self):
+        self.directory_table.clearSelection()
+    
+    def apply_filter(self):
+        """Filter the entries by change type and the selected directory"""
+        modifiers = set()
+        if self.added_checkbox.isChecked():
+            modifiers.update(snapshot_diff.ADDED)
+        if self.removed_checkbox.isChecked():
+            modifiers.update(snapshot_diff.REMOVED)
+        if self.modified_checkbox.isChecked():
+            modifiers.update(snapshot_diff.MODIFIED)
+        prefix = ""
+        selected = self.directory_table.selectedItems()
+        if selected:
+            directory = self.directory_table.item(selected[0].row(), 0).text()
+            prefix = directory.rstrip("/") + "/"
+        self.model.set_filter(modifiers, "" if prefix == "/" else prefix)
+    
+    def _on_finished(self):
+        self._closed = True
+        self.poll_timer.stop()
+        # An incomplete diff is not cached, so there is no point in finishing it
+        if not self.diff.complete:
+            snapshot_diff.cancel(self.diff)
+
+class RestoreDialog(QDialog):
+    """Non-modal progress of a restic restore, with throughput, ETA and cancel
+    
+    A single file whose node is known, and a directory exported as an
+    archive, are written with restic dump instead (see dump.py).
+    """
+    # Seconds of progress the throughput is averaged over
+    RATE_WINDOW = 10
+    
+    def __init__(self, repository: Repository, snapshot_id: str, file_paths: list[str], restore_dir: str,
+                 log: Callable[[str], None], parent=None, node: Optional[dict] = None, archive_path: str = ""):
+        """
+        Initialize the dialog
+        
+        Args:
+            repository: Repository to restore from
+            snapshot_id: ID of the snapshot
+            file_paths: Paths in the snapshot to restore
+            restore_dir: Directory the paths are restored into, with their full path
+            log: Called with messages for the log
+            parent: Parent widget
+            node: The `restic ls` node of the only path, to restore a file with restic dump
+            archive_path: Export the only path as a tar archive to this file instead
+        """
+        super().__init__(parent)
+        self.repository = repository
+        self.snapshot_id = snapshot_id
+        self.file_paths = file_paths
+        self.restore_dir = restore_dir
+        self.log = log
+        self.node = node if node is not None and node.get("type") == "file" else None
+        self.archive_path = archive_path
+        if archive_path:
+            self.setWindowTitle(self.tr("Export from %1").replace("%1", snapshot_id))
+        else:
+            self.setWindowTitle(self.tr("Restore from %1").replace("%1", snapshot_id))
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.resize(450, 200)
+        self.runner = ResticRunner(repository)
+        self.task: asyncio.Task|None = None
+        self._status: dict|None = None  # latest status message from restic
+        self._samples: deque[tuple[float, int]] = deque()  # (time, bytes restored)
+        self._closed = False
+        if len(file_paths) == 1:
+            self.description = "'" + file_paths[0] + "'"
+        else:
+            self.description = self.tr("%1 items").replace("%1", str(len(file_paths)))
+        
+        layout = QVBoxLayout(self)
+        if archive_path:
+            layout.addWidget(QLabel(self.tr("Exporting %1 to %2").replace("%1", self.description)
+                                    .replace("%2", archive_path)))
+        else:
+            layout.addWidget(QLabel(self.tr("Restoring %1 to %2").replace("%1", self.description)
+                                    .replace("%2", restore_dir)))
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        layout.addWidget(self.progress_bar)
+        self.files_label = QLabel()
+        self.bytes_label = QLabel()
+        self.rate_label = QLabel()
+        self.status_label = QLabel(self.tr("Starting restic..."))
+        self.status_label.setWordWrap(True)
+        for label in (self.files_label, self.bytes_label, self.rate_label, self.status_label):
+            layout.addWidget(label)
+        self.cancel_btn = QPushButton(self.tr("Cancel"))
+        self.cancel_btn.clicked.connect(self.cancel)
+        layout.addWidget(self.cancel_btn, 0, Qt.AlignRight)
+        
+        # restic prints status dozens of times per second, only the latest is shown
+        self.update_timer = QTimer(self)
+        self.update_timer.setInterval(250)
+        self.update_timer.timeout.connect(self.show_progress)
+    
+    def start(self):
+        """Show the dialog and start restic"""
+        self.show()
+        self.update_timer.start()
+        self.task = asyncio.ensure_future(self._run())
+    
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    def cancel(self):
+        """Stop restic; files restored so far are kept"""
+        if not self.running:
+            self.close()
+            return
+        self.runner.cancel()
+        self.cancel_btn.setEnabled(False)
+        self.status_label.setText(self.tr("Cancelling..."))
+    
+    def _on_message(self, data):
+        if isinstance(data, dict) and data.get("message_type") in ("status", "summary"):
+            self._status = data
+    
+    def show_progress(self):
+        """Show the latest status restic printed"""
+        data = self._status
+        if data is None:
+            return
+        bytes_restored = data.get("bytes_restored", 0)
+        total_bytes = data.get("total_bytes", 0)
+        if total_bytes:
+            self.progress_bar.setValue(int(bytes_restored * 1000 / total_bytes))
+            self.bytes_label.setText(self.tr("Data: %1 of %2").replace("%1", format_size(bytes_restored))
+                                     .replace("%2", format_size(total_bytes)))
+        else:
+            # The size of an archive is not known in advance
+            self.progress_bar.setRange(0, 0 if self.running else 1)
+            self.bytes_label.setText(self.tr("Data: %1").replace("%1", format_size(bytes_restored)))
+        if data.get("total_files"):
+            self.files_label.setText(self.tr("Files: %1 of %2").replace("%1", str(data.get("files_restored", 0)))
+                                     .replace("%2", str(data.get("total_files", 0))))
+        if not self.running:
+            return
+        now = asyncio.get_event_loop().time()
+        self._samples.append((now, bytes_restored))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.RATE_WINDOW:
+            self._samples.popleft()
+        elapsed = now - self._samples[0][0]
+        rate = (bytes_restored - self._samples[0][1]) / elapsed if elapsed > 0 else 0
+        if rate > 0 and total_bytes:
+            self.rate_label.setText(self.tr("%1/s, %2 remaining").replace("%1", format_size(rate))
+                                    .replace("%2", self._format_eta((total_bytes - bytes_restored) / rate)))
+        elif rate > 0:
+            self.rate_label.setText(self.tr("%1/s").replace("%1", format_size(rate)))
+        self.status_label.setText(self.tr("Restoring..."))
+    
+    def _format_eta(self, seconds: float) -> str:
+        seconds = int(seconds)
+        if seconds >= 3600:
+            return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+        if seconds >= 60:
+            return f"{seconds // 60}m {seconds % 60:02d}s"
+        return f"{seconds}s"
+    
+    async def _restore(self):
+        """Restore the paths with restic restore"""
+        includes = []
+        for file_path in self.file_paths:
+            includes += ['--include', file_path]
+        return await self.runner.stream(
+            '--json',
+            'restore',
+            self.snapshot_id,
+            '--target', self.restore_dir,
+            *includes,
+            on_json=self._on_message
         )
+    
+    async def _dump(self, target: str):
+        """Write the only path to ``target`` with restic dump"""
+        total_files = 1 if self.node else 0
+        total_bytes = self.node.get("size", 0) if self.node else 0
+        
+        def on_progress(written: int):
+            self._status = {"files_restored": 0, "total_files": total_files,
+                            "bytes_restored": written, "total_bytes": total_bytes}
+        
+        on_progress(0)
+        result = await dump(self.runner, self.snapshot_id, self.file_paths[0], target, self.node,
+                            "tar" if self.archive_path else "", on_progress)
+        if result.success:
+            self._status["files_restored"] = total_files
+        return result
+    
+    async def _run(self):
+        try:
+            if self.archive_path:
+                result = await self._dump(self.archive_path)
+            elif self.node:
+                # Where restic restore would put it
+                result = await self._dump(str(Path(self.restore_dir) / self.file_paths[0].lstrip('/')))
+            else:
+                result = await self._restore()
+        except Exception as e:
+            self.log(self.tr("Error restoring file: %1").replace("%1", str(e)))
+            self._finish(self.tr("An error occurred while restoring:\n%1").replace("%1", str(e)))
+            return
+        
+        if result.success and self.archive_path:
+            self.log(self.tr("Exported %1 to %2").replace("%1", self.description).replace("%2", self.archive_path))
+            self._finish(self.tr("Exported successfully to:\n%1").replace("%1", self.archive_path))
+        elif result.success:
+            self.log(self.tr("Successfully restored %1 to %2").replace("%1", self.description).replace("%2", self.restore_dir))
+            self._finish(self.tr("File(s) restored successfully to:\n%1").replace("%1", self.restore_dir))
+        elif result.status:
+            self.log(self.tr("Restore of %1 cancelled").replace("%1", self.description))
+            if self.node or self.archive_path:
+                self._finish(self.tr("Cancelled, nothing was written."))
+            else:
+                self._finish(self.tr("Cancelled. Files restored so far are kept in %1").replace("%1", self.restore_dir))
+        else:
+            error_msg = result.error_message()
+            self.log(self.tr("Failed to restore file: %1").replace("%1", error_msg))
+            self._finish(self.tr("Failed to restore file(s).\n\n%1").replace("%1", error_msg))
+    
+    def _finish(self, message: str):
+        if self._closed:
+            return
+        self.update_timer.stop()
+        self.show_progress()
+        self.rate_label.clear()
+        self.status_label.setText(message)
+        self.cancel_btn.setText(self.tr("Close"))
+        self.cancel_btn.setEnabled(True)
+    
+    def closeEvent(self, event):
+        """Ask before a running restore is cancelled by closing the dialog"""
+        if self.running and not self.runner.cancelled:
+            reply = QMessageBox.question(
+                self,
+                self.tr("Cancel Restore"),
+                self.tr("The restore is still running. Cancel it?"),
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                event.ignore()
+                return
+            self.runner.cancel()
+        self._closed = True
+        self.update_timer.stop()
+        event.accept()
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -220,13 +796,78 @@ class MainWindow(QMainWindow):
         
         # Initialize job scheduler
         self.scheduler = JobScheduler(self.storage, log_callback=self.log)
+        self.stats_refresher = StatsRefresher(self.storage, on_update=self.on_repository_stats_updated)
+        self.prewarmer = Prewarmer(self.storage)
+        
+        # Watch jobs.json so external edits are applied without a restart. The
+        # directory is watched too because editors and config management tools
+        # often replace the file, which drops the watch on the file itself.
+        self.jobs_watcher = QFileSystemWatcher(self)
+        self.jobs_watcher.addPath(str(self.storage.config_dir))
+        if self.storage.jobs_file.exists():
+            self.jobs_watcher.addPath(str(self.storage.jobs_file))
+        self.jobs_watcher.fileChanged.connect(self.on_jobs_file_changed)
+        self.jobs_watcher.directoryChanged.connect(self.on_jobs_file_changed)
+        self._jobs_file_key = self.storage._file_key(self.storage.jobs_file)
+        self.jobs_reload_timer = QTimer(self)
+        self.jobs_reload_timer.setSingleShot(True)
+        self.jobs_reload_timer.setInterval(1000)
+        self.jobs_reload_timer.timeout.connect(self.reload_jobs_file)
+        
+        # The tabs are built when the window is first shown, and each tab
+        # when it is first selected; until then the window is just a shell.
+        # Widgets of tabs that are not built yet are None.
+        self.tabs: QTabWidget|None = None
+        self._tab_builders: dict[QWidget, Callable[[QWidget], None]] = {}
+        self.history_table: QTableWidget|None = None
+        self.log_text: QTextEdit|None = None
+        self.repository_list: QListWidget|None = None
+        self.repository_stats_label: QLabel|None = None
+        self.job_list: QListWidget|None = None
+        self.browse_repo_combo: QComboBox|None = None
+        self._browse_snapshots: list = []  # snapshots in the rows of the snapshots table
+        # Log messages until the Dashboard tab exists
+        self._log_buffer: deque[str] = deque(maxlen=LOG_BUFFER_SIZE)
+        
+        globals.add_state_hook(lambda message: self.setWindowTitle(f"ResticTray - {message}"))
         
-        # Create tab widget
+        self.log("ResticTray started")
+    
+    def showEvent(self, event):
+        """Build the tabs when the window is shown for the first time"""
+        self.ensure_ui()
+        super().showEvent(event)
+    
+    def ensure_ui(self):
+        """Create the tab widget and build the current tab, if not done yet"""
+        if self.tabs is not None:
+            return
+        timeline.mark("building main window")
         self.tabs = QTabWidget()
         self.setCentralWidget(self.tabs)
-        
-        # Create Dashboard tab
-        dashboard_widget = QWidget()
+        for title, build in (
+            (self.tr("Dashboard"), self._build_dashboard_tab),
+            (self.tr("Repositories"), self._build_repositories_tab),
+            (self.tr("Jobs"), self._build_jobs_tab),
+            (self.tr("Browse"), self._build_browse_tab),
+        ):
+            page = QWidget()
+            self._tab_builders[page] = build
+            self.tabs.addTab(page, title)
+        self.tabs.currentChanged.connect(self.ensure_tab)
+        self.ensure_tab(self.tabs.currentIndex())
+        timeline.mark("main window built")
+    
+    def ensure_tab(self, index: int):
+        """Build the tab at ``index`` if it was not built yet"""
+        self.ensure_ui()
+        page = self.tabs.widget(index)
+        build = self._tab_builders.pop(page, None)
+        if build:
+            build(page)
+    
+    def _build_dashboard_tab(self, dashboard_widget: QWidget):
+        """Build the Dashboard tab and load the history"""
         dashboard_layout = QVBoxLayout(dashboard_widget)
         
         # History section
@@ -256,10 +897,13 @@ class MainWindow(QMainWindow):
         self.log_text.setReadOnly(True)
         dashboard_layout.addWidget(self.log_text)
         
-        self.tabs.addTab(dashboard_widget, self.tr("Dashboard"))
-        
-        # Create Repositories tab
-        repositories_widget = QWidget()
+        self.refresh_history()
+        for message in self._log_buffer:
+            self.log_text.append(message)
+        self._log_buffer.clear()
+    
+    def _build_repositories_tab(self, repositories_widget: QWidget):
+        """Build the Repositories tab and load the repositories"""
         repositories_layout = QVBoxLayout(repositories_widget)
         
         # Repository list
@@ -268,6 +912,12 @@ class MainWindow(QMainWindow):
         repositories_layout.addWidget(QLabel(self.tr("Configured Repositories:")))
         repositories_layout.addWidget(self.repository_list)
         
+        # Cached statistics of the selected repository
+        self.repository_stats_label = QLabel()
+        self.repository_stats_label.setWordWrap(True)
+        self.repository_stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        repositories_layout.addWidget(self.repository_stats_label)
+        
         # Buttons
         button_layout = QHBoxLayout()
         self.add_repo_btn = QPushButton(self.tr("Add Repository"))
@@ -281,18 +931,23 @@ class MainWindow(QMainWindow):
         self.unlock_repo_btn = QPushButton(self.tr("Unlock Repository"))
         self.unlock_repo_btn.clicked.connect(self.unlock_repository)
         self.unlock_repo_btn.setEnabled(False)
+        self.refresh_stats_btn = QPushButton(self.tr("Refresh Statistics"))
+        self.refresh_stats_btn.clicked.connect(self.refresh_repository_stats)
+        self.refresh_stats_btn.setEnabled(False)
         
         button_layout.addWidget(self.add_repo_btn)
         button_layout.addWidget(self.edit_repo_btn)
         button_layout.addWidget(self.delete_repo_btn)
         button_layout.addWidget(self.unlock_repo_btn)
+        button_layout.addWidget(self.refresh_stats_btn)
         button_layout.addStretch()
         
         repositories_layout.addLayout(button_layout)
-        self.tabs.addTab(repositories_widget, self.tr("Repositories"))
         
-        # Create Jobs tab
-        jobs_widget = QWidget()
+        self.refresh_repositories()
+    
+    def _build_jobs_tab(self, jobs_widget: QWidget):
+        """Build the Jobs tab and load the jobs"""
         jobs_layout = QVBoxLayout(jobs_widget)
         
         # Job list
@@ -314,18 +969,23 @@ class MainWindow(QMainWindow):
         self.run_job_btn = QPushButton(self.tr("Run Now"))
         self.run_job_btn.clicked.connect(self.run_job_now)
         self.run_job_btn.setEnabled(False)
+        self.cancel_job_btn = QPushButton(self.tr("Cancel Run"))
+        self.cancel_job_btn.clicked.connect(self.cancel_job_run)
+        self.cancel_job_btn.setEnabled(False)
         
         job_button_layout.addWidget(self.add_job_btn)
         job_button_layout.addWidget(self.edit_job_btn)
         job_button_layout.addWidget(self.delete_job_btn)
         job_button_layout.addWidget(self.run_job_btn)
+        job_button_layout.addWidget(self.cancel_job_btn)
         job_button_layout.addStretch()
         
         jobs_layout.addLayout(job_button_layout)
-        self.tabs.addTab(jobs_widget, self.tr("Jobs"))
         
-        # Create Browse tab
-        browse_widget = QWidget()
+        self.refresh_jobs()
+    
+    def _build_browse_tab(self, browse_widget: QWidget):
+        """Build the Browse tab and load the repositories to browse"""
         browse_layout = QVBoxLayout(browse_widget)
         
         # Repository selection for browsing
@@ -361,6 +1021,10 @@ class MainWindow(QMainWindow):
         self.snapshots_table.setSelectionBehavior(QTableWidget.SelectRows)
         self.snapshots_table.itemSelectionChanged.connect(self.on_snapshot_selected)
         snapshots_layout.addWidget(self.snapshots_table)
+        self.compare_snapshots_btn = QPushButton(self.tr("Compare Selected Snapshots"))
+        self.compare_snapshots_btn.clicked.connect(self.compare_snapshots)
+        self.compare_snapshots_btn.setEnabled(False)
+        snapshots_layout.addWidget(self.compare_snapshots_btn)
         
         browse_splitter.addWidget(snapshots_widget)
         
@@ -373,6 +1037,7 @@ class MainWindow(QMainWindow):
         self.files_tree = QTreeWidget()
         self.files_tree.setHeaderLabels([self.tr("Name"), self.tr("Type"), self.tr("Size")])
         self.files_tree.setColumnWidth(0, 400)
+        self.files_tree.setSelectionMode(QTreeWidget.ExtendedSelection)
         self.files_tree.setContextMenuPolicy(Qt.CustomContextMenu)
         self.files_tree.customContextMenuRequested.connect(self.show_file_context_menu)
         files_layout.addWidget(self.files_tree)
@@ -384,31 +1049,50 @@ class MainWindow(QMainWindow):
         
         browse_layout.addWidget(browse_splitter)
         
-        self.tabs.addTab(browse_widget, self.tr("Browse"))
-        
-        # Load repositories, jobs, and history
-        self.refresh_repositories()
-        self.refresh_jobs()
-        self.refresh_history()
         self.refresh_browse_repos()
-        
-        self.log("ResticTray started")
     
     def log(self, message: str):
         """Append a message to the log"""
+        if self.log_text is None:
+            self._log_buffer.append(message)
+            return
         self.log_text.append(message)
     
     def start_scheduler(self):
-        """Start the job scheduler"""
+        """Start the job scheduler and the background refreshers"""
         self.scheduler.load_and_schedule_all_jobs()
         self.scheduler.start()
+        self.stats_refresher.start()
+        self.prewarmer.start()
     
     def stop_scheduler(self):
-        """Stop the job scheduler"""
+        """Stop the job scheduler and the background refreshers"""
+        self.prewarmer.stop()
+        self.stats_refresher.stop()
         self.scheduler.shutdown()
     
+    def on_jobs_file_changed(self, path: str):
+        """Debounce changes to jobs.json, writers often touch it several times"""
+        self.jobs_reload_timer.start()
+    
+    def reload_jobs_file(self):
+        """Apply changes to jobs.json made outside of the application"""
+        jobs_file = str(self.storage.jobs_file)
+        if self.storage.jobs_file.exists() and jobs_file not in self.jobs_watcher.files():
+            self.jobs_watcher.addPath(jobs_file)
+        
+        file_key = self.storage._file_key(self.storage.jobs_file)
+        if file_key == self._jobs_file_key:
+            return
+        
+        if self.scheduler.reconcile():
+            self._jobs_file_key = file_key
+            self.refresh_jobs()
+    
     def refresh_repositories(self):
         """Refresh the repository list"""
+        if self.repository_list is None:
+            return  # loaded when the tab is built
         self.repository_list.clear()
         repositories = self.storage.load_repositories()
         for repo in repositories:
@@ -420,6 +1104,56 @@ class MainWindow(QMainWindow):
         self.edit_repo_btn.setEnabled(has_selection)
         self.delete_repo_btn.setEnabled(has_selection)
         self.unlock_repo_btn.setEnabled(has_selection)
+        self.refresh_stats_btn.setEnabled(has_selection)
+        self.show_repository_stats()
+    
+    def _selected_repository_name(self) -> str|None:
+        selected_items = self.repository_list.selectedItems()
+        if not selected_items:
+            return None
+        return selected_items[0].text().split(" (")[0]
+    
+    def show_repository_stats(self):
+        """Show the cached statistics of the selected repository"""
+        if self.repository_stats_label is None:
+            return
+        repo_name = self._selected_repository_name()
+        if repo_name is None:
+            self.repository_stats_label.setText("")
+            return
+        stats = self.storage.get_repository_stats(repo_name)
+        if stats is None:
+            self.repository_stats_label.setText(self.tr("No statistics yet, they are collected in the background."))
+            return
+        lines = []
+        if stats.updated:
+            last_backup = stats.last_backup[:16].replace("T", " ") or self.tr("none")
+            dedup = stats.restore_size / stats.uncompressed_size if stats.uncompressed_size else 0
+            lines += [
+                self.tr("Snapshots: %1, last backup: %2").replace("%1", str(stats.snapshots)).replace("%2", last_backup),
+                self.tr("Stored: %1 (%2 uncompressed, %3 blobs)").replace("%1", format_size(stats.raw_size))
+                    .replace("%2", format_size(stats.uncompressed_size)).replace("%3", str(stats.blob_count)),
+                self.tr("Restore size of all snapshots: %1 in %2 files, deduplication %3x")
+                    .replace("%1", format_size(stats.restore_size)).replace("%2", str(stats.file_count))
+                    .replace("%3", f"{dedup:.1f}"),
+                self.tr("Updated: %1").replace("%1", stats.updated[:16].replace("T", " ")),
+            ]
+        if stats.error:
+            lines.append(self.tr("Last refresh failed: %1").replace("%1", stats.error))
+        self.repository_stats_label.setText("\n".join(lines))
+    
+    def refresh_repository_stats(self):
+        """Refresh the statistics of the selected repository in the background"""
+        repo_name = self._selected_repository_name()
+        if repo_name is None:
+            return
+        self.log(self.tr("Refreshing statistics of repository: %1...").replace("%1", repo_name))
+        self.stats_refresher.request(repo_name)
+    
+    def on_repository_stats_updated(self, stats: RepositoryStats):
+        """Show new statistics if their repository is selected"""
+        if self.repository_list is not None and self._selected_repository_name() == stats.name:
+            self.show_repository_stats()
     
     def add_repository(self):
         """Open dialog to add a new repository"""
@@ -455,6 +1189,7 @@ class MainWindow(QMainWindow):
         if dialog.exec() == QDialog.Accepted:
             updated_repo = dialog.get_repository()
             if self.storage.update_repository(repo_name, updated_repo):
+                credentials.clear_cache()
                 self.refresh_repositories()
                 self.refresh_browse_repos()
                 self.log(self.tr("Updated repository: %1").replace("%1", repo_name))
@@ -510,18 +1245,9 @@ class MainWindow(QMainWindow):
     async def _unlock_repository_async(self, repository: Repository):
         """Async task to unlock repository"""
         try:
-            process = await asyncio.create_subprocess_exec(
-                'restic',
-                '-r', repository.url,
-                '--password-command', f"echo '{repository.password}'",
-                'unlock',
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            result = await ResticRunner(repository).run('unlock')
             
-            if process.returncode == 0:
+            if result.success:
                 self.log(self.tr("Repository '%1' unlocked successfully").replace("%1", repository.name))
                 QMessageBox.information(
                     self,
@@ -529,7 +1255,7 @@ class MainWindow(QMainWindow):
                     self.tr("Repository '%1' has been unlocked.").replace("%1", repository.name)
                 )
             else:
-                error_msg = stderr.decode() if stderr else "Unknown error"
+                error_msg = result.error_message()
                 self.log(self.tr("Failed to unlock repository '%1': %2").replace("%1", repository.name).replace("%2", error_msg))
                 QMessageBox.warning(
                     self,
@@ -547,6 +1273,8 @@ class MainWindow(QMainWindow):
     # Job management methods
     def refresh_jobs(self):
         """Refresh the job list"""
+        if self.job_list is None:
+            return  # loaded when the tab is built
         self.job_list.clear()
         jobs = self.storage.load_jobs()
         for job in jobs:
@@ -555,6 +1283,8 @@ class MainWindow(QMainWindow):
     
     def refresh_browse_repos(self):
         """Refresh the repository combo box in Browse tab"""
+        if self.browse_repo_combo is None:
+            return  # loaded when the tab is built
         self.browse_repo_combo.clear()
         repositories = self.storage.load_repositories()
         for repo in repositories:
@@ -564,10 +1294,12 @@ class MainWindow(QMainWindow):
         """Handle repository selection change in Browse tab"""
         # Clear snapshots and files when repository changes
         self.snapshots_table.setRowCount(0)
+        self._browse_snapshots = []
         self.files_tree.clear()
     
     def on_snapshot_selected(self):
         """Handle snapshot selection change"""
+        self.compare_snapshots_btn.setEnabled(len(self.snapshots_table.selectionModel().selectedRows()) == 2)
         selected_items = self.snapshots_table.selectedItems()
         if not selected_items:
             self.files_tree.clear()
@@ -613,30 +1345,22 @@ class MainWindow(QMainWindow):
         """Async task to load snapshots"""
         async with LoadingDialog(self, "Loading..."):
             try:
-                process = await asyncio.create_subprocess_exec(
-                    'restic',
-                    '-r', repository.url,
-                    '--password-command', f"echo '{repository.password}'",
-                    '--json',
-                    'snapshots',
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
+                # Usually prewarmed after the last backup, see prewarm.py
+                snapshots = await snapshot_cache.get(repository)
+                self._display_snapshots(snapshots)
+                self.log(self.tr("Loaded %1 snapshots").replace("%1", str(len(snapshots))))
+                # Open the newest snapshot right away if its files are cached
+                newest = max(range(len(snapshots)), key=lambda row: snapshots[row].get('time', ''), default=None)
+                if newest is not None and snapshot_cache.cached_listing(repository.name, snapshots[newest].get('id', '')) is not None:
+                    self.snapshots_table.selectRow(newest)
+            except RuntimeError as e:
+                error_msg = str(e)
+                self.log(self.tr("Failed to load snapshots: %1").replace("%1", error_msg))
+                QMessageBox.warning(
+                    self,
+                    self.tr("Snapshots Load Failed"),
+                    self.tr("Failed to load snapshots.\n\n%1").replace("%1", error_msg)
                 )
-                
-                stdout, stderr = await process.communicate()
-                
-                if process.returncode == 0:
-                    snapshots = json.loads(stdout.decode())
-                    self._display_snapshots(snapshots)
-                    self.log(self.tr("Loaded %1 snapshots").replace("%1", str(len(snapshots))))
-                else:
-                    error_msg = stderr.decode() if stderr else "Unknown error"
-                    self.log(self.tr("Failed to load snapshots: %1").replace("%1", error_msg))
-                    QMessageBox.warning(
-                        self,
-                        self.tr("Snapshots Load Failed"),
-                        self.tr("Failed to load snapshots.\n\n%1").replace("%1", error_msg)
-                    )
             except Exception as e:
                 self.log(self.tr("Error loading snapshots: %1").replace("%1", str(e)))
                 QMessageBox.warning(
@@ -645,9 +1369,20 @@ class MainWindow(QMainWindow):
                     self.tr("An error occurred while loading snapshots:\n%1").replace("%1", str(e))
                 )
     
+    def compare_snapshots(self):
+        """Show the changes between the two selected snapshots, from the older one"""
+        rows = [index.row() for index in self.snapshots_table.selectionModel().selectedRows()]
+        repo = self.storage.get_repository(self.browse_repo_combo.currentText())
+        if len(rows) != 2 or not repo or max(rows) >= len(self._browse_snapshots):
+            return
+        source, target = sorted((self._browse_snapshots[row] for row in rows), key=lambda snapshot: snapshot.get('time', ''))
+        self.log(self.tr("Comparing snapshots %1 and %2...").replace("%1", source['id'][:8]).replace("%2", target['id'][:8]))
+        DiffDialog(repo, source, target, self).show()
+    
     def _display_snapshots(self, snapshots: list):
         """Display snapshots in the table"""
         self.snapshots_table.setRowCount(0)
+        self._browse_snapshots = list(snapshots)
         
         for snapshot in snapshots:
             row_position = self.snapshots_table.rowCount()
@@ -679,40 +1414,17 @@ class MainWindow(QMainWindow):
         """Async task to load files from a snapshot"""
         async with LoadingDialog(self, "Loading..."):
             try:
-                process = await asyncio.create_subprocess_exec(
-                    'restic',
-                    '-r', repository.url,
-                    '--password-command', f"echo '{repository.password}'",
-                    'ls',
-                    snapshot_id,
-                    '--json',
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
+                files = await snapshot_cache.get_listing(repository, snapshot_id)
+                self.log(self.tr("Loaded files for snapshot %1").replace("%1", snapshot_id))
+                self._display_files(files)
+            except RuntimeError as e:
+                error_msg = str(e)
+                self.log(self.tr("Failed to load snapshot files: %1").replace("%1", error_msg))
+                QMessageBox.warning(
+                    self,
+                    self.tr("Snapshot Files Load Failed"),
+                    self.tr("Failed to load snapshot files.\n\n%1").replace("%1", error_msg)
                 )
-                
-                stdout, stderr = await process.communicate()
-                
-                if process.returncode == 0:
-                    files_data = stdout.decode()
-                    # Parse JSON lines
-                    files = []
-                    for line in files_data.strip().split('\n'):
-                        if line:
-                            try:
-                                files.append(json.loads(line))
-                            except json.JSONDecodeError:
-                                continue
-                    
-                    self.log(self.tr("Loaded files for snapshot %1").replace("%1", snapshot_id))
-                    self._display_files(files)
-                else:
-                    error_msg = stderr.decode() if stderr else "Unknown error"
-                    self.log(self.tr("Failed to load snapshot files: %1").replace("%1", error_msg))
-                    QMessageBox.warning(
-                        self,
-                        self.tr("Snapshot Files Load Failed"),
-                        self.tr("Failed to load snapshot files.\n\n%1").replace("%1", error_msg)
-                    )
             except Exception as e:
                 self.log(self.tr("Error loading snapshot files: %1").replace("%1", str(e)))
                 QMessageBox.warning(
@@ -797,43 +1509,49 @@ class MainWindow(QMainWindow):
         if not item:
             return
         
+        # Restore the selection if the click was on it, otherwise the clicked item
+        items = self.files_tree.selectedItems()
+        if item not in items:
+            items = [item]
+        
         menu = QMenu()
-        restore_action = QAction(self.tr("Restore"), self)
-        restore_action.triggered.connect(lambda: self.restore_file(item))
+        if len(items) == 1:
+            restore_action = QAction(self.tr("Restore"), self)
+        else:
+            restore_action = QAction(self.tr("Restore %1 Selected Items").replace("%1", str(len(items))), self)
+        restore_action.triggered.connect(lambda: self.restore_files(items))
         menu.addAction(restore_action)
+        if len(items) == 1 and (item.childCount() or item.text(1) == self.tr("Directory")):
+            export_action = QAction(self.tr("Export as tar..."), self)
+            export_action.triggered.connect(lambda: self.export_archive(item))
+            menu.addAction(export_action)
         
         menu.exec(self.files_tree.viewport().mapToGlobal(position))
     
-    def restore_file(self, item: QTreeWidgetItem):
-        """Restore the selected file or folder"""
-        # Get the full path by traversing up the tree
+    def _file_item_path(self, item: QTreeWidgetItem) -> str:
+        """Full path of a file tree item in the snapshot"""
         path_parts = []
         current = item
         while current:
             path_parts.insert(0, current.text(0))
             current = current.parent()
-        
-        file_path = '/' + '/'.join(path_parts)
-        
-        # Get selected snapshot
-        selected_row = self.snapshots_table.currentRow()
-        if selected_row < 0:
-            QMessageBox.warning(self, "No Snapshot", "Please select a snapshot first.")
-            return
-        
-        snapshot_id_item = self.snapshots_table.item(selected_row, 0)
-        if not snapshot_id_item:
-            return
-        
-        snapshot_id = snapshot_id_item.text()
-        repo_name = self.browse_repo_combo.currentText()
-        
-        if not repo_name:
+        return '/' + '/'.join(path_parts)
+    
+    def restore_files(self, items: list[QTreeWidgetItem]):
+        """Restore the selected files and folders with one restic restore"""
+        paths = sorted({self._file_item_path(item) for item in items})
+        # A selected folder is restored with everything in it
+        file_paths = []
+        for path in paths:
+            if not any(path.startswith(parent + '/') for parent in file_paths):
+                file_paths.append(path)
+        if not file_paths:
             return
         
-        repo = self.storage.get_repository(repo_name)
-        if not repo:
+        selection = self._selected_browse_snapshot()
+        if selection is None:
             return
+        repo, snapshot_id = selection
         
         # Ask user for restore location
         restore_dir = QFileDialog.getExistingDirectory(
@@ -846,60 +1564,68 @@ class MainWindow(QMainWindow):
         if not restore_dir:
             return
         
+        if len(file_paths) == 1:
+            description = "'" + file_paths[0] + "'"
+        else:
+            description = self.tr("%1 items").replace("%1", str(len(file_paths)))
         reply = QMessageBox.question(
             self,
             self.tr("Confirm Restore"),
-            self.tr("Restore '%1' from snapshot %2 to:\n%3\n\nThis will overwrite existing files with the same name.").replace("%1", file_path).replace("%2", snapshot_id).replace("%3", restore_dir),
+            self.tr("Restore %1 from snapshot %2 to:\n%3\n\nThis will overwrite existing files with the same name.").replace("%1", description).replace("%2", snapshot_id).replace("%3", restore_dir),
             QMessageBox.Yes | QMessageBox.No
         )
         
         if reply == QMessageBox.Yes:
-            self.log(self.tr("Restoring '%1' from snapshot %2 to %3...").replace("%1", file_path).replace("%2", snapshot_id).replace("%3", restore_dir))
-            asyncio.create_task(self._restore_file_async(repo, snapshot_id, file_path, restore_dir))
+            self.log(self.tr("Restoring %1 from snapshot %2 to %3...").replace("%1", description).replace("%2", snapshot_id).replace("%3", restore_dir))
+            # A single file is written with restic dump if the listing has its size
+            node = None
+            listing = snapshot_cache.cached_listing(repo.name, snapshot_id)
+            if len(file_paths) == 1 and listing is not None:
+                node = find_node(listing, file_paths[0])
+            RestoreDialog(repo, snapshot_id, file_paths, restore_dir, self.log, self, node=node).start()
     
-    async def _restore_file_async(self, repository: Repository, snapshot_id: str, file_path: str, restore_dir: str):
-        """Async task to restore a file or folder"""
-        async with LoadingDialog(self, "Restoring..."):
-            try:
-                process = await asyncio.create_subprocess_exec(
-                    'restic',
-                    '-r', repository.url,
-                    '--password-command', f"echo '{repository.password}'",
-                    'restore',
-                    snapshot_id,
-                    '--target', restore_dir,
-                    '--include', file_path,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                
-                stdout, stderr = await process.communicate()
-                
-                if process.returncode == 0:
-                    self.log(self.tr("Successfully restored '%1' to %2").replace("%1", file_path).replace("%2", restore_dir))
-                    QMessageBox.information(
-                        self,
-                        self.tr("Restore Successful"),
-                        self.tr("File(s) restored successfully to:\n%1").replace("%1", restore_dir)
-                    )
-                else:
-                    error_msg = stderr.decode() if stderr else "Unknown error"
-                    self.log(self.tr("Failed to restore file: %1").replace("%1", error_msg))
-                    QMessageBox.warning(
-                        self,
-                        self.tr("Restore Failed"),
-                        self.tr("Failed to restore file(s).\n\n%1").replace("%1", error_msg)
-                    )
-            except Exception as e:
-                self.log(self.tr("Error restoring file: %1").replace("%1", str(e)))
-                QMessageBox.warning(
-                    self,
-                    self.tr("Error"),
-                    self.tr("An error occurred while restoring:\n%1").replace("%1", str(e))
-                )
+    def export_archive(self, item: QTreeWidgetItem):
+        """Export a folder as a tar archive with restic dump"""
+        selection = self._selected_browse_snapshot()
+        if selection is None:
+            return
+        repo, snapshot_id = selection
+        path = self._file_item_path(item)
+        archive_path, _ = QFileDialog.getSaveFileName(
+            self,
+            self.tr("Export as tar"),
+            str(Path.home() / f"{item.text(0)}.tar"),
+            self.tr("tar archives (*.tar)")
+        )
+        if not archive_path:
+            return
+        self.log(self.tr("Exporting '%1' from snapshot %2 to %3...").replace("%1", path).replace("%2", snapshot_id).replace("%3", archive_path))
+        RestoreDialog(repo, snapshot_id, [path], "", self.log, self, archive_path=archive_path).start()
+    
+    def _selected_browse_snapshot(self) -> Optional[tuple[Repository, str]]:
+        """Repository and ID of the snapshot selected in the Browse tab"""
+        selected_row = self.snapshots_table.currentRow()
+        if selected_row < 0:
+            QMessageBox.warning(self, "No Snapshot", "Please select a snapshot first.")
+            return None
+        
+        snapshot_id_item = self.snapshots_table.item(selected_row, 0)
+        if not snapshot_id_item:
+            return None
+        
+        repo_name = self.browse_repo_combo.currentText()
+        if not repo_name:
+            return None
+        
+        repo = self.storage.get_repository(repo_name)
+        if not repo:
+            return None
+        return repo, snapshot_id_item.text()
     
     def refresh_history(self):
         """Refresh the history table"""
+        if self.history_table is None:
+            return  # loaded when the tab is built
         self.history_table.setRowCount(0)
         history_entries = self.storage.get_latest_history(limit=50)
         
@@ -908,7 +1634,12 @@ class MainWindow(QMainWindow):
             self.history_table.insertRow(row_position)
             
             # Set row background color based on success/failure
-            bg_color = QColor(200, 255, 200) if entry.success else QColor(255, 200, 200)  # Light green or light red
+            if entry.status in ("cancelled", "timeout"):
+                bg_color = QColor(255, 240, 200)  # Light orange
+            elif entry.status == "unchanged":
+                bg_color = QColor(230, 230, 230)  # Light gray
+            else:
+                bg_color = QColor(200, 255, 200) if entry.success else QColor(255, 200, 200)  # Light green or light red
             
             # Timestamp
             timestamp_item = QTableWidgetItem(entry.timestamp)
@@ -926,7 +1657,14 @@ class MainWindow(QMainWindow):
             self.history_table.setItem(row_position, 2, repo_item)
             
             # Status
-            status_text = self.tr("✓ Success") if entry.success else self.tr("✗ Failed")
+            if entry.status == "cancelled":
+                status_text = self.tr("⊘ Cancelled")
+            elif entry.status == "timeout":
+                status_text = self.tr("⊘ Timed out")
+            elif entry.status == "unchanged":
+                status_text = self.tr("= Unchanged")
+            else:
+                status_text = self.tr("✓ Success") if entry.success else self.tr("✗ Failed")
             status_item = QTableWidgetItem(status_text)
             status_item.setBackground(bg_color)
             self.history_table.setItem(row_position, 3, status_item)
@@ -997,6 +1735,7 @@ class MainWindow(QMainWindow):
         self.edit_job_btn.setEnabled(has_selection)
         self.delete_job_btn.setEnabled(has_selection)
         self.run_job_btn.setEnabled(has_selection)
+        self.cancel_job_btn.setEnabled(has_selection)
     
     def add_job(self):
         """Open dialog to add a new job"""
@@ -1009,7 +1748,7 @@ class MainWindow(QMainWindow):
             
             if self.storage.add_job(job):
                 self.refresh_jobs()
-                self.scheduler.add_job(job)
+                self.scheduler.reconcile()
                 self.log(self.tr("Added job: %1").replace("%1", job.name))
             else:
                 QMessageBox.warning(self, self.tr("Error"), self.tr("Job '%1' already exists.").replace("%1", job.name))
@@ -1035,8 +1774,7 @@ class MainWindow(QMainWindow):
             if self.storage.update_job(job_name, updated_job):
                 self.refresh_jobs()
                 # Update scheduler
-                self.scheduler.remove_job(job_name)
-                self.scheduler.add_job(updated_job)
+                self.scheduler.reconcile()
                 self.log(self.tr("Updated job: %1").replace("%1", job_name))
     
     def delete_job(self):
@@ -1059,7 +1797,7 @@ class MainWindow(QMainWindow):
         if reply == QMessageBox.Yes:
             if self.storage.delete_job(job_name):
                 self.refresh_jobs()
-                self.scheduler.remove_job(job_name)
+                self.scheduler.reconcile()
                 self.log(self.tr("Deleted job: %1").replace("%1", job_name))
     
     def run_job_now(self):
@@ -1077,9 +1815,23 @@ class MainWindow(QMainWindow):
             return
         
         # Run the job asynchronously
-        asyncio.create_task(self.scheduler.run_backup_job(job))
+        asyncio.create_task(self.scheduler.run_backup_job(job, force=True))
         self.log(self.tr("Manually triggered job: %1").replace("%1", job_name))
     
+    def cancel_job_run(self):
+        """Cancel the running job that is selected"""
+        selected_items = self.job_list.selectedItems()
+        if not selected_items:
+            return
+        
+        item_text = selected_items[0].text()
+        job_name = item_text.split(" ", 1)[1].split(" - ")[0]
+        
+        if self.scheduler.cancel_job(job_name):
+            self.log(self.tr("Cancelling job: %1").replace("%1", job_name))
+        else:
+            self.log(self.tr("Job is not running: %1").replace("%1", job_name))
+    
     def closeEvent(self, event):
         """Override close event to hide instead of quit"""
         event.ignore()
@@ -1092,6 +1844,10 @@ class TrayIcon(QSystemTrayIcon):
         self.backup_icon = backup_icon
         self.main_window = main_window
         
+        # Show job progress in the tooltip and running jobs in the icon
+        globals.add_state_hook(self.state_update_callback)
+        main_window.scheduler.add_listener(self.on_job_event)
+        
         # Create menu
         menu = QMenu()
         
@@ -1129,13 +1885,26 @@ class TrayIcon(QSystemTrayIcon):
             self._quit_task = asyncio.create_task(self._quit_async())
 
     async def _quit_async(self):
-        print("Waiting for running jobs to finish...")
-        for lock in globals.repo_locks.values():
+        print("Cancelling running jobs...")
+        scheduler = self.main_window.scheduler
+        if scheduler.scheduler.running:
+            scheduler.scheduler.pause()
+        scheduler.cancel_all()
+        self.main_window.prewarmer.stop()
+        self.main_window.stats_refresher.stop()
+        for lock in list(globals.repo_locks.values()):
             await lock.acquire()
         QApplication.quit()
     
     def state_update_callback(self, message: str):
         self.setToolTip(QCoreApplication.translate("TrayIcon", "ResticTray - %1").replace("%1", message))
+    
+    def on_job_event(self, event: str, job: Job):
+        """Show the backup icon while any job is running"""
+        if self.main_window.scheduler.running_executors:
+            self.setIcon(self.backup_icon)
+        else:
+            self.setIcon(self.normal_icon)
 
     def toggle_window(self):
         """Show or hide the main window"""
@@ -1159,7 +1928,9 @@ class TrayIcon(QSystemTrayIcon):
             self.toggle_window()
 
 async def main_async():
+    timeline.mark("imports done")
     app = QApplication(sys.argv)
+    timeline.mark("QApplication created")
     
     # Set up translations
     translator = QTranslator()
@@ -1222,15 +1993,35 @@ async def main_async():
     # Create main window (hidden by default)
     main_window = MainWindow()
     globals.main_window = main_window  # Set global reference
+    timeline.mark("MainWindow created (tabs deferred)")
     
     # Create and show tray icon
     tray_icon = TrayIcon(normal_icon, backup_icon, main_window)
     globals.tray_icon = tray_icon  # Set global reference
     tray_icon.show()
+    timeline.mark("tray icon shown")
     
     # Start the job scheduler
     main_window.scheduler.scheduler._eventloop = loop
     main_window.start_scheduler()
+    timeline.mark("scheduler started")
+    
+    # Optional services are imported after the tray icon is up
+    from restictray.metrics import MetricsExporter
+    from restictray.control import ControlServer
+    
+    # Start the optional metrics exporter
+    metrics_exporter = MetricsExporter.from_settings(main_window.storage, main_window.scheduler)
+    if metrics_exporter:
+        loop.create_task(metrics_exporter.start())
+    
+    # Start the local control API
+    control_server = ControlServer.from_settings(main_window.storage, main_window.scheduler)
+    if control_server:
+        loop.create_task(control_server.start())
+    
+    # The first timer fires once startup events are processed
+    QTimer.singleShot(0, lambda: timeline.mark("event loop idle"))
     
     # Run the asyncio event loop
     with loop:
@@ -1238,6 +2029,8 @@ async def main_async():
             loop.run_forever()
         finally:
             main_window.stop_scheduler()
+            if control_server:
+                control_server.path.unlink(missing_ok=True)
 
 def main():
     asyncio.run(main_async())
@@ -0,0 +1,218 @@
+"""Prometheus metrics of jobs, as a textfile-collector file or an HTTP endpoint"""
+
+import asyncio
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from restictray.storage import Storage, Job, History
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _timestamp(iso: str) -> float:
+    """Convert an ISO timestamp from the history into unix seconds"""
+    try:
+        return datetime.fromisoformat(iso).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class MetricsExporter:
+    """Exports job metrics in the Prometheus/OpenMetrics text format
+
+    Metrics can be written to a node_exporter textfile-collector file and/or
+    served on a local HTTP endpoint. They are updated when a job finishes and
+    at a low rate while jobs are running.
+    """
+
+    # name -> (type, help)
+    METRICS = {
+        "restictray_job_last_success_timestamp_seconds": ("gauge", "Unix time of the last successful run"),
+        "restictray_job_last_run_timestamp_seconds": ("gauge", "Unix time of the last run"),
+        "restictray_job_last_duration_seconds": ("gauge", "Duration of the last run"),
+        "restictray_job_last_bytes_processed": ("gauge", "Bytes processed by the last run"),
+        "restictray_job_last_bytes_added": ("gauge", "Bytes added to the repository by the last run"),
+        "restictray_job_last_files": ("gauge", "Files processed by the last run"),
+        "restictray_job_last_exit_code": ("gauge", "Exit code of the last run"),
+        "restictray_job_last_success": ("gauge", "Whether the last run succeeded"),
+        "restictray_job_running": ("gauge", "Whether the job is currently running"),
+        "restictray_job_lock_wait_seconds": ("gauge", "Time the current or last run waited for the repository lock"),
+        "restictray_repo_queue_length": ("gauge", "Number of jobs waiting for the repository lock"),
+    }
+
+    def __init__(self, storage: Storage, scheduler, textfile: Optional[str] = None,
+                 port: Optional[int] = None, address: str = "127.0.0.1", interval: float = 15.0):
+        """
+        Initialize the exporter
+
+        Args:
+            storage: Storage instance for reading history and jobs
+            scheduler: JobScheduler whose running executors are exported
+            textfile: Path of the textfile-collector file to write, if any
+            port: Port of the HTTP endpoint to serve, if any
+            address: Address the HTTP endpoint binds to
+            interval: Seconds between updates while jobs are running
+        """
+        self.storage = storage
+        self.scheduler = scheduler
+        self.textfile = Path(textfile).expanduser() if textfile else None
+        self.port = port
+        self.address = address
+        self.interval = interval
+        self._history_samples: dict[str, list[tuple[dict, float]]] = {}
+        self._history_loaded = False
+        self._server: asyncio.AbstractServer|None = None
+        self._update_task: asyncio.Task|None = None
+        self._lock_wait: dict[str, float] = {}
+
+    @classmethod
+    def from_settings(cls, storage: Storage, scheduler) -> Optional["MetricsExporter"]:
+        """Create an exporter from the application settings, or None if disabled"""
+        settings = storage.load_settings()
+        textfile = settings.get("metrics_textfile")
+        port = settings.get("metrics_port")
+        if not textfile and not port:
+            return None
+        return cls(
+            storage,
+            scheduler,
+            textfile=textfile,
+            port=int(port) if port else None,
+            address=settings.get("metrics_address", "127.0.0.1"),
+            interval=float(settings.get("metrics_interval", 15.0)),
+        )
+
+    async def start(self):
+        """Start serving metrics and write the initial textfile"""
+        self.scheduler.add_listener(self._on_job_event)
+        if self.port:
+            self._server = await asyncio.start_server(self._handle_http, self.address, self.port)
+            print(f"Serving metrics on http://{self.address}:{self.port}/metrics")
+        self.update()
+
+    async def stop(self):
+        """Stop the HTTP endpoint and the periodic updates"""
+        if self._update_task:
+            self._update_task.cancel()
+            self._update_task = None
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def _on_job_event(self, event: str, job: Job):
+        """Update metrics when a job starts or finishes"""
+        if event == "finished":
+            self._history_loaded = False
+            self.update()
+        elif self._update_task is None or self._update_task.done():
+            self._update_task = asyncio.create_task(self._update_while_running())
+
+    async def _update_while_running(self):
+        """Periodically update metrics as long as jobs are running"""
+        while self.scheduler.running_executors:
+            self.update()
+            await asyncio.sleep(self.interval)
+
+    def _load_history_samples(self):
+        """Compute the per-job samples derived from the history"""
+        latest: dict[str, History] = {}
+        last_success: dict[str, History] = {}
+        for entry in self.storage.load_history():
+            if entry.job_name not in latest or entry.timestamp >= latest[entry.job_name].timestamp:
+                latest[entry.job_name] = entry
+            if entry.success and (entry.job_name not in last_success or entry.timestamp >= last_success[entry.job_name].timestamp):
+                last_success[entry.job_name] = entry
+
+        samples: dict[str, list[tuple[dict, float]]] = {name: [] for name in self.METRICS}
+        for job_name, entry in latest.items():
+            labels = {"job": job_name, "repo": entry.repo_name}
+            samples["restictray_job_last_run_timestamp_seconds"].append((labels, _timestamp(entry.timestamp)))
+            samples["restictray_job_last_duration_seconds"].append((labels, entry.duration))
+            samples["restictray_job_last_bytes_processed"].append((labels, entry.bytes))
+            samples["restictray_job_last_bytes_added"].append((labels, entry.bytes_added))
+            samples["restictray_job_last_files"].append((labels, entry.files))
+            samples["restictray_job_last_exit_code"].append((labels, entry.exit_code))
+            samples["restictray_job_last_success"].append((labels, 1 if entry.success else 0))
+        for job_name, entry in last_success.items():
+            labels = {"job": job_name, "repo": entry.repo_name}
+            samples["restictray_job_last_success_timestamp_seconds"].append((labels, _timestamp(entry.timestamp)))
+
+        self._history_samples = samples
+        self._history_loaded = True
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        if not self._history_loaded:
+            self._load_history_samples()
+
+        samples = {name: list(values) for name, values in self._history_samples.items()}
+
+        queue_length: dict[str, int] = {}
+        running = self.scheduler.running_executors
+        for job in self.storage.load_jobs():
+            labels = {"job": job.name, "repo": job.target_repo}
+            executor = running.get(job.name)
+            is_running = executor is not None and not executor.waiting
+            samples["restictray_job_running"].append((labels, 1 if is_running else 0))
+            if executor is not None:
+                self._lock_wait[job.name] = executor.current_lock_wait()
+            samples["restictray_job_lock_wait_seconds"].append((labels, self._lock_wait.get(job.name, 0.0)))
+            queue_length.setdefault(job.target_repo, 0)
+            if executor is not None and executor.waiting:
+                queue_length[job.target_repo] += 1
+        for repo_name, length in queue_length.items():
+            samples["restictray_repo_queue_length"].append(({"repo": repo_name}, length))
+
+        lines = []
+        for name, (metric_type, help_text) in self.METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples[name]:
+                label_str = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_str}}} {value}")
+        return "\n".join(lines) + "\n"
+
+    def update(self):
+        """Write the current metrics to the textfile, if configured"""
+        if not self.textfile:
+            return
+        text = self.render()
+        # Write atomically so node_exporter never reads a partial file
+        tmp_file = self.textfile.with_name(f".{self.textfile.name}.{os.getpid()}.tmp")
+        try:
+            self.textfile.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file.write_text(text)
+            os.replace(tmp_file, self.textfile)
+        except OSError as e:
+            print(f"Error writing metrics to {self.textfile}: {e}")
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Answer a single HTTP request with the current metrics"""
+        try:
+            request_line = await reader.readline()
+            # Skip the request headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode(errors="replace").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] in ("/metrics", "/"):
+                body = self.render().encode()
+                status = "200 OK"
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                body = b"Not Found\n"
+                status = "404 Not Found"
+                content_type = "text/plain; charset=utf-8"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
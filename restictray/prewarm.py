@@ -0,0 +1,105 @@
+"""Loads browse data in the background after backups
+
+Once a backup finished, the snapshot list of its repository is reloaded and
+the newest snapshot is listed with `restic ls` into the caches of
+snapshots.py, so the Browse tab opens on it without waiting for restic.
+This runs with the "background" resource profile, one repository at a time,
+and only while no job holds the repository: a job starting meanwhile
+cancels it, and it is retried later.
+"""
+
+import asyncio
+from restictray.storage import Storage
+from restictray.runner import ResticRunner, ResticCancelled, RunRecord
+from restictray import runner as restic_runner
+from restictray import snapshots as snapshot_cache
+from restictray import globals
+
+# Seconds after a backup, or after yielding to a job, before browse data is loaded
+PREWARM_DELAY = 30
+
+
+class Prewarmer:
+    """Fills the snapshot caches after backups, see the module docstring"""
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._delayed: dict[str, asyncio.TimerHandle] = {}
+        self._task: asyncio.Task|None = None
+        self._runner: ResticRunner|None = None
+        self._repo_name: str|None = None  # repository being prewarmed
+
+    def start(self):
+        """Start prewarming after backups"""
+        if self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._work())
+        restic_runner.add_hook(self._on_restic_run)
+
+    def stop(self):
+        """Stop prewarming and cancel a running restic"""
+        if self._on_restic_run in restic_runner.hooks:
+            restic_runner.hooks.remove(self._on_restic_run)
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+        if self._runner:
+            self._runner.cancel()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def request(self, repo_name: str, delay: float = PREWARM_DELAY):
+        """Load the browse data of a repository after ``delay`` seconds"""
+        if repo_name in self._delayed or repo_name in self._queued:
+            return
+        self._delayed[repo_name] = asyncio.get_event_loop().call_later(delay, self._enqueue, repo_name)
+
+    def _enqueue(self, repo_name: str):
+        self._delayed.pop(repo_name, None)
+        if repo_name not in self._queued:
+            self._queued.add(repo_name)
+            self._queue.put_nowait(repo_name)
+
+    def _on_restic_run(self, event: str, record: RunRecord):
+        if record.profile == "background":
+            return  # our own runs, or other background work
+        if event == "finished" and record.command == "backup" and record.exit_code == 0:
+            self.request(record.repository)
+        elif (event == "started" and record.repository == self._repo_name and self._runner
+              and globals.get_repo_lock(record.repository).locked()):
+            # A job holds the repository now; let it have the I/O
+            self._runner.cancel()
+
+    async def _work(self):
+        while True:
+            repo_name = await self._queue.get()
+            self._queued.discard(repo_name)
+            repository = self.storage.get_repository(repo_name)
+            if repository is None:
+                continue  # deleted meanwhile
+            if globals.get_repo_lock(repo_name).locked():
+                self.request(repo_name)
+                continue
+            self._repo_name = repo_name
+            self._runner = ResticRunner(repository, profile="background")
+            try:
+                snapshots = await snapshot_cache.refresh(repository, self._runner)
+                newest = max(snapshots, key=lambda snapshot: snapshot.get("time", ""), default=None)
+                if newest is not None:
+                    nodes = await snapshot_cache.get_listing(repository, newest["id"], self._runner)
+                    print(f"Prewarmed browse data of '{repo_name}': {len(snapshots)} snapshots, "
+                          f"{len(nodes)} nodes in {newest.get('short_id', newest['id'][:8])}")
+            except (RuntimeError, ResticCancelled) as e:
+                if self._runner.cancelled:
+                    if self._task is None:
+                        return  # stopped
+                    print(f"Prewarming '{repo_name}' yields to a job, retrying in {PREWARM_DELAY}s")
+                    self.request(repo_name)
+                else:
+                    print(f"Cannot prewarm browse data of '{repo_name}': {e}")
+            finally:
+                self._runner = None
+                self._repo_name = None
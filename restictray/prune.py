@@ -0,0 +1,190 @@
+"""Managed prune: prune only when enough space is unused, within a time budget
+
+A "prune" job with prune_threshold or prune_budget set first runs
+``restic prune --dry-run`` to measure the repository size and unused space.
+While less than prune_threshold percent is unused the run ends there and is
+recorded as "unchanged". Otherwise restic prune runs with --max-unused at
+half the threshold, so the next prune is not due right away, and with
+--max-repack-size limited to what earlier prunes of the job repacked per
+second times the budget. Repository size, unused space, reclaimed and
+repacked bytes of every run are kept in the history.
+
+restic prints its prune statistics as text only, so they are parsed from
+its output.
+"""
+
+import re
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Optional
+from restictray.storage import History, Storage
+from restictray.credentials import CredentialError
+from restictray.runner import ResticCancelled, ResticResult
+from restictray.restic import BackupExecutor
+from restictray.stats import format_size
+
+# Repack rate assumed until a prune of the job repacked something, bytes per second
+DEFAULT_REPACK_RATE = 10 * 1024 * 1024
+
+# Earlier prunes the repack rate is averaged over
+RATE_SAMPLES = 5
+
+# Without a job timeout, a prune with a budget is cancelled after this many budgets
+BUDGET_TIMEOUT_FACTOR = 3
+
+_UNITS = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4, "PiB": 1024 ** 5}
+_SIZE = r"([\d.]+) (B|KiB|MiB|GiB|TiB|PiB)"
+_PATTERNS = {
+    "repacked": re.compile(rf"^to repack:\s+\d+ blobs / {_SIZE}"),
+    "reclaimed": re.compile(rf"^total prune:\s+\d+ blobs / {_SIZE}"),
+    "remaining": re.compile(rf"^remaining:\s+\d+ blobs / {_SIZE}"),
+    "unused_after": re.compile(rf"^unused size after prune: {_SIZE}"),
+}
+
+
+@dataclass
+class PruneStats:
+    """Statistics restic prune printed, in bytes; a dry run prints what it would do"""
+    repacked: int = 0
+    reclaimed: int = 0
+    remaining: int = 0
+    unused_after: int = 0
+
+    @property
+    def total(self) -> int:
+        """Repository size before the prune"""
+        return self.remaining + self.reclaimed
+
+    @property
+    def unused(self) -> int:
+        """Unused space before the prune"""
+        return self.unused_after + self.reclaimed
+
+
+def parse_prune_output(lines: list[str]) -> Optional[PruneStats]:
+    """Read the statistics from restic prune's output, None if they are missing"""
+    values = {}
+    for line in lines:
+        for name, pattern in _PATTERNS.items():
+            match = pattern.match(line.strip())
+            if match:
+                values[name] = int(float(match.group(1)) * _UNITS[match.group(2)])
+    if len(values) < len(_PATTERNS):
+        return None
+    return PruneStats(**values)
+
+
+class PruneExecutor(BackupExecutor):
+    """Runs a managed "prune" job, see the module docstring"""
+
+    def _limit_args(self) -> list[str]:
+        """--max-unused from the threshold, unless the job's arguments set it"""
+        if self.job.prune_threshold <= 0 or "--max-unused" in self._user_options():
+            return []
+        return [f"--max-unused={self.job.prune_threshold / 2:g}%"]
+
+    def _user_options(self) -> set[str]:
+        return {arg.split("=")[0] for arg in self.job.additional_args.split()}
+
+    def _repack_rate(self) -> float:
+        """Bytes per second earlier prunes of the job repacked, including their scan time"""
+        entries = [entry for entry in Storage().get_history_for_job(self.job.name)
+                   if entry.success and entry.repacked_bytes > 0 and entry.duration > 0]
+        entries = sorted(entries, key=lambda entry: entry.timestamp)[-RATE_SAMPLES:]
+        if not entries:
+            return DEFAULT_REPACK_RATE
+        return sum(entry.repacked_bytes for entry in entries) / sum(entry.duration for entry in entries)
+
+    def _growth_text(self, unused: int) -> str:
+        """Change of the unused space since the previous run of the job"""
+        previous = [entry for entry in Storage().get_history_for_job(self.job.name) if entry.repo_size]
+        if not previous:
+            return ""
+        last = max(previous, key=lambda entry: entry.timestamp)
+        sign = "+" if unused >= last.unused_bytes else "-"
+        return f", {sign}{format_size(abs(unused - last.unused_bytes))} since {last.timestamp[:10]}"
+
+    async def _prune(self, *args: str) -> tuple[ResticResult, Optional[PruneStats]]:
+        lines = []
+
+        def on_text(line: str):
+            lines.append(line)
+            print(line)
+
+        result = await self.runner.stream("prune", *self.job.additional_args.split(), *args, on_text=on_text)
+        return result, parse_prune_output(lines)
+
+    def _entry(self, result: ResticResult, stats: Optional[PruneStats], status: str, summary_text: str) -> History:
+        return History(
+            job_name=self.job.name,
+            repo_name=self.repository.name,
+            timestamp=datetime.now().isoformat(),
+            success=status in ("success", "unchanged"),
+            files=0,
+            bytes=0,
+            duration=int(result.duration),
+            snapshot_id="",
+            exit_code=result.exit_code,
+            summary_text=summary_text,
+            status=status,
+            repo_size=stats.total if stats else 0,
+            unused_bytes=stats.unused if stats else 0
+        )
+
+    def _failure_text(self, result: ResticResult, stats: Optional[PruneStats]) -> str:
+        if result.status == "timeout":
+            return f"Timed out after {self.runner.timeout:g}s"
+        if result.status:
+            return "Cancelled"
+        if result.success and stats is None:
+            return "Cannot read the statistics in restic's prune output"
+        return result.error_message()
+
+    async def _run(self) -> dict|None:
+        limit_args = self._limit_args()
+        try:
+            dry_run, plan = await self._prune("--dry-run", *limit_args)
+            if not dry_run.success or plan is None:
+                self._add_history(self._entry(dry_run, None, dry_run.status or "failed",
+                                              "Dry run: " + self._failure_text(dry_run, plan)))
+                return None
+            unused_percent = plan.unused * 100 / plan.total if plan.total else 0.0
+            usage_text = (f"unused {format_size(plan.unused)} of {format_size(plan.total)} "
+                          f"({unused_percent:.1f}%{self._growth_text(plan.unused)})")
+            if unused_percent < self.job.prune_threshold:
+                print(f"Job '{self.job.name}': {usage_text}, below {self.job.prune_threshold}%, not pruning")
+                self._add_history(self._entry(dry_run, plan, "unchanged",
+                                              f"Not pruned, {usage_text}"))
+                return asdict(plan)
+
+            budget = self.job.prune_budget
+            if budget > 0 and "--max-repack-size" not in self._user_options():
+                # The prune scans the repository like the dry run did before it repacks
+                repack_time = max(budget - dry_run.duration, 0)
+                limit_args.append(f"--max-repack-size={int(repack_time * self._repack_rate())}")
+                if not self.job.timeout:
+                    self.runner.timeout = budget * BUDGET_TIMEOUT_FACTOR
+            print(f"Job '{self.job.name}': {usage_text}, pruning with {' '.join(limit_args) or 'default limits'}")
+            result, stats = await self._prune(*limit_args)
+        except ResticCancelled:
+            print(f"Job '{self.job.name}' was cancelled while waiting for the repository lock")
+            self._add_history(self._failed_entry("Cancelled while waiting for the repository lock", self.status))
+            return None
+        except CredentialError as e:
+            print(f"Cannot run job '{self.job.name}': {e}")
+            self._add_history(self._failed_entry(str(e), "failed"))
+            return None
+
+        if not result.success or stats is None:
+            entry = self._entry(result, plan, result.status or "failed", self._failure_text(result, stats))
+            self._add_history(entry)
+            print(f"Prune failed with exit code {result.exit_code}")
+            return None
+        entry = self._entry(result, plan, "success",
+                            f"Reclaimed {format_size(stats.reclaimed)}, repacked {format_size(stats.repacked)} "
+                            f"in {int(result.duration)}s, unused now {format_size(stats.unused_after)}")
+        entry.unused_bytes = stats.unused_after
+        entry.reclaimed_bytes = stats.reclaimed
+        entry.repacked_bytes = stats.repacked
+        self._add_history(entry)
+        return asdict(stats)
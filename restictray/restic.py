@@ -1,149 +1,407 @@
-import subprocess
 import asyncio
-import json
+import glob
+import os
+import signal
+import socket
+import tempfile
+from dataclasses import dataclass, replace
 from datetime import datetime
-from typing import Callable, Optional
-from restictray.storage import Repository, Job, History, Storage
+from typing import Any, Callable, Optional
+from restictray.storage import Repository, Job, History, Storage, CheckState
+from restictray.credentials import CredentialError
+from restictray.runner import ResticRunner, ResticCancelled, STDERR_LIMIT, CANCEL_GRACE_TIME
+from restictray import snapshots as snapshot_cache
 from restictray import globals
 
+# Backup paths beyond this count are passed in a --files-from-verbatim file
+PATH_ARGS_LIMIT = 32
+
+# Bytes copied at once from the producer of a "stdin" job to restic
+STDIN_CHUNK_SIZE = 1024 * 1024
+
+
+def read_files_from(path: str) -> list[str]:
+    """Read the paths of a --files-from file like restic: skip comments, expand globs"""
+    paths = []
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if any(char in line for char in "*?["):
+                    paths.extend(sorted(glob.glob(line)))
+                else:
+                    paths.append(line)
+    except OSError as e:
+        print(f"Cannot read {path}: {e}")
+    return paths
+
+
+async def load_snapshots(repository: Repository) -> list:
+    """Get the snapshot list of a repository
+
+    Raises RuntimeError with restic's error message if restic fails.
+    """
+    return await snapshot_cache.refresh(repository)
+
 
 class BackupExecutor:
-    def __init__(self, repository: Repository, job: Job, state_update_callback: Optional[Callable[[str],None]]=None):
+    """Runs the restic command of a job and records the result in the history"""
+
+    def __init__(self, repository: Repository, job: Job, state_update_callback: Optional[Callable[[str],None]]=None,
+                 progress_callback: Optional[Callable[[dict],None]]=None, kill_grace_time: float = CANCEL_GRACE_TIME):
         self.running = False
         self._state_update_callback = state_update_callback
+        self._progress_callback = progress_callback
         self.repository = repository
         self.job = job
+        self.runner = ResticRunner(repository, profile=job.profile or "default", lock=True,
+                                   timeout=job.timeout, kill_grace_time=kill_grace_time)
+        self._summary: Any = None
+        self.producer_exit_code: Optional[int] = None  # "stdin" jobs
+        self._producer_stderr = ""
+        self._check_state: Optional[CheckState] = None  # "check" jobs with read_data_subsets
+
+    @property
+    def waiting(self) -> bool:
+        return self.runner.waiting
+
+    @property
+    def lock_wait(self) -> float:
+        return self.runner.lock_wait
+
+    @property
+    def cancelled(self) -> bool:
+        return self.runner.cancelled
+
+    @property
+    def status(self) -> str:
+        return self.runner.status
 
     def _count(self, obj: list|None) -> int:
         if obj is None:
             return 0
         return len(obj)
-    
+
+    def current_lock_wait(self) -> float:
+        """Get the lock wait time, including a wait that is still in progress"""
+        return self.runner.current_lock_wait()
+
+    def _stdin_filename(self) -> str:
+        return self.job.stdin_filename or self.job.name
+
+    def _paths(self) -> list[str]:
+        """Backup paths of the job as restic records them in snapshots"""
+        if self.job.type == "stdin":
+            return [f"/{self._stdin_filename()}"]
+        paths = self.job.backup_paths()
+        if self.job.files_from:
+            paths += read_files_from(self.job.files_from)
+        return [os.path.abspath(path) for path in paths]
+
+    def _path_args(self) -> tuple[list[str], str|None]:
+        """Get the path arguments of a backup and the temporary path list file, if one was written"""
+        paths = self.job.backup_paths()
+        args = ["--files-from", self.job.files_from] if self.job.files_from else []
+        if len(paths) <= PATH_ARGS_LIMIT:
+            return args + paths, None
+        # Keep the command line short, one path per line
+        with tempfile.NamedTemporaryFile("w", prefix="restictray-paths-", suffix=".txt", delete=False) as f:
+            f.write("".join(f"{path}\n" for path in paths))
+        return args + ["--files-from-verbatim", f.name], f.name
+
+    async def _select_parent(self) -> Optional[str]:
+        """Choose the parent snapshot of a backup
+
+        restic only reuses a parent with the same hostname and paths and
+        otherwise reads every file again. The snapshot of the last successful
+        run of the job is passed explicitly instead, if it still exists and
+        contains the job's paths; failing that the newest snapshot from any
+        host that contains them, or else the one sharing the most paths.
+        restic matches the parent's trees by name, so extra paths in the
+        parent do not matter. Returns None if there is no such snapshot.
+        """
+        try:
+            snapshots = await snapshot_cache.get(self.repository)
+        except RuntimeError as e:
+            print(f"Cannot load snapshots to choose the parent of job '{self.job.name}': {e}")
+            return None
+        paths = set(self._paths())
+        job_names = self._history_job_names()
+        history = [entry for entry in Storage().load_history()
+                   if entry.job_name in job_names and entry.success and entry.snapshot_id
+                   and entry.repo_name == self.repository.name]
+        if history:
+            last = max(history, key=lambda entry: entry.timestamp)
+            snapshot = snapshot_cache.find(snapshots, last.snapshot_id)
+            if snapshot and paths <= set(snapshot.get("paths", [])):
+                return snapshot["id"]
+            print(f"Last snapshot of job '{self.job.name}' ({last.snapshot_id[:8]}) is gone or lacks some of the paths")
+        # restic lists snapshots oldest first
+        for snapshot in reversed(snapshots):
+            if paths <= set(snapshot.get("paths", [])):
+                return snapshot["id"]
+        best = max(reversed(snapshots), key=lambda snapshot: len(paths & set(snapshot.get("paths", []))), default=None)
+        if best and paths & set(best.get("paths", [])):
+            return best["id"]
+        return None
+
+    async def _feed_stdin(self, stdin: asyncio.StreamWriter):
+        """Copy the output of the job's producer command to restic
+
+        restic only gets EOF once the producer exited successfully. If the
+        producer fails, restic is cancelled so the truncated output does not
+        become a snapshot. A "stdin" job therefore does not use restic's
+        --stdin-from-command, which would not tell us the producer's status.
+        """
+        producer = await asyncio.create_subprocess_shell(
+            self.job.stdin_command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            # Its own process group, so the commands the shell started can be killed too
+            start_new_session=True
+        )
+
+        async def read_stderr():
+            async for line in producer.stderr:
+                self._producer_stderr = (self._producer_stderr + line.decode(errors="replace"))[-STDERR_LIMIT:]
+
+        stderr_task = asyncio.create_task(read_stderr())
+        try:
+            while chunk := await producer.stdout.read(STDIN_CHUNK_SIZE):
+                stdin.write(chunk)
+                await stdin.drain()
+            await stderr_task
+            self.producer_exit_code = await producer.wait()
+        except (BrokenPipeError, ConnectionResetError):
+            print(f"restic stopped reading the output of the producer of job '{self.job.name}'")
+            return
+        finally:
+            # Also reached when the runner cancels this because restic exited
+            if producer.returncode is None:
+                try:
+                    os.killpg(producer.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                # wait() only returns once the pipes are closed
+                while await producer.stdout.read(STDIN_CHUNK_SIZE):
+                    pass
+                await stderr_task
+                await producer.wait()
+                self.producer_exit_code = -1
+            elif self.producer_exit_code is None:
+                self.producer_exit_code = producer.returncode
+        if self.producer_exit_code == 0:
+            stdin.close()
+        else:
+            print(f"Producer of job '{self.job.name}' exited with code {self.producer_exit_code}, cancelling restic")
+            self.runner.cancel("failed")
+
+    def _load_check_state(self) -> Optional[CheckState]:
+        """Get the data verification position of a check job, None if it does not rotate subsets"""
+        subsets = self.job.read_data_subsets
+        if self.job.type != "check" or subsets <= 0:
+            return None
+        if any(arg.startswith("--read-data") for arg in self.job.additional_args.split()):
+            print(f"Job '{self.job.name}' selects the data to read in its arguments, not rotating subsets")
+            return None
+        state = Storage().get_check_state(self.job.name)
+        if state is None or state.subsets != subsets or not 1 <= state.next_subset <= subsets:
+            # The subsets differ once N changes, so start over
+            state = CheckState(name=self.job.name, subsets=subsets)
+        return state
+
+    def _advance_check_state(self, success: bool) -> str:
+        """Record the verified subset and move on to the next one, returns a note for the history"""
+        state = self._check_state
+        subset = state.next_subset
+        if subset == 1:
+            state.cycle_start = datetime.now().isoformat()
+        if success:
+            state.failed_subsets = [n for n in state.failed_subsets if n != subset]
+        elif subset not in state.failed_subsets:
+            state.failed_subsets = sorted(state.failed_subsets + [subset])
+        state.next_subset = subset % state.subsets + 1
+        Storage().save_check_state(state)
+        if subset < state.subsets:
+            return ""
+        print(f"Job '{self.job.name}' verified all {state.subsets} data subsets since {state.cycle_start or 'unknown'}")
+        if state.failed_subsets:
+            return f" (cycle complete, failed subsets: {', '.join(map(str, state.failed_subsets))})"
+        return " (cycle complete)"
+
+    def _history_job_names(self) -> set[str]:
+        """Names of the jobs whose history entries describe this run's snapshots"""
+        return {self.job.name}
+
+    def _extra_args(self) -> list[str]:
+        """Additional restic arguments of the run"""
+        return []
+
+    def cancel(self, status: str = "cancelled"):
+        """Cancel the run, see ResticRunner.cancel"""
+        self.runner.cancel(status)
+
+    def _on_message(self, data: Any):
+        """Handle a JSON message restic printed while running"""
+        if self.job.type == "forget":
+            self._summary = data
+            return
+        if not isinstance(data, dict):
+            return
+
+        message_type = data.get("message_type", "")
+
+        if message_type == "status":
+            # Progress update
+            files_done = data.get("files_done", 0)
+            bytes_done = data.get("bytes_done", 0)
+            total_files = data.get("total_files", 0)
+            total_bytes = data.get("total_bytes", 0)
+            percent_done = data.get("percent_done", 0)
+
+            # Format bytes to human readable
+            bytes_done_mb = bytes_done / (1024 * 1024)
+            total_bytes_mb = total_bytes / (1024 * 1024)
+
+            progress = f"Progress: {percent_done:.0%} - {files_done}/{total_files} files, {bytes_done_mb:.0f}/{total_bytes_mb:.0f} MB"
+            globals.set_tooltip(progress)
+            if self._progress_callback:
+                self._progress_callback(data)
+
+        elif message_type == "summary":
+            # Final summary
+            self._summary = data
+            files_new = data.get("files_new", 0)
+            files_changed = data.get("files_changed", 0)
+            files_unmodified = data.get("files_unmodified", 0)
+            total_files = data.get("total_files_processed", 0)
+            total_bytes = data.get("total_bytes_processed", 0)
+            data_added = data.get("data_added", 0)
+            total_duration = data.get("total_duration", 0)
+
+            # Format bytes to human readable
+            total_bytes_gb = total_bytes / (1024 * 1024 * 1024)
+            data_added_mb = data_added / (1024 * 1024)
+
+            print(f"\nBackup completed successfully!")
+            print(f"Files: {files_new} new, {files_changed} changed, {files_unmodified} unmodified")
+            print(f"Total: {total_files} files ({total_bytes_gb:.2f} GB)")
+            print(f"Data added: {data_added_mb:.2f} MB")
+            print(f"Duration: {total_duration:.1f} seconds")
+            print(f"Snapshot ID: {data.get('snapshot_id', 'N/A')}")
+
+        elif message_type == "error":
+            # Error message
+            print(f"Error: {data.get('error', 'Unknown error')}")
+
+    def _failed_entry(self, summary_text: str, status: str) -> History:
+        """History entry for a run that did not start restic"""
+        return History(
+            job_name=self.job.name,
+            repo_name=self.repository.name,
+            timestamp=datetime.now().isoformat(),
+            success=False,
+            files=0,
+            bytes=0,
+            duration=0,
+            snapshot_id="",
+            summary_text=summary_text,
+            status=status
+        )
+
+    def _add_history(self, history_entry: History):
+        Storage().add_history(history_entry)
+        print(f"History entry saved for job: {self.job.name}")
+
     async def run(self) -> dict|None:
-        async with globals.get_repo_lock(self.repository.name):
+        self.running = True
+        try:
             return await self._run()
-    
+        finally:
+            self.running = False
+
     async def _run(self) -> dict|None:
-        self.running = True
-        
-        repo_url = self.repository.url
-        password = self.repository.password
-        if self.job.type == "backup":
+        if self.job.type in ("backup", "stdin"):
             tags = ["--tag", "created-by:ResticTray"]
         else:
             tags = []
-        args = ["-r", repo_url, *tags, "--password-command", f"echo '{password}'", "--json", self.job.type, *self.job.additional_args.split(), self.job.directory]
-        
+        command = "backup" if self.job.type == "stdin" else self.job.type
+        additional_args = self.job.additional_args.split()
+        parent_args = []
+        parent = None
+        # --parent or --force in the job's arguments take precedence
+        select_parent = self.job.type == "backup" and not any(
+            arg.startswith("--parent") or arg == "--force" for arg in additional_args)
+        if select_parent:
+            parent = await self._select_parent()
+            if parent:
+                parent_args = ["--parent", parent]
+            else:
+                print(f"Warning: no parent snapshot for job '{self.job.name}', restic may read all files")
+        paths_file = None
+        if self.job.type == "backup":
+            path_args, paths_file = self._path_args()
+        elif self.job.type == "stdin":
+            path_args = ["--stdin", "--stdin-filename", self._stdin_filename()]
+        else:
+            path_args = [self.job.directory]
+        self._check_state = self._load_check_state()
+        if self._check_state:
+            state = self._check_state
+            path_args.append(f"--read-data-subset={state.next_subset}/{state.subsets}")
+        args = [*tags, "--json", command, *additional_args, *self._extra_args(), *parent_args, *path_args]
+
         # filter empty args
         args = [arg for arg in args if arg]
 
         print(f"Running restic with args: {args}")
-        start = asyncio.get_event_loop().time()
-        """Perform a restic backup asynchronously, reading JSON output line by line."""
-        process = await asyncio.create_subprocess_exec(
-            'restic', *args,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        # Read stdout line by line in real time
-        summary = None
-        async for line in process.stdout:
-            line_str = line.decode().strip()
-            if not line_str:
-                continue
-                
-            try:
-                data = json.loads(line_str)
-                if self.job.type == "forget":
-                    summary = data
-                    continue
-                
-                message_type = data.get("message_type", "")
-
-                if message_type == "status":
-                    # Progress update
-                    files_done = data.get("files_done", 0)
-                    bytes_done = data.get("bytes_done", 0)
-                    total_files = data.get("total_files", 0)
-                    total_bytes = data.get("total_bytes", 0)
-                    percent_done = data.get("percent_done", 0)
-                    
-                    # Format bytes to human readable
-                    bytes_done_mb = bytes_done / (1024 * 1024)
-                    total_bytes_mb = total_bytes / (1024 * 1024)
-                    
-                    progress = f"Progress: {percent_done:.0%} - {files_done}/{total_files} files, {bytes_done_mb:.0f}/{total_bytes_mb:.0f} MB"
-                    #print(progress)
-                    globals.set_tooltip(progress)
-                    #if self._state_update_callback:
-                    #    self._state_update_callback(progress)
-                    
-                elif message_type == "summary":
-                    # Final summary
-                    summary = data
-                    files_new = data.get("files_new", 0)
-                    files_changed = data.get("files_changed", 0)
-                    files_unmodified = data.get("files_unmodified", 0)
-                    total_files = data.get("total_files_processed", 0)
-                    total_bytes = data.get("total_bytes_processed", 0)
-                    data_added = data.get("data_added", 0)
-                    total_duration = data.get("total_duration", 0)
-                    
-                    # Format bytes to human readable
-                    total_bytes_gb = total_bytes / (1024 * 1024 * 1024)
-                    data_added_mb = data_added / (1024 * 1024)
-                    
-                    print(f"\nBackup completed successfully!")
-                    print(f"Files: {files_new} new, {files_changed} changed, {files_unmodified} unmodified")
-                    print(f"Total: {total_files} files ({total_bytes_gb:.2f} GB)")
-                    print(f"Data added: {data_added_mb:.2f} MB")
-                    print(f"Duration: {total_duration:.1f} seconds")
-                    print(f"Snapshot ID: {data.get('snapshot_id', 'N/A')}")
-                    
-
-                elif message_type == "error":
-                    # Error message
-                    print(f"Error: {data.get('error', 'Unknown error')}")
-                    
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON: {line_str}")
-                print(f"Error: {e}")
-
-        async for line in process.stderr:
-            line_str = line.decode().strip()
-            if not line_str:
-                continue
-                
-            try:
-                data = json.loads(line_str)
-                message_type = data.get("message_type", "")
-                if message_type == "exit_error":
-                    summary = data
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse stderr JSON: {line_str}")
-                print(f"Error: {e}")
-        
-        
-        # Wait for process to complete
-        exit_code = await process.wait()
-        
-        # Read any stderr output
-        #stderr = await process.stderr.read()
-        #if stderr:
-        #    print("Stderr:", stderr.decode())
-        
-        # Calculate duration
-        end = asyncio.get_event_loop().time()
-        duration = int(end - start)
-        
+        self._summary = None
+        try:
+            result = await self.runner.stream(
+                *args, on_json=self._on_message, on_text=print,
+                stdin_feeder=self._feed_stdin if self.job.type == "stdin" else None
+            )
+        except ResticCancelled:
+            print(f"Job '{self.job.name}' was cancelled while waiting for the repository lock")
+            self._add_history(self._failed_entry("Cancelled while waiting for the repository lock", self.status))
+            return None
+        except CredentialError as e:
+            print(f"Cannot run job '{self.job.name}': {e}")
+            self._add_history(self._failed_entry(str(e), "failed"))
+            return None
+        finally:
+            if paths_file:
+                os.unlink(paths_file)
+
+        if self.job.type == "forget":
+            # Even a failed forget may have removed snapshots
+            snapshot_cache.invalidate(self.repository.name)
+
+        exit_code = result.exit_code
+        duration = int(result.duration)
+        summary = self._summary
+        if not result.success and result.error:
+            summary = result.error
+
         # Determine success
-        success = exit_code == 0
-        
+        success = result.success
+        producer_failed = self.job.type == "stdin" and self.producer_exit_code != 0
+        if producer_failed:
+            success = False
+        if success:
+            status = "success"
+        else:
+            status = result.status or "failed"
+        if result.status == "timeout":
+            cancel_text = f"Timed out after {self.job.timeout}s"
+        else:
+            cancel_text = "Cancelled"
+        error_text = summary.get("message", "Unknown error") if isinstance(summary, dict) else result.error_message()
+
         # Store history entry
-        storage = Storage()
-        #if summary:
-            #print(f"Summary: {summary}")
         if self.job.type == "forget":
             if success:
                 summary = summary[0]
@@ -161,9 +419,11 @@ class BackupExecutor:
             )
             if success:
                 history_entry.summary_text = f"remove: {self._count(summary.get('remove', None))}, keep: {self._count(summary.get('keep', None))}"
+            elif result.status:
+                history_entry.summary_text = cancel_text
             else:
-                history_entry.summary_text = summary.get("message", "Unknown error")
-        elif self.job.type == "backup":
+                history_entry.summary_text = error_text
+        elif self.job.type in ("backup", "stdin"):
             history_entry = History(
                 job_name=self.job.name,
                 repo_name=self.repository.name,
@@ -173,24 +433,158 @@ class BackupExecutor:
                 bytes=summary.get("total_bytes_processed", 0) if summary else 0,
                 duration=duration,
                 snapshot_id=summary.get("snapshot_id", "") if summary else "",
-                bytes_added=data_added,
-                exit_code = exit_code
+                bytes_added=summary.get("data_added", 0) if summary else 0,
+                exit_code = exit_code,
+                parent_snapshot=parent or ""
             )
-            if exit_code == 0:
+            if self.job.type == "stdin":
+                history_entry.producer_exit_code = -1 if self.producer_exit_code is None else self.producer_exit_code
+            # A producer killed because restic stopped (-1) is not the cause of the failure
+            if producer_failed and self.producer_exit_code not in (None, -1) and result.status in ("", "failed"):
+                stderr = self._producer_stderr.strip().splitlines()
+                history_entry.summary_text = f"Producer exited with code {history_entry.producer_exit_code}"
+                if stderr:
+                    history_entry.summary_text += f": {stderr[-1]}"
+            elif success:
                 history_entry.summary_text = f"Files: {history_entry.files}, Bytes: {history_entry.bytes}, Duration: {history_entry.duration}s"
+                if select_parent and not parent:
+                    history_entry.summary_text += " (no parent snapshot)"
+                if history_entry.snapshot_id:
+                    snapshot_cache.add(self.repository.name, {
+                        "id": history_entry.snapshot_id,
+                        "short_id": history_entry.snapshot_id[:8],
+                        "time": datetime.now().astimezone().isoformat(),
+                        "paths": self._paths(),
+                        "hostname": socket.gethostname(),
+                        "tags": ["created-by:ResticTray"],
+                    })
+            elif result.status:
+                history_entry.summary_text = cancel_text
             else:
-                history_entry.summary_text = summary.get("message", "Unknown error")
+                history_entry.summary_text = error_text
+        else:
+            history_entry = History(
+                job_name=self.job.name,
+                repo_name=self.repository.name,
+                timestamp=datetime.now().isoformat(),
+                success=success,
+                files=0,
+                bytes=0,
+                duration=duration,
+                snapshot_id="",
+                exit_code = exit_code
+            )
+            if success:
+                history_entry.summary_text = f"Duration: {duration}s"
+            elif result.status:
+                history_entry.summary_text = cancel_text
+            else:
+                history_entry.summary_text = error_text
+            if self._check_state:
+                history_entry.data_subset = f"{self._check_state.next_subset}/{self._check_state.subsets}"
+                history_entry.summary_text = f"Data subset {history_entry.data_subset}: {history_entry.summary_text}"
+                # A cancelled or timed out subset is checked again by the next run
+                if not result.status:
+                    history_entry.summary_text += self._advance_check_state(success)
+        history_entry.status = status
 
-        storage.add_history(history_entry)
-        print(f"History entry saved for job: {self.job.name}")
-        
-        if process.returncode != 0:
-            print(f"Backup failed with exit code {process.returncode}")
+        self._add_history(history_entry)
+
+        if not success:
+            print(f"Backup failed with exit code {exit_code}")
             return None
-        
-        self.running = False
 
         return summary
 
 
+@dataclass
+class PathStats:
+    """Files and bytes restic reported below the paths of one job
+
+    restic reports sizes for new and changed files only, so bytes does not
+    include unchanged files like total_bytes_processed does.
+    """
+    files: int = 0
+    bytes: int = 0
+    bytes_added: int = 0
+
+
+class BatchBackupExecutor(BackupExecutor):
+    """Runs compatible backup jobs of one repository as a single restic backup
+
+    All paths go into one snapshot. restic's per-file messages (--verbose=2)
+    are attributed to the job owning the path, so every job still gets its
+    own history entry. restic prints them for unchanged files too (its JSON
+    output has no changed-only level), which costs about 6 s of CPU per
+    million files, see the README.
+    """
+
+    def __init__(self, repository: Repository, jobs: list[Job], **kwargs):
+        paths = []
+        for job in jobs:
+            paths += [path for path in job.backup_paths() if path not in paths]
+        # Unlimited if any job is, otherwise the time all jobs may take together
+        timeout = 0 if any(job.timeout == 0 for job in jobs) else sum(job.timeout for job in jobs)
+        batch_job = replace(jobs[0], name="+".join(job.name for job in jobs), directory="",
+                            paths=paths, timeout=timeout)
+        super().__init__(repository, batch_job, **kwargs)
+        self.jobs = jobs
+        self._stats = {job.name: PathStats() for job in jobs}
+        # Longest paths first, so nested paths belong to the innermost job
+        self._owners = sorted(
+            ((os.path.abspath(path), job.name) for job in jobs for path in job.backup_paths()),
+            key=lambda owner: len(owner[0]), reverse=True)
+        self._path_owners = {path: job_name for path, job_name in reversed(self._owners)}
+        # restic reports every file, so the owner is looked up once per directory
+        self._directory_owners: dict[str, Optional[str]] = {}
 
+    def _history_job_names(self) -> set[str]:
+        return {job.name for job in self.jobs}
+
+    def _extra_args(self) -> list[str]:
+        return ["--verbose=2"]
+
+    def _owner(self, item: str) -> Optional[str]:
+        item = item.rstrip("/") or "/"
+        if item in self._path_owners:
+            return self._path_owners[item]
+        directory = item.rpartition("/")[0] or "/"
+        if directory not in self._directory_owners:
+            self._directory_owners[directory] = next(
+                (job_name for path, job_name in self._owners
+                 if directory == path or directory.startswith(path.rstrip("/") + "/")), None)
+        return self._directory_owners[directory]
+
+    def _on_message(self, data: Any):
+        if isinstance(data, dict) and data.get("message_type") == "verbose_status":
+            item = data.get("item", "")
+            job_name = self._owner(item)
+            if job_name:
+                stats = self._stats[job_name]
+                if not item.endswith("/"):
+                    stats.files += 1
+                    stats.bytes += data.get("data_size", 0)
+                stats.bytes_added += data.get("data_size_in_repo", 0)
+            return
+        super()._on_message(data)
+
+    def _add_history(self, history_entry: History):
+        """Record an entry for every job of the batch"""
+        entries = []
+        for job in self.jobs:
+            entry = replace(history_entry, job_name=job.name)
+            others = ", ".join(other.name for other in self.jobs if other is not job)
+            if history_entry.success:
+                stats = self._stats[job.name]
+                entry.files = stats.files
+                entry.bytes = stats.bytes
+                entry.bytes_added = stats.bytes_added
+                entry.summary_text = f"Files: {entry.files}, Bytes: {entry.bytes}, Duration: {entry.duration}s, batched with {others}"
+                if history_entry.summary_text.endswith(" (no parent snapshot)"):
+                    entry.summary_text += " (no parent snapshot)"
+            else:
+                entry.summary_text = f"{history_entry.summary_text} (batched with {others})"
+            entries.append(entry)
+        storage = Storage()
+        storage.save_history(storage.load_history() + entries)
+        print(f"History entries saved for jobs: {', '.join(job.name for job in self.jobs)}")
@@ -0,0 +1,386 @@
+"""Runs restic commands; every restic process is started here
+
+ResticRunner passes the repository password (see credentials.py), applies a
+resource profile (nice/ionice/environment), optionally holds the repository
+lock, decodes --json output while it streams, reads stderr concurrently,
+supports cancellation and timeouts and reports every run to the hooks.
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import signal
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+from restictray.storage import Repository, Storage
+from restictray.credentials import get_credentials
+from restictray import globals
+
+# restic prints some results (e.g. forget) as a single JSON line that can be
+# many megabytes long, far beyond asyncio's default 64 KiB line limit
+STREAM_LIMIT = 256 * 1024 * 1024
+
+# Seconds restic gets to exit after SIGINT (releasing its repository lock)
+# before it is killed
+CANCEL_GRACE_TIME = 30
+
+# Bytes of stderr kept for error messages
+STDERR_LIMIT = 64 * 1024
+
+# Bytes of stdout passed to on_data at once
+DATA_CHUNK = 1024 * 1024
+
+# restic subcommands, to name runs in RunRecord
+COMMANDS = {
+    "backup", "cat", "check", "copy", "diff", "dump", "find", "forget", "init", "key",
+    "list", "ls", "migrate", "mount", "prune", "recover", "repair", "restore", "rewrite",
+    "snapshots", "stats", "tag", "unlock",
+}
+
+
+@dataclass
+class ResourceProfile:
+    """Scheduling priority and environment of restic processes"""
+    nice: int = 0
+    ionice: str = ""  # "idle", "best-effort" or "" to leave the I/O class unchanged
+    env: dict[str, str] = field(default_factory=dict)
+
+
+# Built-in profiles, the setting "restic_profiles" can add or override them:
+#   {"restic_profiles": {"background": {"nice": 15, "env": {"GOMAXPROCS": "2"}}}}
+PROFILES = {
+    "default": ResourceProfile(),
+    "background": ResourceProfile(nice=10, ionice="idle"),
+}
+
+_profiles: dict[str, ResourceProfile]|None = None
+
+
+def get_profile(name: str) -> ResourceProfile:
+    """Get a resource profile by name, the default profile if it is unknown"""
+    global _profiles
+    if _profiles is None:
+        _profiles = dict(PROFILES)
+        for profile_name, values in (Storage().get_setting("restic_profiles") or {}).items():
+            try:
+                _profiles[profile_name] = ResourceProfile(**values)
+            except TypeError as e:
+                print(f"Invalid restic profile '{profile_name}': {e}")
+    profile = _profiles.get(name or "default")
+    if profile is None:
+        print(f"Unknown restic profile '{name}', using the default profile")
+        profile = _profiles["default"]
+    return profile
+
+
+def _command_prefix(profile: ResourceProfile) -> list[str]:
+    """nice/ionice wrappers for a profile; they exec restic, so the pid is restic's"""
+    prefix = []
+    if profile.ionice and shutil.which("ionice"):
+        prefix += ["ionice", "-c", "3"] if profile.ionice == "idle" else ["ionice", "-c", "2", "-n", "7"]
+    if profile.nice and shutil.which("nice"):
+        prefix += ["nice", "-n", str(profile.nice)]
+    return prefix
+
+
+@dataclass
+class RunRecord:
+    """Describes a restic run for the hooks"""
+    repository: str
+    command: str  # the restic subcommand, e.g. "backup"
+    args: list[str]
+    profile: str
+    pid: Optional[int] = None
+    lock_wait: float = 0.0
+    duration: float = 0.0
+    exit_code: Optional[int] = None
+    status: str = ""  # "cancelled" or "timeout" if cancelled
+    stdout_lines: int = 0
+
+
+# Callbacks receiving ("started"|"finished", RunRecord) for every restic run
+hooks: list[Callable[[str, RunRecord], None]] = []
+
+
+def add_hook(callback: Callable[[str, RunRecord], None]):
+    """Register a callback that is called when a restic process starts and exits"""
+    hooks.append(callback)
+
+
+def _call_hooks(event: str, record: RunRecord):
+    for callback in hooks:
+        try:
+            callback(event, record)
+        except Exception as e:
+            print(f"Error in restic run hook: {e}")
+
+
+@dataclass
+class ResticResult:
+    """Outcome of a restic run"""
+    exit_code: int
+    duration: float
+    stdout: bytes = b""  # only if the output was captured
+    stderr: str = ""
+    error: Optional[dict] = None  # restic's exit_error message (--json)
+    status: str = ""  # "cancelled" or "timeout" if cancelled
+
+    @property
+    def success(self) -> bool:
+        return self.exit_code == 0
+
+    def error_message(self) -> str:
+        if self.error and self.error.get("message"):
+            return self.error["message"]
+        return self.stderr.strip() or f"restic exited with code {self.exit_code}"
+
+
+class ResticError(Exception):
+    """restic failed"""
+    def __init__(self, result: ResticResult):
+        super().__init__(result.error_message())
+        self.result = result
+
+
+class ResticCancelled(Exception):
+    """The run was cancelled before restic was started"""
+
+
+class ResticRunner:
+    """Runs restic commands on one repository, one command at a time"""
+
+    def __init__(self, repository: Repository, profile: str = "default", lock: bool = False,
+                 timeout: float = 0, kill_grace_time: float = CANCEL_GRACE_TIME):
+        """
+        Initialize the runner
+
+        Args:
+            repository: Repository to run restic on
+            profile: Name of the resource profile
+            lock: Hold the repository lock (globals.get_repo_lock) while restic runs
+            timeout: Cancel restic after this many seconds, 0 = no timeout
+            kill_grace_time: Seconds between SIGINT and SIGKILL when cancelling
+        """
+        self.repository = repository
+        self.profile = profile
+        self.lock = lock
+        self.timeout = timeout
+        self.kill_grace_time = kill_grace_time
+        self.process: asyncio.subprocess.Process|None = None
+        self.waiting = False
+        self.lock_wait = 0.0  # seconds spent waiting for the repository lock
+        self._wait_start: float|None = None
+        self.cancelled = False
+        self.status = ""  # "cancelled" or "timeout" once cancelled
+        self._cancel_event = asyncio.Event()
+        self._kill_handle: asyncio.TimerHandle|None = None
+
+    def current_lock_wait(self) -> float:
+        """Get the lock wait time, including a wait that is still in progress"""
+        if self.waiting and self._wait_start is not None:
+            return asyncio.get_event_loop().time() - self._wait_start
+        return self.lock_wait
+
+    def cancel(self, status: str = "cancelled"):
+        """Cancel the run
+
+        restic gets SIGINT so it can release its repository lock (a backup
+        may save a partial snapshot) and is killed if it has not exited after
+        kill_grace_time seconds. A run still waiting for the lock is skipped.
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        self.status = status
+        self._cancel_event.set()
+        self._interrupt()
+
+    def _interrupt(self):
+        """Send SIGINT to restic and schedule the kill"""
+        if self.process and self.process.returncode is None:
+            print(f"Interrupting restic on '{self.repository.name}' ({self.status})")
+            self.process.send_signal(signal.SIGINT)
+            self._kill_handle = asyncio.get_event_loop().call_later(self.kill_grace_time, self._kill)
+
+    def _kill(self):
+        if self.process and self.process.returncode is None:
+            print(f"restic did not exit within {self.kill_grace_time}s, killing it ('{self.repository.name}')")
+            self.process.kill()
+
+    async def _acquire(self, lock: asyncio.Lock):
+        """Wait for the repository lock, raises ResticCancelled if cancelled meanwhile"""
+        self.waiting = True
+        self._wait_start = asyncio.get_event_loop().time()
+        acquire = asyncio.ensure_future(lock.acquire())
+        cancel_wait = asyncio.ensure_future(self._cancel_event.wait())
+        acquired = False
+        try:
+            await asyncio.wait([acquire, cancel_wait], return_when=asyncio.FIRST_COMPLETED)
+            acquired = acquire.done()
+        finally:
+            cancel_wait.cancel()
+            # cancel() returns False if the lock was acquired after all
+            if not acquired and not acquire.cancel() and not acquire.cancelled():
+                acquired = True
+            self.lock_wait = asyncio.get_event_loop().time() - self._wait_start
+            self.waiting = False
+        if not acquired:
+            raise ResticCancelled(self.status)
+
+    async def stream(self, *args: str, on_json: Optional[Callable[[Any], None]] = None,
+                     on_text: Optional[Callable[[str], None]] = None, capture: bool = False,
+                     stdin_feeder: Optional[Callable[[asyncio.StreamWriter], Awaitable[None]]] = None,
+                     on_data: Optional[Callable[[bytes], Optional[Awaitable[None]]]] = None) -> ResticResult:
+        """Run restic with ``args`` after "-r <repository>"
+
+        Every stdout line that is valid JSON is passed to on_json, other lines
+        to on_text. With capture=True stdout is returned in the result instead,
+        with on_data it is passed on in chunks of bytes (e.g. restic dump); an
+        awaitable on_data returns is awaited before the next chunk is read.
+        stdin_feeder is run concurrently with restic's stdin and must close it.
+        Raises ResticCancelled if cancelled before restic started and
+        CredentialError if the password is not available.
+        """
+        lock = globals.get_repo_lock(self.repository.name) if self.lock else None
+        if lock:
+            await self._acquire(lock)
+        try:
+            if self.cancelled:
+                raise ResticCancelled(self.status)
+            return await self._execute(args, on_json, on_text, capture, stdin_feeder, on_data)
+        finally:
+            if lock:
+                lock.release()
+
+    async def run(self, *args: str) -> ResticResult:
+        """Run restic and capture its output"""
+        return await self.stream(*args, capture=True)
+
+    async def json(self, *args: str) -> Any:
+        """Run restic and decode its JSON output, raises ResticError if it failed"""
+        result = await self.run(*args)
+        if not result.success:
+            raise ResticError(result)
+        return json.loads(result.stdout)
+
+    async def json_lines(self, *args: str) -> list:
+        """Run restic and collect its JSON lines output, raises ResticError if it failed"""
+        items = []
+        result = await self.stream(*args, on_json=items.append)
+        if not result.success:
+            raise ResticError(result)
+        return items
+
+    async def _read_stderr(self, stderr: asyncio.StreamReader) -> tuple[str, Optional[dict]]:
+        """Collect stderr while stdout is read, so restic never blocks on a full pipe"""
+        text = ""
+        error = None
+        async for line in stderr:
+            line_str = line.decode(errors="replace")
+            if line_str.startswith("{"):
+                try:
+                    data = json.loads(line_str)
+                    if isinstance(data, dict) and data.get("message_type") == "exit_error":
+                        error = data
+                        continue
+                except json.JSONDecodeError:
+                    pass
+            text = (text + line_str)[-STDERR_LIMIT:]
+        return text, error
+
+    async def _execute(self, args, on_json, on_text, capture, stdin_feeder=None, on_data=None) -> ResticResult:
+        loop = asyncio.get_event_loop()
+        profile = get_profile(self.profile)
+        credentials = get_credentials(self.repository)
+        env = credentials.env
+        if profile.env:
+            env = {**(env or os.environ), **profile.env}
+        record = RunRecord(
+            repository=self.repository.name,
+            command=next((arg for arg in args if arg in COMMANDS), ""),
+            args=list(args),
+            profile=self.profile,
+            lock_wait=self.lock_wait,
+        )
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *_command_prefix(profile), 'restic', '-r', self.repository.url, *credentials.args, *args,
+                stdin=asyncio.subprocess.PIPE if stdin_feeder else None,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=env,
+                pass_fds=credentials.pass_fds,
+                limit=STREAM_LIMIT
+            )
+        finally:
+            credentials.close()
+        self.process = process
+        start = loop.time()
+        record.pid = process.pid
+        _call_hooks("started", record)
+
+        if self.cancelled:
+            self._interrupt()
+        timeout_handle = None
+        if self.timeout:
+            timeout_handle = loop.call_later(self.timeout, self.cancel, "timeout")
+
+        stderr_task = asyncio.create_task(self._read_stderr(process.stderr))
+        feeder_task = asyncio.create_task(stdin_feeder(process.stdin)) if stdin_feeder else None
+        stdout = b""
+        try:
+            if capture:
+                stdout = await process.stdout.read()
+            elif on_data:
+                while chunk := await process.stdout.read(DATA_CHUNK):
+                    pending = on_data(chunk)
+                    if pending is not None:
+                        await pending
+            else:
+                async for line in process.stdout:
+                    line_str = line.decode(errors="replace").strip()
+                    if not line_str:
+                        continue
+                    record.stdout_lines += 1
+                    try:
+                        data = json.loads(line_str)
+                    except json.JSONDecodeError:
+                        if on_text:
+                            on_text(line_str)
+                        continue
+                    if on_json:
+                        on_json(data)
+            exit_code = await process.wait()
+            stderr, error = await stderr_task
+            if feeder_task:
+                # restic is gone: stop feeding it, e.g. from a producer that blocks
+                feeder_task.cancel()
+                await asyncio.wait([feeder_task])
+                if not feeder_task.cancelled():
+                    feeder_task.result()
+        finally:
+            if feeder_task and not feeder_task.done():
+                feeder_task.cancel()
+            if timeout_handle:
+                timeout_handle.cancel()
+            if self._kill_handle:
+                self._kill_handle.cancel()
+            if process.returncode is None:
+                # The caller was cancelled (e.g. on shutdown), do not leave restic behind
+                process.kill()
+                stderr_task.cancel()
+
+        result = ResticResult(
+            exit_code=exit_code,
+            duration=loop.time() - start,
+            stdout=stdout,
+            stderr=stderr,
+            error=error,
+            status=self.status if exit_code != 0 else "",
+        )
+        record.duration = result.duration
+        record.exit_code = exit_code
+        record.status = result.status
+        _call_hooks("finished", record)
+        return result
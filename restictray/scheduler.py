@@ -1,13 +1,62 @@
 import asyncio
-from sched import scheduler
+import os
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime
 from typing import Callable, Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.combining import OrTrigger
-from restictray.storage import Storage, Job
-from restictray.restic import BackupExecutor
-from restictray import globals
+from restictray.storage import Storage, Job, JobState, History
+from restictray.restic import BackupExecutor, BatchBackupExecutor, read_files_from
+from restictray.prune import PruneExecutor
+from restictray.watcher import ChangeWatcher, Debouncer
+from restictray.runner import CANCEL_GRACE_TIME
+
+# APScheduler skips a run that starts more than misfire_grace_time seconds late
+# (default: 1 second). When many jobs fire at once the event loop is busy
+# spawning processes for longer than that, and after a suspend runs are hours
+# late, so allow a generous grace time (setting "misfire_grace_time") and
+# coalesce missed runs into one.
+DEFAULT_MISFIRE_GRACE_TIME = 24 * 3600
+
+# How often the wall clock is compared to the monotonic clock to detect a
+# resume from suspend, and how far they must drift apart to count as one
+CLOCK_CHECK_INTERVAL = 30
+CLOCK_JUMP_THRESHOLD = 60
+
+# Delay before persisting job states, so runs starting together cause one write
+STATE_SAVE_DELAY = 2.0
+
+# Seconds a backup job waits for compatible jobs (same repository, arguments and
+# profile) to run them as one restic backup (setting "batch_window"); 0 = off
+DEFAULT_BATCH_WINDOW = 0
+
+# "watch:<quiet>[,<max age>]" schedules: changed paths are backed up after
+# <quiet> without changes, at the latest <max age> after the first change
+# (default: ten times <quiet>, at least 10 minutes). Without a cron or interval
+# trigger next to it, a full backup runs daily, counted from the job's last run.
+DEFAULT_WATCH_MAX_AGE = 600
+WATCH_FULL_BACKUP_DAYS = 1
+
+# Tag of the snapshots of changed paths, e.g. for a separate forget policy
+WATCH_TAG = "restictray-watch"
+
+@dataclass
+class PendingBatch:
+    """Backup jobs waiting for the batch window to close"""
+    jobs: list[Job]
+    # Resolved when the job's run ended or it left the batch, by job name
+    done: dict[str, asyncio.Future] = field(default_factory=dict)
+
+def _parse_duration(text: str) -> int:
+    """Parse "90s", "30m", "1h" or "1d" into seconds"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    text = text.strip()
+    if text[-1:] in units:
+        return int(text[:-1]) * units[text[-1]]
+    raise ValueError(f"Invalid duration: {text}")
 
 class JobScheduler:
     """Manages scheduled backup jobs using APScheduler"""
@@ -22,8 +71,54 @@ class JobScheduler:
         """
         self.storage = storage
         self.log_callback = log_callback
-        self.scheduler = AsyncIOScheduler()
+        self.misfire_grace_time = storage.get_setting("misfire_grace_time", DEFAULT_MISFIRE_GRACE_TIME)
+        self.cancel_grace_time = storage.get_setting("cancel_grace_time", CANCEL_GRACE_TIME)
+        self.batch_window = storage.get_setting("batch_window", DEFAULT_BATCH_WINDOW)
+        self.scheduler = AsyncIOScheduler(job_defaults={
+            "coalesce": True,
+            "misfire_grace_time": self.misfire_grace_time,
+        })
         self.running_executors = {}  # Track running backup executors
+        self.pending_batches: dict[tuple, PendingBatch] = {}  # Jobs waiting for the batch window, by batch key
+        self.watchers: dict[str, ChangeWatcher] = {}  # Change watchers of skip_unchanged and watch: jobs, by name
+        self.debouncers: dict[str, Debouncer] = {}  # Debouncers of watch: jobs, by name
+        self.scheduled_jobs: dict[str, Job] = {}  # Job definitions currently scheduled, by name
+        self.listeners: list[Callable[[str, Job], None]] = []
+        self.progress_listeners: list[Callable[[Job, dict], None]] = []
+        self.job_states: dict[str, JobState] = {}  # Persisted last/next run times, by name
+        self._state_save_handle: asyncio.TimerHandle|None = None
+        self._clock_task: asyncio.Task|None = None
+    
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Get the event loop the scheduler runs on"""
+        return self.scheduler._eventloop or asyncio.get_event_loop()
+    
+    def add_listener(self, callback: Callable[[str, Job], None]):
+        """Register a callback that is called with ("started"|"finished", job)
+        
+        Frontends use this to show running jobs, e.g. the tray icon.
+        """
+        self.listeners.append(callback)
+    
+    def add_progress_listener(self, callback: Callable[[Job, dict], None]):
+        """Register a callback that is called with (job, status) for restic's progress updates"""
+        self.progress_listeners.append(callback)
+    
+    def _notify_progress(self, job: Job, status: dict):
+        """Notify all progress listeners about a status update of a running job"""
+        for callback in self.progress_listeners:
+            try:
+                callback(job, status)
+            except Exception as e:
+                print(f"Error in progress listener: {e}")
+    
+    def _notify(self, event: str, job: Job):
+        """Notify all listeners about a job event"""
+        for callback in self.listeners:
+            try:
+                callback(event, job)
+            except Exception as e:
+                print(f"Error in job listener: {e}")
     
     def log(self, message: str):
         """Log a message using the callback if available"""
@@ -32,65 +127,256 @@ class JobScheduler:
         else:
             print(message)
     
-    async def run_backup_job(self, job: Job):
-        """Execute a backup job"""
-        if job.name in self.running_executors:
+    async def run_backup_job(self, job: Job, force: bool = False):
+        """
+        Execute a backup job, batched with compatible jobs if batching is enabled
+        
+        Args:
+            job: Job to run
+            force: Run even if nothing changed below the paths of a skip_unchanged job
+        """
+        if job.name in self.running_executors or self._get_pending_batch(job.name):
             self.log(f"Job '{job.name}' is already running, skipping this execution")
             return
         
-        self.log(f"Starting scheduled backup job: {job.name}")
+        if not force and self._skip_unchanged(job):
+            return
+        
+        key = self._batch_key(job)
+        if key is None:
+            await self._run_jobs([job])
+            return
+        
+        done = self._get_loop().create_future()
+        batch = self.pending_batches.get(key)
+        if batch is not None:
+            self.log(f"Job '{job.name}' joins the batch of job '{batch.jobs[0].name}'")
+            batch.jobs.append(job)
+            batch.done[job.name] = done
+            await done
+            return
+        
+        batch = PendingBatch(jobs=[job], done={job.name: done})
+        self.pending_batches[key] = batch
+        try:
+            await asyncio.sleep(self.batch_window)
+            del self.pending_batches[key]
+            if batch.jobs:
+                await self._run_jobs(batch.jobs)
+        finally:
+            if self.pending_batches.get(key) is batch:
+                del self.pending_batches[key]
+            for future in batch.done.values():
+                if not future.done():
+                    future.set_result(None)
+    
+    def _batch_key(self, job: Job) -> Optional[tuple]:
+        """Get the key of the jobs a job can share a restic run with, None if it runs alone"""
+        if not self.batch_window or job.type != "backup" or job.files_from:
+            return None
+        return (job.target_repo, tuple(job.additional_args.split()), job.profile or "default")
+    
+    def _skip_unchanged(self, job: Job) -> bool:
+        """Record a skipped run if the watcher saw no change since the last run, returns True then"""
+        watcher = self.watchers.get(job.name)
+        if not job.skip_unchanged or watcher is None or not watcher.unchanged():
+            return False
+        self.log(f"Job '{job.name}': nothing changed since the last run, skipping")
+        self._record_run(job)
+        self._notify("started", job)
+        self.storage.add_history(History(
+            job_name=job.name,
+            repo_name=job.target_repo,
+            timestamp=datetime.now().isoformat(),
+            success=True,
+            files=0,
+            bytes=0,
+            duration=0,
+            snapshot_id="",
+            summary_text="Skipped, nothing changed since the last run",
+            status="unchanged"
+        ))
+        self._notify("finished", job)
+        return True
+    
+    def _get_pending_batch(self, job_name: str) -> Optional[PendingBatch]:
+        """Get the batch a job is waiting in"""
+        for batch in self.pending_batches.values():
+            if any(job.name == job_name for job in batch.jobs):
+                return batch
+        return None
+    
+    async def _run_jobs(self, jobs: list[Job], full: bool = True):
+        """Run a job, or several jobs of one repository as a single restic backup
+        
+        ``full`` is False for a run of just the changed paths of a watch: job.
+        """
+        for job in jobs:
+            self.log(f"Starting scheduled backup job: {job.name}")
+            self._record_run(job, full)
         
         # Get repository configuration
-        repository = self.storage.get_repository(job.target_repo)
+        repository = self.storage.get_repository(jobs[0].target_repo)
         if not repository:
-            self.log(f"Error: Repository '{job.target_repo}' not found for job '{job.name}'")
+            for job in jobs:
+                self.log(f"Error: Repository '{job.target_repo}' not found for job '{job.name}'")
             return
         
+        run_name = "+".join(job.name for job in jobs)
+        
+        def on_progress(status: dict):
+            for job in jobs:
+                self._notify_progress(job, status)
+        
         # Create and run backup executor
-        executor = BackupExecutor(
-            repository=repository,
-            job=job,
-            state_update_callback=lambda msg: self.log(f"[{job.name}] {msg}")
+        executor_args = dict(
+            state_update_callback=lambda msg: self.log(f"[{run_name}] {msg}"),
+            progress_callback=on_progress,
+            kill_grace_time=self.cancel_grace_time
         )
+        if len(jobs) == 1 and jobs[0].type == "prune" and (jobs[0].prune_threshold or jobs[0].prune_budget):
+            executor = PruneExecutor(repository=repository, job=jobs[0], **executor_args)
+        elif len(jobs) == 1:
+            executor = BackupExecutor(repository=repository, job=jobs[0], **executor_args)
+        else:
+            self.log(f"Running jobs {', '.join(job.name for job in jobs)} as one restic backup")
+            executor = BatchBackupExecutor(repository, jobs, **executor_args)
         
-        self.running_executors[job.name] = executor
-        
-        # Set tray icon to show backup is running
-        globals.tray_icon.setIcon(globals.tray_icon.backup_icon)
+        for job in jobs:
+            self.running_executors[job.name] = executor
+            self._notify("started", job)
+            # Changes from now on are picked up by the next run
+            if job.name in self.watchers:
+                self.watchers[job.name].reset()
         
         try:
             summary = await executor.run()
+            if not summary:
+                for job in jobs:
+                    if job.name in self.watchers:
+                        self.watchers[job.name].mark_changed()
+            # Changes made while restic ran are backed up next, and so are
+            # those of a failed run (unless cancelled); that retry waits the
+            # max age, so a repository that is offline is not hammered
+            for job in jobs:
+                watcher = self.watchers.get(job.name)
+                debouncer = self.debouncers.get(job.name)
+                if not debouncer or not watcher:
+                    continue
+                if not summary and executor.status != "cancelled":
+                    self._get_loop().call_later(debouncer.max_age, self._retry_changed_paths, job.name, debouncer)
+                elif summary and watcher.changed_paths:
+                    debouncer.touch()
             
-            if summary:
-                self.log(f"Job '{job.name}' completed successfully")
-            else:
-                self.log(f"Job '{job.name}' failed")
-        #except Exception as e:
-        #    self.log(f"Job '{job.name}' failed with error: {e}")
+            for job in jobs:
+                if summary:
+                    self.log(f"Job '{job.name}' completed successfully")
+                elif executor.status == "timeout":
+                    self.log(f"Job '{job.name}' timed out after {executor.job.timeout}s")
+                elif executor.cancelled:
+                    self.log(f"Job '{job.name}' was cancelled")
+                else:
+                    self.log(f"Job '{job.name}' failed")
         finally:
             # Remove from running executors
-            if job.name in self.running_executors:
-                del self.running_executors[job.name]
-            
-            # Restore normal tray icon if no more backups are running
-            if not self.running_executors:
-                globals.tray_icon.setIcon(globals.tray_icon.normal_icon)
+            for job in jobs:
+                self.running_executors.pop(job.name, None)
+                self._notify("finished", job)
+    
+    async def run_changed_paths(self, job_name: str):
+        """Back up the paths of a watch: job that changed since its last run
+        
+        A full backup runs instead if the changes were not tracked completely.
+        Deleted paths are left to the next full backup.
+        """
+        job = self.scheduled_jobs.get(job_name)
+        watcher = self.watchers.get(job_name)
+        if not job or not watcher:
+            return
+        if job.name in self.running_executors or self._get_pending_batch(job.name):
+            return  # _run_jobs touches the debouncer again when that run finished
+        if watcher.changed_paths_overflow:
+            self.log(f"Job '{job.name}': changes were not tracked completely, running a full backup")
+            await self.run_backup_job(job, force=True)
+            return
+        
+        # The outermost existing paths; deletions are only recorded by a full backup
+        paths = []
+        deleted = False
+        for path in sorted(watcher.changed_paths):
+            if paths and path.startswith(paths[-1].rstrip("/") + "/"):
+                continue
+            if os.path.lexists(path):
+                paths.append(path)
+            else:
+                deleted = True
+        if not paths:
+            return
+        
+        self.log(f"Job '{job.name}': backing up {len(paths)} changed paths")
+        targeted_job = replace(job, directory="", paths=paths, files_from="",
+                               additional_args=f"{job.additional_args} --tag {WATCH_TAG}".strip())
+        await self._run_jobs([targeted_job], full=False)
+        if deleted:
+            watcher.changed = True  # so skip_unchanged does not skip the next full backup
+    
+    def _retry_changed_paths(self, job_name: str, debouncer: Debouncer):
+        """Back up the changes of a watch: job again after a failed run"""
+        if self.debouncers.get(job_name) is debouncer:
+            debouncer.touch()
+    
+    def cancel_job(self, job_name: str) -> bool:
+        """Cancel a running job, returns False if it is not running
+        
+        A job waiting in a batch leaves it; cancelling a batched run cancels
+        all its jobs, as they share one restic process.
+        """
+        batch = self._get_pending_batch(job_name)
+        if batch:
+            self.log(f"Removing job '{job_name}' from its batch")
+            batch.jobs = [job for job in batch.jobs if job.name != job_name]
+            batch.done[job_name].set_result(None)
+            return True
+        executor = self.running_executors.get(job_name)
+        if not executor:
+            return False
+        self.log(f"Cancelling job '{job_name}'")
+        executor.cancel()
+        return True
     
-    def _parse_schedule(self, schedule: str):
+    def cancel_all(self):
+        """Cancel all running and batched jobs, e.g. before quitting"""
+        for batch in list(self.pending_batches.values()):
+            for job in list(batch.jobs):
+                self.cancel_job(job.name)
+        for job_name in list(self.running_executors):
+            self.cancel_job(job_name)
+    
+    def _parse_schedule(self, schedule: str, anchor: str = ""):
         """
         Parse schedule string and return appropriate trigger
         
+        ``anchor`` is the start of the daily full backups of a schedule with
+        only "watch:", see _full_backup_anchor.
+        
         Supports:
         - Cron format: "0 2 * * *" (at 2:00 AM every day)
         - Interval format: "interval:1h", "interval:30m", "interval:1d"
         - Multiple triggers separated by |: "0 2 * * *|interval:6h"
+        - Backups of changed paths: "watch:60s" or "watch:60s,15m", see _parse_watch;
+          only the full backups of other triggers (default: daily) are returned
         """
+        # Checked first, so an invalid watch: spec leaves nothing half set up
+        watch = self._parse_watch(schedule)
+        
         # Split by pipe to handle multiple triggers
         schedule_parts = [s.strip() for s in schedule.split("|")]
         
         triggers = []
         for part in schedule_parts:
-            if part.startswith("interval:"):
+            if part.startswith("watch:"):
+                continue
+            elif part.startswith("interval:"):
                 # Parse interval format
                 interval_str = part.split(":", 1)[1]
                 
@@ -110,12 +396,132 @@ class JobScheduler:
                 # Assume cron format
                 triggers.append(CronTrigger.from_crontab(part))
         
+        if not triggers and watch:
+            start_date = datetime.fromisoformat(anchor) if anchor else None
+            triggers.append(IntervalTrigger(days=WATCH_FULL_BACKUP_DAYS, start_date=start_date))
+        
         # Return single trigger or OrTrigger for multiple
         if len(triggers) == 1:
             return triggers[0]
         else:
             return OrTrigger(triggers)
     
+    def _parse_watch(self, schedule: str) -> Optional[tuple[int, int]]:
+        """Get the (quiet, max age) seconds of a "watch:" schedule, None if there is none"""
+        for part in schedule.split("|"):
+            part = part.strip()
+            if part.startswith("watch:"):
+                values = [_parse_duration(value) for value in part.split(":", 1)[1].split(",")]
+                quiet = values[0]
+                max_age = values[1] if len(values) > 1 else max(quiet * 10, DEFAULT_WATCH_MAX_AGE)
+                return quiet, max_age
+        return None
+    
+    def _full_backup_anchor(self, job: Job) -> str:
+        """Get the last full run of a job whose schedule has only "watch:", "" otherwise
+        
+        Its daily full backup is counted from there, so it is not pushed back
+        by every restart, nor by the runs of its changed paths.
+        """
+        if not all(part.strip().startswith("watch:") for part in job.schedule.split("|")):
+            return ""
+        state = self.job_states.get(job.name)
+        # last_run for states saved before last_full_run existed
+        return (state.last_full_run or state.last_run) if state else ""
+    
+    def _get_misfire_grace_time(self, job: Job) -> int:
+        """Get how many seconds a missed run of the job may be late and still run"""
+        return job.misfire_grace_time or self.misfire_grace_time
+    
+    def _saved_next_run(self, job: Job, trigger) -> Optional[datetime]:
+        """Get the persisted next run time of a job if it is still ahead
+        
+        An interval trigger would otherwise start counting anew at every
+        start, and never fire on a machine restarted more often than that.
+        A time later than the trigger's own next fire time, e.g. from before
+        the schedule was shortened, is not used.
+        """
+        state = self.job_states.get(job.name)
+        if not state or not state.next_run:
+            return None
+        try:
+            saved = datetime.fromisoformat(state.next_run)
+        except ValueError:
+            return None
+        now = datetime.now(self.scheduler.timezone)
+        if saved.tzinfo is None or saved <= now:
+            return None  # overdue runs are caught up by _catch_up_missed_runs
+        next_fire = trigger.get_next_fire_time(None, now)
+        if next_fire is not None and saved > next_fire:
+            return None
+        return saved
+    
+    def _schedule_job(self, job: Job, trigger):
+        """Add a job with an already parsed trigger to the scheduler"""
+        options = {}
+        next_run = self._saved_next_run(job, trigger)
+        if next_run is not None:
+            options["next_run_time"] = next_run
+        self.scheduler.add_job(
+            self.run_backup_job,
+            trigger=trigger,
+            args=[job],
+            id=job.name,
+            name=job.name,
+            replace_existing=False,
+            misfire_grace_time=self._get_misfire_grace_time(job),
+            **options
+        )
+        self.scheduled_jobs[job.name] = job
+        self._update_watcher(job)
+    
+    def _unschedule_job(self, job_name: str):
+        """Remove a job from the scheduler if it is scheduled"""
+        self.scheduled_jobs.pop(job_name, None)
+        if self.scheduler.get_job(job_name):
+            self.scheduler.remove_job(job_name)
+        self._stop_watcher(job_name)
+    
+    def _update_watcher(self, job: Job):
+        """Start, restart or stop the change watcher of a job to match its definition"""
+        watch = self._parse_watch(job.schedule) if job.type == "backup" else None
+        paths = []
+        if (job.skip_unchanged or watch) and job.type == "backup":
+            paths = job.backup_paths()
+            if job.files_from:
+                paths += read_files_from(job.files_from)
+        
+        debouncer = self.debouncers.pop(job.name, None)
+        if debouncer:
+            debouncer.cancel()
+        if watch:
+            quiet, max_age = watch
+            debouncer = Debouncer(quiet, max_age, lambda: self._get_loop().create_task(self.run_changed_paths(job.name)))
+            self.debouncers[job.name] = debouncer
+        on_change = debouncer.touch if watch else None
+        
+        watcher = self.watchers.get(job.name)
+        if watcher and watcher.paths == [os.path.abspath(path) for path in paths]:
+            watcher.on_change = on_change
+            if debouncer and watcher.changed_paths:
+                debouncer.touch()  # changes the old debouncer was waiting for
+            return
+        if watcher:
+            watcher.stop()
+            del self.watchers[job.name]
+        if paths:
+            watcher = ChangeWatcher(job.name, paths, on_change=on_change)
+            self.watchers[job.name] = watcher
+            self._get_loop().create_task(watcher.start())
+    
+    def _stop_watcher(self, job_name: str):
+        watcher = self.watchers.pop(job_name, None)
+        if watcher:
+            watcher.stop()
+        debouncer = self.debouncers.pop(job_name, None)
+        if debouncer:
+            debouncer.cancel()
+    
     def add_job(self, job: Job):
         """Add a job to the scheduler"""
         if not job.enabled:
@@ -123,17 +529,8 @@ class JobScheduler:
             return
         
         try:
-            trigger = self._parse_schedule(job.schedule)
-            print(trigger)
-            
-            self.scheduler.add_job(
-                self.run_backup_job,
-                trigger=trigger,
-                args=[job],
-                id=job.name,
-                name=job.name,
-                replace_existing=False
-            )
+            trigger = self._parse_schedule(job.schedule, self._full_backup_anchor(job))
+            self._schedule_job(job, trigger)
             
             self.log(f"Scheduled job '{job.name}' with schedule: {job.schedule}")
         except Exception as e:
@@ -142,38 +539,183 @@ class JobScheduler:
     def remove_job(self, job_name: str):
         """Remove a job from the scheduler"""
         try:
-            self.scheduler.remove_job(job_name)
+            self._unschedule_job(job_name)
             self.log(f"Removed scheduled job: {job_name}")
         except Exception as e:
             self.log(f"Error removing job '{job_name}': {e}")
     
-    #def tick(self):
-    #    print(f"Tick! The time is: 123")
-
-    def load_and_schedule_all_jobs(self):
-        """Load all jobs from storage and schedule them"""
-        jobs = self.storage.load_jobs()
+    def reconcile(self, jobs: Optional[list[Job]] = None) -> bool:
+        """
+        Bring the scheduled jobs in line with the stored job definitions
         
-        # Clear existing jobs
-        self.scheduler.remove_all_jobs()
+        Only jobs that were added, removed or changed are touched, so all other
+        jobs keep their next run time. A job whose schedule is unchanged keeps
+        its next run time too; running jobs finish with their old definition.
         
-        self.start()
-        # Schedule each job
-        for job in jobs:
-            self.add_job(job)
+        Args:
+            jobs: Job definitions to apply, loaded from storage if not given
+        
+        Returns:
+            False if the jobs file could not be read, True otherwise
+        """
+        if jobs is None:
+            jobs = self.storage.try_load_jobs()
+            if jobs is None:
+                self.log("Could not read jobs file, keeping the current schedule")
+                return False
+        
+        desired = {job.name: job for job in jobs if job.enabled}
+        added = removed = rescheduled = updated = 0
+        triggers = {}
         
-        #print(self.scheduler.add_job(self.tick, "interval", seconds=3))
-        self.log(f"Loaded and scheduled {len([j for j in jobs if j.enabled])} jobs")
+        # Apply all changes while paused so the scheduler wakes up only once
+        paused = self.scheduler.running
+        if paused:
+            self.scheduler.pause()
+        try:
+            for job_name in list(self.scheduled_jobs):
+                if job_name not in desired:
+                    self._unschedule_job(job_name)
+                    removed += 1
+            
+            for job in desired.values():
+                current = self.scheduled_jobs.get(job.name)
+                if current == job and self.scheduler.get_job(job.name):
+                    continue
+                try:
+                    key = (job.schedule, self._full_backup_anchor(job))
+                    if key not in triggers:
+                        triggers[key] = self._parse_schedule(*key)
+                    trigger = triggers[key]
+                    if current is None or not self.scheduler.get_job(job.name):
+                        self.scheduled_jobs.pop(job.name, None)
+                        self._schedule_job(job, trigger)
+                        added += 1
+                    elif current.schedule != job.schedule:
+                        self.scheduler.modify_job(job.name, args=[job], misfire_grace_time=self._get_misfire_grace_time(job))
+                        self.scheduler.reschedule_job(job.name, trigger=trigger)
+                        self.scheduled_jobs[job.name] = job
+                        self._update_watcher(job)
+                        rescheduled += 1
+                    else:
+                        # Same schedule: keep the next run time, update the definition
+                        self.scheduler.modify_job(job.name, args=[job], misfire_grace_time=self._get_misfire_grace_time(job))
+                        self.scheduled_jobs[job.name] = job
+                        self._update_watcher(job)
+                        updated += 1
+                except Exception as e:
+                    self.log(f"Error scheduling job '{job.name}': {e}")
+        finally:
+            if paused:
+                self.scheduler.resume()
+        
+        if added or removed or rescheduled or updated:
+            self.log(f"Jobs reconciled: {added} added, {removed} removed, {rescheduled} rescheduled, {updated} updated")
+            self._record_next_runs()
+        return True
+    
+    # Persistent job state
+    def _record_run(self, job: Job, full: bool = True):
+        """Remember that a job ran now, with all its paths if ``full``, and when it runs next"""
+        state = self.job_states.setdefault(job.name, JobState(name=job.name))
+        state.last_run = datetime.now().astimezone().isoformat()
+        if full:
+            state.last_full_run = state.last_run
+        next_run = self.get_job_next_run_time(job.name)
+        state.next_run = next_run.isoformat() if next_run else ""
+        self._schedule_state_save()
+    
+    def _record_next_runs(self):
+        """Remember the next run time of every scheduled job"""
+        for job_name in list(self.job_states):
+            if job_name not in self.scheduled_jobs:
+                del self.job_states[job_name]
+        for job in self.scheduler.get_jobs():
+            state = self.job_states.setdefault(job.id, JobState(name=job.id))
+            state.next_run = job.next_run_time.isoformat() if job.next_run_time else ""
+        self._schedule_state_save()
+    
+    def _schedule_state_save(self):
+        """Persist the job states soon, coalescing changes that happen together"""
+        if self._state_save_handle is not None:
+            return
+        try:
+            loop = self._get_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or loop.is_closed():
+            self.save_job_states()
+            return
+        self._state_save_handle = loop.call_later(STATE_SAVE_DELAY, self.save_job_states)
+    
+    def save_job_states(self):
+        """Persist the job states now"""
+        if self._state_save_handle is not None:
+            self._state_save_handle.cancel()
+            self._state_save_handle = None
+        self.storage.save_job_states(self.job_states)
+    
+    def _catch_up_missed_runs(self, previous_states: dict[str, JobState]):
+        """Run jobs once whose persisted next run time passed while we were not running"""
+        now = datetime.now().astimezone()
+        for job in list(self.scheduled_jobs.values()):
+            state = previous_states.get(job.name)
+            if not state or not state.next_run:
+                continue
+            try:
+                due = datetime.fromisoformat(state.next_run)
+            except ValueError:
+                continue
+            if due > now:
+                continue
+            late = (now - due).total_seconds()
+            if late > self._get_misfire_grace_time(job):
+                self.log(f"Job '{job.name}' missed its run at {due:%Y-%m-%d %H:%M}, too late to catch up")
+                continue
+            self.log(f"Job '{job.name}' missed its run at {due:%Y-%m-%d %H:%M}, running it now")
+            self._get_loop().create_task(self.run_backup_job(job))
+    
+    async def _watch_clock(self):
+        """Detect a resume from suspend and let the scheduler catch up immediately
+        
+        The event loop uses a monotonic clock that stops during suspend, so
+        APScheduler's timer would fire late by the time spent suspended.
+        """
+        wall, monotonic = time.time(), time.monotonic()
+        while True:
+            await asyncio.sleep(CLOCK_CHECK_INTERVAL)
+            new_wall, new_monotonic = time.time(), time.monotonic()
+            jump = (new_wall - wall) - (new_monotonic - monotonic)
+            wall, monotonic = new_wall, new_monotonic
+            if jump > CLOCK_JUMP_THRESHOLD and self.scheduler.running:
+                self.log(f"Resumed after {jump / 60:.0f} minutes, running missed jobs")
+                self.scheduler.wakeup()
+    
+    def load_and_schedule_all_jobs(self):
+        """Load all jobs from storage, schedule them and catch up on missed runs"""
+        previous_states = self.storage.load_job_states()
+        self.job_states = {name: JobState(**vars(state)) for name, state in previous_states.items()}
+        self.start()
+        self.reconcile(self.storage.load_jobs())
+        self.log(f"Loaded and scheduled {len(self.scheduled_jobs)} jobs")
+        self._catch_up_missed_runs(previous_states)
     
     def start(self):
         """Start the scheduler"""
         if not self.scheduler.running:
             self.scheduler.start()
+            self._clock_task = self._get_loop().create_task(self._watch_clock())
             self.log("Job scheduler started")
     
     def shutdown(self):
         """Shutdown the scheduler"""
         if self.scheduler.running:
+            if self._clock_task:
+                self._clock_task.cancel()
+                self._clock_task = None
+            self.save_job_states()
+            for job_name in list(self.watchers):
+                self._stop_watcher(job_name)
             self.scheduler.shutdown()
             self.log("Job scheduler stopped")
     
@@ -0,0 +1,183 @@
+"""Per-repository cache of snapshot lists and snapshot listings
+
+Snapshots are immutable, so a cached list only goes stale when snapshots are
+added or removed. Backups run by ResticTray add their snapshot, forget jobs
+invalidate the list, and lists older than the setting "snapshot_cache_max_age"
+(seconds, default 3600) are reloaded to pick up changes made elsewhere.
+
+The `restic ls` listings of snapshots never go stale. The most recently used
+ones are kept up to the setting "listing_cache_bytes" (default 200 MiB) and
+dropped when their snapshot disappears from a reloaded list. A decoded node
+takes about 2 KB, so the size of a listing is estimated from a sample of its
+nodes; a listing larger than the limit is not cached at all.
+"""
+
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from restictray.storage import Repository, Storage
+from restictray.credentials import CredentialError
+from restictray.runner import ResticRunner, ResticError
+
+DEFAULT_MAX_AGE = 3600
+DEFAULT_LISTING_CACHE_BYTES = 200 * 1024 * 1024
+
+# Nodes of a listing measured to estimate its size
+LISTING_SAMPLE_NODES = 100
+
+
+@dataclass
+class CachedSnapshots:
+    """Snapshot list of a repository and when it was loaded"""
+    snapshots: list
+    loaded: float
+
+
+_cache: dict[str, CachedSnapshots] = {}
+_load_locks: dict[str, asyncio.Lock] = {}
+_listings: OrderedDict[tuple[str, str], list] = OrderedDict()  # (repository, snapshot ID) -> nodes
+_listing_bytes: dict[tuple[str, str], int] = {}  # estimated size of each cached listing
+_listing_locks: dict[tuple[str, str], asyncio.Lock] = {}
+_listing_users: dict[tuple[str, str], int] = {}  # callers holding or waiting for each lock
+
+
+def _max_age() -> float:
+    return Storage().get_setting("snapshot_cache_max_age", DEFAULT_MAX_AGE)
+
+
+def store(repo_name: str, snapshots: list):
+    """Replace the cached list of a repository, e.g. after the Browse tab loaded it"""
+    _cache[repo_name] = CachedSnapshots(snapshots=list(snapshots), loaded=time.monotonic())
+    snapshot_ids = {snapshot.get("id") for snapshot in snapshots}
+    for key in [key for key in _listings if key[0] == repo_name and key[1] not in snapshot_ids]:
+        del _listings[key]
+        del _listing_bytes[key]
+
+
+def add(repo_name: str, snapshot: dict):
+    """Add a snapshot that was just created; ignored if the list is not cached"""
+    cached = _cache.get(repo_name)
+    if cached is not None:
+        cached.snapshots.append(snapshot)
+
+
+def invalidate(repo_name: Optional[str] = None):
+    """Forget the cached list of a repository, or of all repositories"""
+    if repo_name is None:
+        _cache.clear()
+    else:
+        _cache.pop(repo_name, None)
+
+
+async def refresh(repository: Repository, runner: Optional[ResticRunner] = None) -> list:
+    """Load the snapshot list with restic and cache it
+
+    Raises RuntimeError with restic's error message if restic fails.
+    """
+    try:
+        snapshots = await (runner or ResticRunner(repository)).json('--json', 'snapshots')
+    except (ResticError, CredentialError) as e:
+        raise RuntimeError(str(e))
+    store(repository.name, snapshots or [])
+    return _cache[repository.name].snapshots
+
+
+async def get(repository: Repository) -> list:
+    """Get the snapshot list, from the cache if it is recent enough"""
+    lock = _load_locks.setdefault(repository.name, asyncio.Lock())
+    # Concurrent callers share one restic run
+    async with lock:
+        cached = _cache.get(repository.name)
+        if cached is not None and time.monotonic() - cached.loaded < _max_age():
+            return cached.snapshots
+        return await refresh(repository)
+
+
+def find(snapshots: list, snapshot_id: str) -> Optional[dict]:
+    """Find a snapshot by its full ID or an ID prefix"""
+    if not snapshot_id:
+        return None
+    for snapshot in snapshots:
+        if snapshot.get("id", "").startswith(snapshot_id):
+            return snapshot
+    return None
+
+
+def _listing_key(repo_name: str, snapshot_id: str) -> tuple[str, str]:
+    """Cache key of a listing; short IDs are resolved with the cached snapshot list"""
+    cached = _cache.get(repo_name)
+    snapshot = find(cached.snapshots, snapshot_id) if cached else None
+    return (repo_name, snapshot["id"] if snapshot else snapshot_id)
+
+
+def cached_listing(repo_name: str, snapshot_id: str) -> Optional[list]:
+    """Get the cached `restic ls` nodes of a snapshot, None if it was not listed yet"""
+    key = _listing_key(repo_name, snapshot_id)
+    listing = _listings.get(key)
+    if listing is not None:
+        _listings.move_to_end(key)
+    return listing
+
+
+def _node_bytes(node) -> int:
+    # Keys are not shared between nodes, every JSON line is decoded on its own
+    if not isinstance(node, dict):
+        return sys.getsizeof(node)
+    return sys.getsizeof(node) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in node.items())
+
+
+def _estimate_bytes(nodes: list) -> int:
+    """Estimate the memory a listing takes from an evenly spread sample of its nodes"""
+    if not nodes:
+        return 0
+    sample = nodes[::max(len(nodes) // LISTING_SAMPLE_NODES, 1)]
+    return len(nodes) * sum(_node_bytes(node) for node in sample) // len(sample)
+
+
+def _store_listing(key: tuple[str, str], nodes: list):
+    limit = Storage().get_setting("listing_cache_bytes", DEFAULT_LISTING_CACHE_BYTES)
+    size = _estimate_bytes(nodes)
+    if size > limit:
+        return
+    _listings[key] = nodes
+    _listings.move_to_end(key)
+    _listing_bytes[key] = size
+    total = sum(_listing_bytes.values())
+    while total > limit:
+        evicted, _ = _listings.popitem(last=False)
+        total -= _listing_bytes.pop(evicted)
+
+
+async def get_listing(repository: Repository, snapshot_id: str, runner: Optional[ResticRunner] = None) -> list:
+    """Get the `restic ls` nodes of a snapshot, from the cache if it was listed before
+
+    Raises RuntimeError with restic's error message if restic fails.
+    """
+    key = _listing_key(repository.name, snapshot_id)
+    lock = _listing_locks.setdefault(key, asyncio.Lock())
+    _listing_users[key] = _listing_users.get(key, 0) + 1
+    # A listing that is being loaded in the background is waited for
+    try:
+        async with lock:
+            listing = cached_listing(repository.name, snapshot_id)
+            if listing is not None:
+                return listing
+            nodes = []
+            try:
+                # JSON lines are decoded while restic prints them
+                result = await (runner or ResticRunner(repository)).stream('ls', key[1], '--json', on_json=nodes.append)
+            except CredentialError as e:
+                raise RuntimeError(str(e))
+            if not result.success:
+                raise RuntimeError(result.error_message())
+            _store_listing(key, nodes)
+            return nodes
+    finally:
+        # Dropped only once nobody waits for it, so later callers share it too
+        _listing_users[key] -= 1
+        if not _listing_users[key]:
+            del _listing_users[key]
+            del _listing_locks[key]
@@ -0,0 +1,198 @@
+"""Per-repository statistics, refreshed in the background
+
+`restic stats` reads every tree of a repository, which takes minutes to hours
+on large repositories, so the results are kept in repository_stats.json and
+shown from there. StatsRefresher updates them with the "background" resource
+profile, one repository at a time: when they are older than the setting
+"stats_refresh_interval" (seconds, default one day, 0 = only on request) and
+a few minutes after a backup, forget or prune changed the repository.
+`restic stats` only reads, so it does not take the repository lock; like
+prewarming, it is not started while a job holds the repository and a job
+starting meanwhile cancels it, and it is retried later.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Callable, Optional
+from restictray.storage import Repository, RepositoryStats, Storage
+from restictray.credentials import CredentialError
+from restictray.runner import ResticRunner, ResticError, ResticCancelled, RunRecord
+from restictray import runner as restic_runner
+from restictray import snapshots as snapshot_cache
+from restictray import globals
+
+DEFAULT_REFRESH_INTERVAL = 24 * 3600
+
+# Seconds after startup before stale statistics are refreshed, and between checks
+STARTUP_DELAY = 300
+CHECK_INTERVAL = 600
+
+# Seconds after a run that changed a repository before its statistics are
+# refreshed, so a burst of jobs causes one refresh
+CHANGE_DELAY = 120
+
+# Seconds after yielding to a job before a refresh is retried
+RETRY_DELAY = 60
+
+# restic commands that change the numbers
+CHANGING_COMMANDS = {"backup", "forget", "prune"}
+
+
+def format_size(size: float) -> str:
+    """Format a byte count like restic does"""
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if size < 1024 or unit == "TiB":
+            break
+        size /= 1024
+    return f"{size:.0f} {unit}" if unit == "B" else f"{size:.3f} {unit}"
+
+
+async def refresh(repository: Repository, runner: Optional[ResticRunner] = None) -> RepositoryStats:
+    """Measure a repository with restic and store the statistics
+
+    A failure is stored in RepositoryStats.error next to the previous numbers.
+    Raises ResticCancelled if the runner was cancelled.
+    """
+    storage = Storage()
+    stats = storage.get_repository_stats(repository.name) or RepositoryStats(name=repository.name)
+    runner = runner or ResticRunner(repository, profile="background")
+    try:
+        raw = await runner.json("--json", "stats", "--mode", "raw-data")
+        restore = await runner.json("--json", "stats", "--mode", "restore-size")
+        snapshots = await snapshot_cache.get(repository)
+    except (ResticError, CredentialError, RuntimeError) as e:
+        if runner.cancelled:
+            raise ResticCancelled(runner.status)
+        stats.error = str(e)
+        print(f"Cannot refresh the statistics of '{repository.name}': {e}")
+        storage.save_repository_stats(stats)
+        return stats
+    stats.updated = datetime.now().isoformat()
+    stats.error = ""
+    stats.raw_size = raw.get("total_size", 0)
+    stats.uncompressed_size = raw.get("total_uncompressed_size", 0) or stats.raw_size
+    stats.blob_count = raw.get("total_blob_count", 0)
+    stats.restore_size = restore.get("total_size", 0)
+    stats.file_count = restore.get("total_file_count", 0)
+    stats.snapshots = len(snapshots)
+    stats.last_backup = max((snapshot.get("time", "") for snapshot in snapshots), default="")
+    storage.save_repository_stats(stats)
+    return stats
+
+
+class StatsRefresher:
+    """Keeps the statistics of all repositories up to date, see the module docstring"""
+
+    def __init__(self, storage: Storage, on_update: Optional[Callable[[RepositoryStats], None]] = None):
+        """
+        Initialize the refresher
+
+        Args:
+            storage: Storage instance for the repositories and their statistics
+            on_update: Called with the new statistics after every refresh
+        """
+        self.storage = storage
+        self.on_update = on_update
+        self.interval = storage.get_setting("stats_refresh_interval", DEFAULT_REFRESH_INTERVAL)
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._delayed: dict[str, asyncio.TimerHandle] = {}
+        self._task: asyncio.Task|None = None
+        self._check_task: asyncio.Task|None = None
+        self._runner: ResticRunner|None = None
+        self._repo_name: str|None = None  # repository being refreshed
+
+    def start(self):
+        """Start refreshing in the background"""
+        if self._task is not None:
+            return
+        self._task = asyncio.ensure_future(self._work())
+        if self.interval:
+            self._check_task = asyncio.ensure_future(self._check_stale())
+        restic_runner.add_hook(self._on_restic_run)
+
+    def stop(self):
+        """Stop refreshing and cancel a running restic stats"""
+        if self._on_restic_run in restic_runner.hooks:
+            restic_runner.hooks.remove(self._on_restic_run)
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+        if self._runner:
+            self._runner.cancel()
+        for task in (self._task, self._check_task):
+            if task:
+                task.cancel()
+        self._task = self._check_task = None
+
+    def request(self, repo_name: str, delay: float = 0):
+        """Refresh a repository's statistics, after ``delay`` seconds"""
+        if delay > 0:
+            if repo_name not in self._delayed:
+                self._delayed[repo_name] = asyncio.get_event_loop().call_later(
+                    delay, self._enqueue_delayed, repo_name)
+            return
+        if repo_name not in self._queued:
+            self._queued.add(repo_name)
+            self._queue.put_nowait(repo_name)
+
+    def _enqueue_delayed(self, repo_name: str):
+        self._delayed.pop(repo_name, None)
+        self.request(repo_name)
+
+    def _on_restic_run(self, event: str, record: RunRecord):
+        if record.profile == "background":
+            return  # our own runs, or other background work
+        if (event == "finished" and record.command in CHANGING_COMMANDS and record.exit_code == 0
+                and self.interval):
+            self.request(record.repository, CHANGE_DELAY)
+        elif (event == "started" and record.repository == self._repo_name and self._runner
+              and globals.get_repo_lock(record.repository).locked()):
+            # A job holds the repository now; let it have the I/O
+            self._runner.cancel()
+
+    def is_stale(self, stats: Optional[RepositoryStats]) -> bool:
+        """Check whether statistics are missing or older than the refresh interval"""
+        if stats is None or not stats.updated:
+            return True
+        try:
+            age = (datetime.now() - datetime.fromisoformat(stats.updated)).total_seconds()
+        except ValueError:
+            return True
+        return age >= self.interval
+
+    async def _check_stale(self):
+        await asyncio.sleep(STARTUP_DELAY)
+        while True:
+            all_stats = self.storage.load_repository_stats()
+            for repository in self.storage.load_repositories():
+                if self.is_stale(all_stats.get(repository.name)):
+                    self.request(repository.name)
+            await asyncio.sleep(CHECK_INTERVAL)
+
+    async def _work(self):
+        while True:
+            repo_name = await self._queue.get()
+            self._queued.discard(repo_name)
+            repository = self.storage.get_repository(repo_name)
+            if repository is None:
+                continue  # deleted meanwhile
+            if globals.get_repo_lock(repo_name).locked():
+                self.request(repo_name, RETRY_DELAY)
+                continue
+            print(f"Refreshing the statistics of '{repo_name}'")
+            self._repo_name = repo_name
+            self._runner = ResticRunner(repository, profile="background")
+            try:
+                stats = await refresh(repository, self._runner)
+            except ResticCancelled:
+                if self._task is None:
+                    return  # stopped
+                print(f"Refreshing the statistics of '{repo_name}' yields to a job, retrying in {RETRY_DELAY}s")
+                self.request(repo_name, RETRY_DELAY)
+                continue
+            finally:
+                self._runner = None
+                self._repo_name = None
+            if self.on_update:
+                self.on_update(stats)
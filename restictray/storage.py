@@ -1,7 +1,7 @@
 import json
 from pathlib import Path
-from typing import Any, Dict, List, Optional
-from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+from dataclasses import dataclass, asdict, field
 
 
 @dataclass
@@ -10,6 +10,7 @@ class Repository:
     name: str
     url: str
     password: str
+    password_source: str = ""  # "", "keyring", "file:<path>" or "command:<cmd>", see credentials.py
 
 
 @dataclass
@@ -17,11 +18,28 @@ class Job:
     """Represents a scheduled backup job"""
     name: str
     target_repo: str
-    type: str  # e.g., 'backup', 'forget', 'prune'
+    type: str  # e.g., 'backup', 'forget', 'prune', 'check', 'stdin'
     schedule: str
     additional_args: str
     directory: str
     enabled: bool = True
+    misfire_grace_time: int = 0  # seconds a missed run may be late, 0 = use the global setting
+    timeout: int = 0  # maximum runtime in seconds, 0 = unlimited
+    profile: str = ""  # resource profile of restic, see runner.py; empty = "default"
+    paths: List[str] = field(default_factory=list)  # backup paths, replace `directory` if set
+    files_from: str = ""  # file listing further backup paths (restic --files-from)
+    skip_unchanged: bool = False  # skip runs while inotify saw no change below the paths, see watcher.py
+    stdin_command: str = ""  # "stdin" jobs: shell command whose output is backed up, e.g. a database dump
+    stdin_filename: str = ""  # "stdin" jobs: file name in the snapshot, default: the job name
+    read_data_subsets: int = 0  # "check" jobs: verify all data over this many runs (--read-data-subset=n/N), 0 = off
+    prune_threshold: int = 0  # "prune" jobs: only prune once this percentage of the repository is unused, see prune.py
+    prune_budget: int = 0  # "prune" jobs: seconds a prune should take, limits --max-repack-size; 0 = no limit
+
+    def backup_paths(self) -> List[str]:
+        """Get the paths backed up by the job"""
+        if self.paths:
+            return list(self.paths)
+        return [self.directory] if self.directory else []
 
 @dataclass
 class History:
@@ -37,6 +55,45 @@ class History:
     exit_code: int = 0
     bytes_added: int = 0
     summary_text: str = ""
+    status: str = ""  # "success", "failed", "cancelled", "timeout" or "unchanged"; empty in older entries
+    parent_snapshot: str = ""  # parent passed to restic backup, empty if restic chose it or there was none
+    producer_exit_code: int = 0  # "stdin" jobs: exit code of the producer command, -1 if it was killed
+    data_subset: str = ""  # "check" jobs: data subset "n/N" that was verified
+    repo_size: int = 0  # managed "prune" jobs: repository size before the prune, in bytes
+    unused_bytes: int = 0  # managed "prune" jobs: unused space, after the prune if it ran
+    reclaimed_bytes: int = 0  # managed "prune" jobs
+    repacked_bytes: int = 0  # managed "prune" jobs
+
+@dataclass
+class JobState:
+    """Represents the persisted scheduler state of a job"""
+    name: str
+    last_run: str = "" # ISO format
+    next_run: str = "" # ISO format
+    last_full_run: str = "" # ISO format, not set by runs of only the changed paths of watch: jobs
+
+@dataclass
+class CheckState:
+    """Represents the position of a check job's rotating data verification"""
+    name: str  # job name
+    subsets: int = 0  # N of --read-data-subset=n/N the position refers to
+    next_subset: int = 1  # n of the next run
+    cycle_start: str = ""  # ISO format, when subset 1 of the current cycle was verified
+    failed_subsets: List[int] = field(default_factory=list)  # subsets whose last check failed
+
+@dataclass
+class RepositoryStats:
+    """Represents the cached statistics of a repository, see stats.py"""
+    name: str  # repository name
+    updated: str = ""  # ISO format, when restic stats last succeeded
+    snapshots: int = 0
+    last_backup: str = ""  # time of the newest snapshot, as restic reports it
+    raw_size: int = 0  # bytes stored in the repository (restic stats --mode raw-data)
+    uncompressed_size: int = 0
+    blob_count: int = 0
+    restore_size: int = 0  # bytes of all snapshots when restored (--mode restore-size)
+    file_count: int = 0
+    error: str = ""  # message of the last failed refresh
 
 class Storage:
     """Handles saving and loading application data to disk"""
@@ -56,6 +113,29 @@ class Storage:
         self.jobs_file = self.config_dir / "jobs.json"
         self.settings_file = self.config_dir / "settings.json"
         self.history_file = self.config_dir / "history.json"
+        self.scheduler_state_file = self.config_dir / "scheduler_state.json"
+        self.check_state_file = self.config_dir / "check_state.json"
+        self.repository_stats_file = self.config_dir / "repository_stats.json"
+        
+        # Name indexes of loaded files, keyed by file path; validated by mtime and size
+        self._index_cache: Dict[Path, tuple] = {}
+    
+    def _file_key(self, file_path: Path) -> Optional[tuple]:
+        """Get a key that changes whenever the file is modified"""
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _index(self, file_path: Path, loader: Callable[[], List[Any]]) -> Dict[str, Any]:
+        """Get a name -> item index of a file, reloading it only if it changed"""
+        key = self._file_key(file_path)
+        cached = self._index_cache.get(file_path)
+        if cached is None or cached[0] != key:
+            cached = (key, {item.name: item for item in loader()})
+            self._index_cache[file_path] = cached
+        return cached[1]
     
     def _load_json(self, file_path: Path) -> Any:
         """Load JSON from a file"""
@@ -71,6 +151,7 @@ class Storage:
     
     def _save_json(self, file_path: Path, data: Any) -> bool:
         """Save data to a JSON file"""
+        self._index_cache.pop(file_path, None)
         try:
             with open(file_path, 'w') as f:
                 json.dump(data, f, indent=2)
@@ -107,11 +188,7 @@ class Storage:
     
     def get_repository(self, name: str) -> Optional[Repository]:
         """Get a repository by name"""
-        repos = self.load_repositories()
-        for repo in repos:
-            if repo.name == name:
-                return repo
-        return None
+        return self._index(self.repositories_file, self.load_repositories).get(name)
     
     def update_repository(self, name: str, updated_repo: Repository) -> bool:
         """Update an existing repository"""
@@ -146,6 +223,18 @@ class Storage:
         
         return [Job(**job) for job in data]
     
+    def try_load_jobs(self) -> Optional[List[Job]]:
+        """Load all jobs from disk, or return None if the file is unreadable or invalid"""
+        if not self.jobs_file.exists():
+            return []
+        try:
+            with open(self.jobs_file, 'r') as f:
+                data = json.load(f)
+            return [Job(**job) for job in data or []]
+        except (json.JSONDecodeError, IOError, TypeError) as e:
+            print(f"Error loading {self.jobs_file}: {e}")
+            return None
+    
     def save_jobs(self, jobs: List[Job]) -> bool:
         """Save jobs to disk"""
         data = [asdict(job) for job in jobs]
@@ -165,11 +254,7 @@ class Storage:
     
     def get_job(self, name: str) -> Optional[Job]:
         """Get a job by name"""
-        jobs = self.load_jobs()
-        for job in jobs:
-            if job.name == name:
-                return job
-        return None
+        return self._index(self.jobs_file, self.load_jobs).get(name)
     
     def update_job(self, name: str, updated_job: Job) -> bool:
         """Update an existing job"""
@@ -195,6 +280,57 @@ class Storage:
         
         return self.save_jobs(jobs)
     
+    # Scheduler state methods
+    def load_job_states(self) -> Dict[str, JobState]:
+        """Load the persisted scheduler state of all jobs"""
+        data = self._load_json(self.scheduler_state_file)
+        if not data:
+            return {}
+        return {state["name"]: JobState(**state) for state in data}
+    
+    def save_job_states(self, states: Dict[str, JobState]) -> bool:
+        """Save the scheduler state of all jobs"""
+        data = [asdict(state) for state in states.values()]
+        return self._save_json(self.scheduler_state_file, data)
+    
+    # Check state methods
+    def load_check_states(self) -> Dict[str, CheckState]:
+        """Load the data verification position of all check jobs"""
+        data = self._load_json(self.check_state_file)
+        if not data:
+            return {}
+        return {state["name"]: CheckState(**state) for state in data}
+    
+    def get_check_state(self, name: str) -> Optional[CheckState]:
+        """Get the data verification position of a check job"""
+        return self.load_check_states().get(name)
+    
+    def save_check_state(self, state: CheckState) -> bool:
+        """Save the data verification position of a check job"""
+        states = self.load_check_states()
+        states[state.name] = state
+        data = [asdict(state) for state in states.values()]
+        return self._save_json(self.check_state_file, data)
+    
+    # Repository statistics methods
+    def load_repository_stats(self) -> Dict[str, RepositoryStats]:
+        """Load the cached statistics of all repositories"""
+        data = self._load_json(self.repository_stats_file)
+        if not data:
+            return {}
+        return {stats["name"]: RepositoryStats(**stats) for stats in data}
+    
+    def get_repository_stats(self, name: str) -> Optional[RepositoryStats]:
+        """Get the cached statistics of a repository"""
+        return self.load_repository_stats().get(name)
+    
+    def save_repository_stats(self, stats: RepositoryStats) -> bool:
+        """Save the statistics of a repository"""
+        all_stats = self.load_repository_stats()
+        all_stats[stats.name] = stats
+        data = [asdict(entry) for entry in all_stats.values()]
+        return self._save_json(self.repository_stats_file, data)
+    
     # Settings methods
     def load_settings(self) -> Dict[str, Any]:
         """Load application settings from disk"""
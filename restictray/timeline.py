@@ -0,0 +1,32 @@
+"""Startup timeline printed with --profile-startup"""
+
+import time
+
+_start = time.perf_counter()
+_enabled = False
+
+
+def enable():
+    """Print a line for every mark() from now on"""
+    global _enabled
+    _enabled = True
+    mark("timeline enabled")
+
+
+def _rss_mb() -> float:
+    """Current resident set size in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        import os
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def mark(label: str):
+    """Record that startup reached ``label``"""
+    if _enabled:
+        elapsed = (time.perf_counter() - _start) * 1000
+        print(f"[startup] {elapsed:8.1f} ms {_rss_mb():7.1f} MB  {label}", flush=True)
@@ -0,0 +1,323 @@
+"""Tracks filesystem changes below backup paths with Linux inotify
+
+A ChangeWatcher watches every directory below a job's paths. Jobs with
+``skip_unchanged`` are skipped while nothing changed since their last run
+started. When the watch cannot be set up completely (no inotify, watch limit
+fs.inotify.max_user_watches reached) or events were lost, the watcher
+reports changes, so the job falls back to a full run.
+
+The parent directory of every path is watched as well: a file replaced by
+rename (the usual editor save) or a deleted and recreated directory loses its
+own watch, and is watched again when it shows up in the parent.
+
+Jobs with a ``watch:`` schedule back up the changed paths once changes
+settle, see Debouncer and JobScheduler.run_changed_paths.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+from typing import Callable, Optional
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# Changed paths kept per watcher; beyond this only "something changed" is known
+MAX_CHANGED_PATHS = 10000
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(_libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+    return _libc
+
+
+class Inotify:
+    """Minimal non-blocking inotify instance"""
+
+    def __init__(self):
+        self.libc = _get_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+    def add_watch(self, path: str, mask: int = WATCH_MASK) -> int:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def read_events(self) -> list[tuple[int, int, str]]:
+        """Read the pending (wd, mask, name) events"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class ChangeWatcher:
+    """Watches the directory trees below some paths for changes"""
+
+    def __init__(self, name: str, paths: list[str], on_change: Optional[Callable[[str], None]] = None):
+        """
+        Initialize the watcher
+
+        Args:
+            name: Name for log messages, e.g. the job name
+            paths: Directories or files to watch
+            on_change: Called with the path of every change
+        """
+        self.name = name
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.on_change = on_change
+        self.inotify: Inotify|None = None
+        self.watches: dict[int, str] = {}  # wd -> watched path
+        self.parent_watches: dict[int, dict[str, str]] = {}  # wd -> {name: path} of the paths' parents
+        self.ready = False  # all watches were added
+        self.failed = ""  # why changes cannot be tracked
+        # Unknown until the first run started after the watches were added
+        self.changed = True
+        self.changed_paths: set[str] = set()
+        self.changed_paths_overflow = False  # more changes than MAX_CHANGED_PATHS, or lost events
+        self._loop: asyncio.AbstractEventLoop|None = None
+
+    def unchanged(self) -> bool:
+        """Check whether nothing changed since reset()"""
+        return self.ready and not self.failed and not self.changed
+
+    def reset(self):
+        """Start tracking changes from now, e.g. when a backup starts"""
+        self.changed = False
+        self.changed_paths = set()
+        self.changed_paths_overflow = False
+
+    def mark_changed(self):
+        """Treat everything as changed, e.g. after a failed backup"""
+        self.changed = True
+        self.changed_paths_overflow = True
+
+    async def start(self):
+        """Add the watches; the directory walk runs in a thread"""
+        self._loop = asyncio.get_running_loop()
+        try:
+            self.inotify = Inotify()
+        except OSError as e:
+            self.failed = f"inotify unavailable: {e.strerror}"
+            print(f"Cannot watch '{self.name}' for changes: {self.failed}")
+            return
+        self._loop.add_reader(self.inotify.fd, self._on_readable)
+        for path in self.paths:
+            await self._loop.run_in_executor(None, self._watch_parent, path)
+            if self.failed or self.inotify is None:
+                break
+            await self._loop.run_in_executor(None, self._watch_tree, path)
+            if self.failed or self.inotify is None:
+                break
+        if self.inotify is not None and not self.failed:
+            self.ready = True
+            print(f"Watching {len(self.watches)} directories of '{self.name}' for changes")
+
+    def stop(self):
+        """Remove all watches"""
+        if self.inotify is not None:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(self.inotify.fd)
+            self.inotify.close()
+            self.inotify = None
+        self.watches.clear()
+        self.parent_watches.clear()
+        self.ready = False
+
+    def _watch_parent(self, path: str):
+        """Watch the directory containing a path, to notice it being replaced"""
+        parent, name = os.path.split(path)
+        if not name or self.inotify is None:
+            return  # the root directory is never replaced
+        try:
+            wd = self.inotify.add_watch(parent)
+        except OSError as e:
+            self._watch_error(e, ignore_missing=False)
+            return
+        self.parent_watches.setdefault(wd, {})[name] = path
+
+    def _watch_tree(self, root: str, new: bool = False):
+        """Watch a path and, if it is a directory, every directory below it
+
+        ``new`` is set for directories created while watching, which may be
+        gone again already.
+        """
+        inotify = self.inotify
+        if inotify is None:
+            return
+        if root in self.paths and os.path.isfile(root):
+            return  # seen through the parent's watch, which outlives the file
+        try:
+            self.watches[inotify.add_watch(root)] = root
+        except OSError as e:
+            self._watch_error(e, ignore_missing=new)
+            return
+        for directory, subdirectories, _ in os.walk(root):
+            for subdirectory in subdirectories:
+                path = os.path.join(directory, subdirectory)
+                if os.path.islink(path):
+                    continue
+                if self.inotify is None:
+                    return  # stopped meanwhile
+                try:
+                    self.watches[inotify.add_watch(path)] = path
+                except OSError as e:
+                    if not self._watch_error(e, ignore_missing=True):
+                        return
+
+    def _watch_error(self, error: OSError, ignore_missing: bool) -> bool:
+        """Handle a failed inotify_add_watch, returns True if watching can go on"""
+        if ignore_missing and error.errno in (errno.ENOENT, errno.EACCES):
+            return True  # removed meanwhile or unreadable; restic reports it
+        if error.errno == errno.ENOSPC:
+            self.failed = "inotify watch limit reached (fs.inotify.max_user_watches)"
+            print(f"Cannot watch '{self.name}' for changes: {self.failed}, running full backups")
+        else:
+            self.failed = f"{error.filename}: {error.strerror}"
+            print(f"Cannot watch '{self.name}' for changes: {self.failed}")
+        return False
+
+    def _changed(self, path: str):
+        self.changed = True
+        if not self.changed_paths_overflow:
+            if len(self.changed_paths) >= MAX_CHANGED_PATHS:
+                self.changed_paths_overflow = True
+                self.changed_paths = set()
+            else:
+                self.changed_paths.add(path)
+        if self.on_change:
+            self.on_change(path)
+
+    def _on_readable(self):
+        if self.inotify is None:
+            return
+        for wd, mask, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                print(f"Change events of '{self.name}' were lost")
+                self.mark_changed()
+                if self.on_change:
+                    self.on_change("")
+                continue
+            directory = self.watches.get(wd)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                if directory in self.paths:
+                    self._path_lost(directory)
+                if self.parent_watches.pop(wd, None) is not None:
+                    self.failed = "a parent directory of the backup paths was removed"
+                    print(f"Cannot watch '{self.name}' for changes: {self.failed}, running full backups")
+                    if self.on_change:
+                        self.on_change("")
+                continue
+            path = self.parent_watches.get(wd, {}).get(name) if name else None
+            if path is not None:
+                # Created, replaced or changed in the parent; for a file this
+                # is the only watch
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._loop.run_in_executor(None, self._watch_tree, path, True)
+                self._changed(path)
+                continue
+            if directory is None:
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # New directories are watched too, also while start() is still
+                # walking (a directory watched twice keeps its wd); a moved-in
+                # tree may be large
+                self._loop.run_in_executor(None, self._watch_tree, path, True)
+            self._changed(path)
+
+    def _path_lost(self, path: str):
+        """Handle the watch of a backup path being removed with it"""
+        # What is there now is unknown, e.g. a directory moved away and another
+        # moved in; back up everything once
+        self.mark_changed()
+        if self.on_change:
+            self.on_change(path)
+        self._loop.run_in_executor(None, self._watch_tree, path, True)
+
+
+class Debouncer:
+    """Calls a callback once changes stopped for ``quiet`` seconds
+
+    A steady stream of changes still triggers the callback ``max_age``
+    seconds after the first change.
+    """
+
+    def __init__(self, quiet: float, max_age: float, callback: Callable[[], None]):
+        self.quiet = quiet
+        self.max_age = max_age
+        self.callback = callback
+        self._first: float|None = None
+        self._last = 0.0
+        self._handle: asyncio.TimerHandle|None = None
+
+    def touch(self, path: str = ""):
+        """Record a change"""
+        loop = asyncio.get_event_loop()
+        self._last = loop.time()
+        if self._first is None:
+            self._first = self._last
+        # One timer per batch; it is moved when it fires too early
+        if self._handle is None:
+            self._handle = loop.call_later(self.quiet, self._check)
+
+    def _check(self):
+        loop = asyncio.get_event_loop()
+        due = min(self._last + self.quiet, self._first + self.max_age)
+        if loop.time() < due:
+            self._handle = loop.call_later(due - loop.time(), self._check)
+            return
+        self._handle = None
+        self._first = None
+        self.callback()
+
+    def cancel(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        self._first = None
@@ -0,0 +1,88 @@
+"""Tests of ChangeWatcher keeping track of replaced backup paths"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from restictray.watcher import ChangeWatcher
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+class ReplacedPathTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    async def start_watcher(self, path: str) -> ChangeWatcher:
+        watcher = ChangeWatcher("test", [path])
+        await watcher.start()
+        self.addCleanup(watcher.stop)
+        self.assertTrue(watcher.ready)
+        watcher.reset()
+        return watcher
+
+    async def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.02)
+        self.fail("timed out")
+
+    async def assert_change_seen(self, watcher: ChangeWatcher, change):
+        watcher.reset()
+        change()
+        await self.wait_for(lambda: not watcher.unchanged())
+
+    async def test_file_replaced_by_rename(self):
+        path = os.path.join(self.directory, "file")
+        with open(path, "w") as file:
+            file.write("1")
+        watcher = await self.start_watcher(path)
+
+        def save():
+            temp = path + ".tmp"
+            with open(temp, "w") as file:
+                file.write("2")
+            os.replace(temp, path)
+
+        def append():
+            with open(path, "a") as file:
+                file.write("3")
+
+        await self.assert_change_seen(watcher, save)
+        self.assertIn(path, watcher.changed_paths)
+        await self.assert_change_seen(watcher, save)
+        await self.assert_change_seen(watcher, append)
+
+    async def test_directory_deleted_and_recreated(self):
+        path = os.path.join(self.directory, "data")
+        os.mkdir(path)
+        watcher = await self.start_watcher(path)
+
+        def recreate():
+            shutil.rmtree(path)
+            os.mkdir(path)
+
+        await self.assert_change_seen(watcher, recreate)
+        await self.wait_for(lambda: path in watcher.watches.values())
+        self.assertTrue(watcher.changed_paths_overflow)
+        self.assertFalse(watcher.failed)
+
+        def create_file():
+            with open(os.path.join(path, "new"), "w") as file:
+                file.write("1")
+
+        await self.assert_change_seen(watcher, create_file)
+        self.assertIn(os.path.join(path, "new"), watcher.changed_paths)
+        await self.assert_change_seen(watcher, lambda: os.mkdir(os.path.join(path, "sub")))
+        await self.wait_for(lambda: os.path.join(path, "sub") in watcher.watches.values())
+        await self.assert_change_seen(watcher, create_file)
+
+
+if __name__ == "__main__":
+    unittest.main()